@@ -0,0 +1,78 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+""" memory allocated by the calls succeeding on the first try.
+
+Measured with `tracemalloc`: the peak of each call above the memory in
+use before it, and what is still in use after all the calls.  The plain
+function is the baseline of the interpreter itself.
+
+Usage: python -m benchmarks.bench_allocations [calls]
+"""
+from __future__ import print_function
+
+import gc
+import sys
+import tracemalloc
+
+from retryz import retry
+
+__author__ = 'Cedric Zhuang'
+
+
+def plain():
+    return 1
+
+
+def cases():
+    return [
+        ('plain', plain),
+        ('on_error=type', retry(plain, on_error=ValueError)),
+        ('limit+wait', retry(plain, on_error=ValueError, limit=3, wait=1)),
+        ('timeout', retry(plain, on_error=ValueError, timeout=60)),
+    ]
+
+
+def measure(f, calls):
+    """ tuple of the max peak per call and the bytes retained per call. """
+    for _ in range(100):
+        f()
+    gc.disable()
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        peak = 0
+        for _ in range(calls):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            f()
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+        retained = tracemalloc.get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+        gc.enable()
+    return peak, retained / float(calls)
+
+
+def main(calls=10000):
+    print('{:<16} {:>16} {:>18}'.format(
+        'case', 'peak bytes/call', 'retained bytes/call'))
+    for name, f in cases():
+        peak, retained = measure(f, calls)
+        print('{:<16} {:>16} {:>18.1f}'.format(name, peak, retained))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
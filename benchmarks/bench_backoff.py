@@ -0,0 +1,73 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+""" simulate concurrent clients retrying against a shared backend.
+
+All clients fail at time 0 and retry with the same strategy.  The
+simulation runs in virtual time.  It reports the peak number of retries
+landing in one 100ms slot and the time by which all clients are done.
+
+Usage: python -m benchmarks.bench_backoff [clients] [retries]
+"""
+from __future__ import print_function
+
+import collections
+import random
+import sys
+import timeit
+
+from retryz import backoff
+
+__author__ = 'Cedric Zhuang'
+
+SLOT = 0.1
+
+
+def simulate(strategy, clients, retries):
+    slots = collections.Counter()
+    finish = 0
+    for _ in range(clients):
+        now = 0
+        wait = 0
+        for tried in range(1, retries + 1):
+            wait = strategy.compute(tried, wait)
+            now += wait
+            slots[int(now / SLOT)] += 1
+        finish = max(finish, now)
+    return max(slots.values()), finish
+
+
+def main(clients=1000, retries=6):
+    random.seed(0)
+    strategies = [
+        ('constant', backoff.Constant(1)),
+        ('linear', backoff.Linear(0.5, cap=10)),
+        ('exponential', backoff.Exponential(0.5, cap=10)),
+        ('full jitter', backoff.FullJitter(0.5, cap=10)),
+        ('equal jitter', backoff.EqualJitter(0.5, cap=10)),
+        ('decorrelated', backoff.DecorrelatedJitter(0.5, cap=10)),
+    ]
+    print('{:<14} {:>10} {:>10} {:>10}'.format(
+        'strategy', 'peak/slot', 'done (s)', 'ns/wait'))
+    for name, strategy in strategies:
+        peak, finish = simulate(strategy, clients, retries)
+        cost = min(timeit.repeat(lambda: strategy.compute(5, 1.0),
+                                 number=100000, repeat=3)) * 1e4
+        print('{:<14} {:>10} {:>10.1f} {:>10.0f}'.format(
+            name, peak, finish, cost))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,75 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+""" retry amplification and throughput of a shared `RetryBudget`.
+
+64 threads call functions sharing one budget.  In the healthy phase
+every call succeeds; in the outage phase every try fails.
+
+Usage: python -m benchmarks.bench_budget [threads] [calls]
+"""
+from __future__ import print_function
+
+import itertools
+import sys
+import threading
+import time
+
+from retryz import retry, RetryBudget
+
+__author__ = 'Cedric Zhuang'
+
+
+def run(threads, calls, budget, failing):
+    attempts = itertools.count()
+
+    @retry(on_error=IOError, limit=5, budget=budget)
+    def f():
+        next(attempts)
+        if failing:
+            raise IOError()
+
+    def worker():
+        for _ in range(calls):
+            try:
+                f()
+            except IOError:
+                pass
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.time()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.time() - start
+    total = threads * calls
+    return total / elapsed, next(attempts) / float(total)
+
+
+def main(threads=64, calls=2000):
+    print('{:<10} {:<8} {:>12} {:>16}'.format(
+        'budget', 'phase', 'calls/sec', 'attempts/call'))
+    for name, factory in (('none', lambda: None),
+                          ('shared', lambda: RetryBudget(ratio=0.1))):
+        budget = factory()
+        for phase, failing in (('healthy', False), ('outage', True)):
+            rate, amplification = run(threads, calls, budget, failing)
+            print('{:<10} {:<8} {:>12.0f} {:>16.2f}'.format(
+                name, phase, rate, amplification))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
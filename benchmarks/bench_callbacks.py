@@ -0,0 +1,104 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+""" compare signature based callback binding with TypeError probing.
+
+The error columns count the TypeErrors raised in 100 invocations.
+
+Usage: python -m benchmarks.bench_callbacks [retries]
+"""
+from __future__ import print_function
+
+import functools
+import sys
+import time
+
+from retryz.policy import bind, _probe
+
+__author__ = 'Cedric Zhuang'
+
+
+class Demo(object):
+    def method(self, e):
+        return True
+
+    @classmethod
+    def class_method(cls, e):
+        return True
+
+    @staticmethod
+    def static_method(e):
+        return True
+
+
+def function(e):
+    return True
+
+
+def needs_self(self, e):
+    return True
+
+
+def count_type_errors(f):
+    counter = [0]
+
+    def tracer(frame, event, arg):
+        if event == 'exception' and arg[0] is TypeError:
+            counter[0] += 1
+        return tracer
+
+    sys.settrace(tracer)
+    try:
+        f()
+    finally:
+        sys.settrace(None)
+    return counter[0]
+
+
+def main(retries=100000):
+    demo = Demo()
+    callbacks = [
+        ('function', function),
+        ('bound method', demo.method),
+        ('method needs self', needs_self),
+        ('classmethod', Demo.class_method),
+        ('staticmethod', Demo.static_method),
+        ('partial', functools.partial(needs_self, demo)),
+    ]
+    func_args = (demo,)
+    err = ValueError()
+    print('{:<18} {:>12} {:>12} {:>14} {:>14}'.format(
+        'callback', 'probe ns', 'bind ns', 'probe errors', 'bind errors'))
+    for name, callback in callbacks:
+        row = [name]
+        errors = []
+        for factory in (_probe, bind):
+            invoke = factory(callback, 1) if factory is bind \
+                else factory(callback)
+
+            def loop(n=retries):
+                for _ in range(n):
+                    invoke(func_args, err)
+
+            start = time.time()
+            loop()
+            row.append((time.time() - start) / retries * 1e9)
+            errors.append(count_type_errors(functools.partial(loop, 100)))
+        print('{:<18} {:>12.0f} {:>12.0f} {:>14} {:>14}'.format(
+            *(row + errors)))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
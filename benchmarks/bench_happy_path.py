@@ -0,0 +1,57 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+""" overhead of the `retry` wrapper when the first try succeeds.
+
+Usage: python -m benchmarks.bench_happy_path [calls]
+"""
+from __future__ import print_function
+
+import sys
+import timeit
+
+from retryz import retry
+
+__author__ = 'Cedric Zhuang'
+
+
+def plain():
+    return 1
+
+
+def is_retryable(e):
+    return isinstance(e, ValueError)
+
+
+def main(calls=100000):
+    cases = [
+        ('plain function', plain),
+        ('on_error=type', retry(on_error=ValueError)(plain)),
+        ('on_error=callback', retry(on_error=is_retryable)(plain)),
+        ('on_return=value', retry(on_return=0, limit=3)(plain)),
+        ('on_return=callback',
+         retry(on_return=lambda x: x < 1, limit=lambda: 3, wait=0.1)(plain)),
+    ]
+    base = None
+    for name, f in cases:
+        cost = min(timeit.repeat(f, number=calls, repeat=5)) / calls * 1e9
+        if base is None:
+            base = cost
+        print('{:<20} {:>8.0f} ns/call  overhead: {:>8.0f} ns'.format(
+            name, cost, cost - base))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,73 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+""" tail latency with and without hedged tries.
+
+The function takes 1ms in 95% of the calls and 100ms in the others.
+
+Usage: python -m benchmarks.bench_hedge [calls]
+"""
+from __future__ import print_function
+
+import random
+import sys
+import time
+
+from retryz import retry, Hedge
+from retryz.pool import AttemptPool
+from retryz.timer import monotonic
+
+__author__ = 'Cedric Zhuang'
+
+
+def long_tail():
+    if random.random() < 0.05:
+        time.sleep(0.1)
+    else:
+        time.sleep(0.001)
+
+
+def percentile(values, q):
+    return values[min(int(len(values) * q / 100.0), len(values) - 1)]
+
+
+def run(calls, f):
+    latencies = []
+    for _ in range(calls):
+        start = monotonic()
+        f()
+        latencies.append(monotonic() - start)
+    latencies.sort()
+    return latencies
+
+
+def main(calls=500):
+    pool = AttemptPool()
+    print('{:<10} {:>10} {:>10} {:>10}'.format(
+        'mode', 'p50 (ms)', 'p99 (ms)', 'max (ms)'))
+    for name, hedge in (('plain', None),
+                        ('hedged', Hedge(delay=0.005)),
+                        ('p90', Hedge(percentile=90))):
+        f = retry(long_tail, on_error=IOError, limit=3, pool=pool,
+                  hedge=hedge)
+        latencies = run(calls, f)
+        print('{:<10} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+            name, percentile(latencies, 50) * 1000,
+            percentile(latencies, 99) * 1000, latencies[-1] * 1000))
+    pool.shutdown()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,55 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+""" overhead of the listener with and without instrumentation.
+
+Usage: python -m benchmarks.bench_metrics [calls]
+"""
+from __future__ import print_function
+
+import sys
+import timeit
+
+from retryz import retry, RetryListener, RetryMetrics
+
+__author__ = 'Cedric Zhuang'
+
+
+def main(calls=100000):
+    def succeed():
+        return 1
+
+    def fail_twice():
+        fail_twice.calls += 1
+        if fail_twice.calls % 3:
+            raise ValueError()
+
+    fail_twice.calls = 0
+    listeners = [('disabled', None),
+                 ('no-op listener', RetryListener()),
+                 ('RetryMetrics', RetryMetrics())]
+    print('{:<16} {:>14} {:>18}'.format(
+        'listener', 'first try ns', '3 attempts ns'))
+    for name, listener in listeners:
+        row = [name]
+        for f in (succeed, fail_twice):
+            wrapped = retry(f, on_error=ValueError, listener=listener)
+            row.append(min(timeit.repeat(wrapped, number=calls, repeat=3)) /
+                       calls * 1e9)
+        print('{:<16} {:>14.0f} {:>18.0f}'.format(*row))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
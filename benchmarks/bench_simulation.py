@@ -0,0 +1,73 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+""" capacity planning in virtual time.
+
+Simulates calls to a backend failing 30% of the time with 50ms latency,
+retried with exponential backoff under a 2 second timeout.  Nothing
+really sleeps, so the waits cost no wall clock time.
+
+Usage: python -m benchmarks.bench_simulation [calls]
+"""
+from __future__ import print_function
+
+import random
+import sys
+import time
+
+from retryz import retry, backoff, RetryTimeoutError
+from retryz.clock import VirtualClock
+
+__author__ = 'Cedric Zhuang'
+
+
+def main(calls=100000, failure_rate=0.3, latency=0.05):
+    clock = VirtualClock()
+    attempts = [0]
+    rand = random.Random(0)
+
+    @retry(on_error=IOError, limit=6, timeout=2, clock=clock,
+           wait=backoff.FullJitter(0.1, cap=1, rand=rand.random))
+    def call():
+        attempts[0] += 1
+        clock.advance(latency)
+        if rand.random() < failure_rate:
+            raise IOError()
+
+    durations = []
+    failed = 0
+    start = time.time()
+    for _ in range(calls):
+        begin = clock.now()
+        try:
+            call()
+        except (IOError, RetryTimeoutError):
+            failed += 1
+        durations.append(clock.now() - begin)
+    elapsed = time.time() - start
+    durations.sort()
+    print('calls:              {}'.format(calls))
+    print('attempts per call:  {:.3f}'.format(attempts[0] / float(calls)))
+    print('failed calls:       {:.4%}'.format(failed / float(calls)))
+    print('simulated p50 (ms): {:.1f}'.format(
+        durations[calls // 2] * 1000))
+    print('simulated p99 (ms): {:.1f}'.format(
+        durations[int(calls * 0.99)] * 1000))
+    print('simulated time (s): {:.0f}'.format(clock.now()))
+    print('wall clock (s):     {:.2f}'.format(elapsed))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
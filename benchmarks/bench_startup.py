@@ -0,0 +1,101 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+""" cost of `import retryz` and of decorating many functions.
+
+The import is timed in a fresh interpreter (best of `repeat` runs).  The
+decoration is timed without tracing, then done again under `tracemalloc`
+to get the memory retained per decorated function.
+
+Usage: python -m benchmarks.bench_startup [functions] [repeat]
+"""
+from __future__ import print_function
+
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from retryz import retry
+
+__author__ = 'Cedric Zhuang'
+
+IMPORT_SCRIPT = ('import time; start = time.perf_counter(); import retryz; '
+                 'print(time.perf_counter() - start)')
+
+
+def is_io_error(e):
+    return isinstance(e, IOError)
+
+
+OPTIONS = (
+    ('bare', {}),
+    ('on_error=type', {'on_error': IOError, 'limit': 3}),
+    ('on_error=callback', {'on_error': is_io_error, 'limit': 3}),
+    ('wait+timeout', {'on_error': IOError, 'limit': 3, 'wait': 0.1,
+                      'timeout': 5}),
+)
+
+
+def import_seconds(repeat):
+    best = None
+    for _ in range(repeat):
+        out = subprocess.check_output([sys.executable, '-c', IMPORT_SCRIPT])
+        elapsed = float(out)
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def make_functions(count):
+    def make(i):
+        def f(x):
+            return x + i
+
+        return f
+
+    return [make(i) for i in range(count)]
+
+
+def decorate(functions, options):
+    return [retry(**options)(f) for f in functions]
+
+
+def main(functions=10000, repeat=5):
+    print('import retryz: {:.1f} ms'.format(import_seconds(repeat) * 1e3))
+    print('\n{:<20} {:>14} {:>14}'.format(
+        'options', 'us/decoration', 'bytes/function'))
+    for name, options in OPTIONS:
+        best = None
+        for _ in range(repeat):
+            targets = make_functions(functions)
+            start = time.perf_counter()
+            decorate(targets, options)
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+
+        targets = make_functions(functions)
+        tracemalloc.start()
+        wrapped = decorate(targets, options)
+        retained, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del wrapped
+        print('{:<20} {:>14.1f} {:>14.0f}'.format(
+            name, best / functions * 1e6, retained / float(functions)))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,84 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+""" compare the deadline check of `retry` with a thread per call.
+
+Usage: python -m benchmarks.bench_timeout [calls]
+"""
+from __future__ import print_function
+
+import sys
+import threading
+import time
+
+from retryz import retry
+
+__author__ = 'Cedric Zhuang'
+
+
+def thread_per_call(timeout):
+    """ the `background()` timeout path of the first versions. """
+
+    def decorator(function):
+        def func_wrapper(*args, **kwargs):
+            main_event = threading.Event()
+            holder = {}
+
+            def on_timeout():
+                holder['bg'] = threading.Event()
+                holder['bg'].wait(timeout)
+                main_event.set()
+
+            t = threading.Thread(target=on_timeout)
+            t.daemon = True
+            t.start()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                if 'bg' in holder:
+                    holder['bg'].set()
+
+        return func_wrapper
+
+    return decorator
+
+
+def run(name, f, calls):
+    base = threading.active_count()
+    peak = base
+    start = time.time()
+    for _ in range(calls):
+        f()
+        peak = max(peak, threading.active_count())
+    elapsed = time.time() - start
+    print('{:<16} {:>12.0f} calls/sec  peak threads: {:>6}'.format(
+        name, calls / elapsed, peak - base))
+
+
+def main(calls=10000):
+    @thread_per_call(timeout=60)
+    def legacy():
+        pass
+
+    @retry(on_error=ValueError, timeout=60)
+    def deadline():
+        pass
+
+    run('thread per call', legacy, calls)
+    run('deadline check', deadline, calls)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
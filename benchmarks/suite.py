@@ -0,0 +1,223 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+""" overhead and scaling of `retry`, stored as JSON to track regressions.
+
+Every case is timed with no sleep: waits are 0 and timeouts are never
+reached.  The result of a case is the best of `repeat` runs in ns per
+call of the wrapped function.
+
+Usage::
+
+    python -m benchmarks.suite -o before.json
+    # change the code
+    python -m benchmarks.suite -o after.json --compare before.json
+
+With `--compare`, cases slower than the baseline by more than
+`--threshold` are reported and the exit code is 1.
+"""
+from __future__ import print_function
+
+import argparse
+import functools
+import json
+import platform
+import sys
+import threading
+import time
+import timeit
+
+import retryz
+from retryz import retry
+
+__author__ = 'Cedric Zhuang'
+
+RETRIES = 10
+THREADS = 8
+
+
+def plain():
+    return 1
+
+
+def always_false():
+    return False
+
+
+def is_false(r):
+    return r is False
+
+
+def needs_self(self, r):
+    return r is False
+
+
+class Demo(object):
+    def method(self, r):
+        return r is False
+
+    @classmethod
+    def class_method(cls, r):
+        return r is False
+
+    @staticmethod
+    def static_method(r):
+        return r is False
+
+
+def _retry_loop(callback):
+    """ `RETRIES` tries, the callback is invoked on each of them. """
+    return retry(always_false, on_return=callback, limit=RETRIES)
+
+
+class Contention(object):
+    """ `THREADS` threads calling the same wrapped function. """
+
+    def __init__(self, f):
+        self.f = f
+
+    def __call__(self, number):
+        per_thread = max(number // THREADS, 1)
+        f = self.f
+
+        def worker():
+            for _ in range(per_thread):
+                f()
+
+        workers = [threading.Thread(target=worker) for _ in range(THREADS)]
+        start = time.time()
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        return time.time() - start, per_thread * THREADS
+
+
+def cases():
+    """ name -> (callable, invocations per call). """
+    demo = Demo()
+    happy = retry(plain, on_error=ValueError)
+    return [
+        ('happy/plain', plain, 1),
+        ('happy/on_error=type', happy, 1),
+        ('happy/on_error=callback',
+         retry(plain, on_error=lambda e: isinstance(e, ValueError)), 1),
+        ('happy/on_return=callback',
+         retry(plain, on_return=lambda x: x < 1, limit=3), 1),
+        ('happy/timeout', retry(plain, on_error=ValueError, timeout=60), 1),
+        ('loop/{}_tries'.format(RETRIES),
+         retry(always_false, on_return=False, limit=RETRIES), RETRIES),
+        ('loop/{}_tries_timeout'.format(RETRIES),
+         retry(always_false, on_return=False, limit=RETRIES, timeout=60),
+         RETRIES),
+        ('callback/function', _retry_loop(is_false), RETRIES),
+        ('callback/bound_method', _retry_loop(demo.method), RETRIES),
+        ('callback/classmethod', _retry_loop(Demo.class_method), RETRIES),
+        ('callback/staticmethod', _retry_loop(Demo.static_method), RETRIES),
+        ('callback/partial',
+         _retry_loop(functools.partial(needs_self, demo)), RETRIES),
+        ('threads/happy', Contention(happy), 1),
+        ('threads/timeout',
+         Contention(retry(plain, on_error=ValueError, timeout=60)), 1),
+    ]
+
+
+def measure(f, number, repeat):
+    """ best ns per call of `f`. """
+    if isinstance(f, Contention):
+        best = None
+        for _ in range(repeat):
+            elapsed, calls = f(number)
+            cost = elapsed / calls
+            if best is None or cost < best:
+                best = cost
+    else:
+        best = min(timeit.repeat(f, number=number, repeat=repeat)) / number
+    return best * 1e9
+
+
+def run(number, repeat, selected=None):
+    results = {}
+    for name, f, tries in cases():
+        if selected and not any(s in name for s in selected):
+            continue
+        ns = measure(f, number, repeat)
+        results[name] = {'ns_per_call': ns,
+                         'ns_per_try': ns / tries,
+                         'number': number,
+                         'repeat': repeat}
+        print('{:<28} {:>10.0f} ns/call {:>10.0f} ns/try'.format(
+            name, ns, ns / tries))
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'retryz': getattr(retryz, '__version__', None),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold):
+    """ print the changes and return the names of the regressed cases. """
+    regressed = []
+    print('\n{:<28} {:>10} {:>10} {:>8}'.format(
+        'case', 'baseline', 'current', 'change'))
+    for name, result in sorted(current['results'].items()):
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        change = result['ns_per_call'] / base['ns_per_call'] - 1
+        flag = ''
+        if change > threshold:
+            regressed.append(name)
+            flag = ' REGRESSED'
+        print('{:<28} {:>10.0f} {:>10.0f} {:>+7.0%}{}'.format(
+            name, base['ns_per_call'], result['ns_per_call'], change, flag))
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-n', '--number', type=int, default=20000,
+                        help='calls per run.')
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help='runs per case, the best one is kept.')
+    parser.add_argument('-o', '--output', help='write the results to the '
+                                               'JSON file.')
+    parser.add_argument('--compare', help='baseline JSON file.')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed slow down against the baseline.')
+    parser.add_argument('cases', nargs='*',
+                        help='only run the cases containing these names.')
+    args = parser.parse_args(argv)
+
+    current = run(args.number, args.repeat, args.cases)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+    ret = 0
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(current, baseline, args.threshold):
+            ret = 1
+    return ret
+
+
+if __name__ == '__main__':
+    sys.exit(main())
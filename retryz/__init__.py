@@ -14,149 +14,119 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 import functools
-import inspect
-import numbers
-import threading
-from threading import Thread
+import time
+import types
+
+from retryz import deadline as _deadline
+from retryz import state as _state
+from retryz.timer import monotonic
+from retryz.breaker import CircuitBreaker, CircuitOpenError
+from retryz.budget import RetryBudget
+from retryz.cache import ResultCache
+from retryz.deadline import Deadline
+from retryz.hedge import Hedge
+from retryz.metrics import RetryListener, RetryMetrics, RetryStats
+from retryz.metrics import CALLS, ATTEMPTS, RETRIES, GIVE_UPS, TIMEOUTS, \
+    FAILURES, WAIT_SECONDS
+from retryz.policy import RetryPolicy
+from retryz.state import RetryState
 
 __author__ = 'Cedric Zhuang'
 
+__all__ = ['retry', 'RetryTimeoutError', 'RetryPolicy',
+           'CircuitBreaker', 'CircuitOpenError', 'RetryBudget',
+           'RetryListener', 'RetryMetrics', 'Deadline', 'Hedge',
+           'retry_batch', 'ResultCache', 'RetryState', 'RetryStats',
+           'KeyBusyError']
+
 
 class RetryTimeoutError(Exception):
     pass
 
 
-def retry(func=None, on_error=None, on_return=None,
-          limit=None, wait=None, timeout=None, on_retry=None):
-    class EventHolder(object):
-        def __init__(self):
-            self.main_event = threading.Event()
-            self.bg_event = None
-
-        def wait_main(self, seconds):
-            self.main_event.wait(seconds)
+class KeyBusyError(Exception):
+    """ too many calls of the key in flight, see `retry(max_in_flight=...)`.
+    """
+    pass
 
-        def set_main_event(self):
-            self.main_event.set()
 
-        def set_bg_event(self):
-            if self.bg_event is not None:
-                self.bg_event.set()
+# flag of `async def` functions, checked without importing `inspect`
+_CO_COROUTINE = 0x80
 
-        def is_main_set(self):
-            return self.main_event.is_set()
 
-        def end_timeout_check_thread(self):
-            self.set_bg_event()
+def _is_coroutine_function(f):
+    while isinstance(f, functools.partial):
+        f = f.func
+    f = getattr(f, '__func__', f)
+    return (isinstance(f, types.FunctionType) and
+            bool(f.__code__.co_flags & _CO_COROUTINE))
 
-        def check_timeout(self):
-            if self.is_main_set():
-                raise RetryTimeoutError('retry timeout.')
 
-    def is_function(f):
-        return (inspect.ismethod(f) or
-                inspect.isfunction(f) or
-                isinstance(f, (classmethod, staticmethod, functools.partial)))
+class TimeoutCheck(object):
+    """ the timeout of one call.
 
-    def background(func_ref, *args, **kwargs):
-        t = Thread(target=func_ref, args=args, kwargs=kwargs)
-        t.setDaemon(True)
-        t.start()
-        return t
+    The deadline is compared with the time when checked and the waits end
+    at the deadline, so no event or timer thread is needed.
+    """
+    __slots__ = ('now', 'sleep', 'deadline', 'expired')
 
-    def call(f, func_args, *args):
-        try:
-            ret = f(*args)
-        except TypeError:
-            inst = get_inst(func_args)
-            ret = f(inst, *args)
-        return ret
+    def __init__(self, now=monotonic, sleep=time.sleep):
+        self.now = now
+        self.sleep = sleep
+        self.deadline = None
+        self.expired = False
 
-    def get_inst(args):
-        if len(args) > 0:
-            inst = args[0]
+    def wait(self, seconds):
+        """ sleep until the deadline at most, return the seconds slept. """
+        if self.deadline is not None:
+            seconds = min(seconds, self.deadline - self.now())
+        if seconds > 0:
+            self.sleep(seconds)
         else:
-            inst = None
-        return inst
+            seconds = 0
+        return seconds
 
-    def check_return(args, r):
-        ret = None
-        if on_return is not None:
-            if is_function(on_return):
-                ret = call(on_return, args, r)
-            else:
-                ret = r == on_return
-
-        if ret is None:
-            ret = not has_error_option()
-        return ret
+    def expire(self):
+        self.expired = True
 
-    def has_error_option():
-        return on_error is not None
+    def is_expired(self):
+        if (not self.expired and self.deadline is not None and
+                self.now() >= self.deadline):
+            self.expired = True
+        return self.expired
 
-    def check_error(args, err):
-        if on_error is not None:
-            if is_function(on_error):
-                ret = call(on_error, args, err)
-            else:
-                ret = isinstance(err, on_error)
-        else:
-            ret = False
+    def start(self, seconds):
+        if seconds is not None:
+            self.deadline = self.now() + seconds
 
-        return ret
+    def check_timeout(self):
+        if self.is_expired():
+            raise RetryTimeoutError('retry timeout.')
 
-    def get_limit(args):
-        ret = None
-        if limit is None:
-            ret = float("inf")
-        elif isinstance(limit, numbers.Number):
-            ret = limit
-        elif is_function(limit):
-            ret = call(limit, args)
-
-        if ret is None:
-            raise ValueError('limit should be a number of'
-                             'a callback with no parameter.')
-        return ret
 
-    def get_timeout(args):
-        ret = None
-        if timeout is not None:
-            if isinstance(timeout, numbers.Number):
-                ret = timeout
-            elif is_function(timeout):
-                ret = call(timeout, args)
+class ClockTimeoutCheck(TimeoutCheck):
+    """ the `TimeoutCheck` of `retry(clock=...)`. """
+    __slots__ = ('clock',)
 
-        return ret
+    def __init__(self, clock):
+        super(ClockTimeoutCheck, self).__init__(clock.now, clock.sleep)
+        self.clock = clock
 
-    def get_wait(args, retry_count):
-        ret = None
-        if wait is None or retry_count == 0:
-            ret = 0
-        elif isinstance(wait, numbers.Number):
-            ret = wait
-        elif is_function(wait):
-            ret = call(wait, args, retry_count)
-
-        if ret is None:
-            raise ValueError('wait should be a number or '
-                             'a callback of try count.')
-        return ret
 
-    def on_timeout(evt_holder, args):
-        evt_holder.bg_event = threading.Event()
-        evt_holder.bg_event.wait(get_timeout(args))
-        evt_holder.set_main_event()
+def _time_source(clock):
+    """ the time function and the timeout check factory of the clock. """
+    if clock is None:
+        ret = monotonic, TimeoutCheck
+    else:
+        ret = clock.now, functools.partial(ClockTimeoutCheck, clock)
+    return ret
 
-    def call_retry_callback(args, retry_count):
-        if on_retry is None or retry_count == 0:
-            pass
-        elif is_function(on_retry):
-            call(on_retry, args)
-        else:
-            raise ValueError('on_retry should be a function accept two params:'
-                             ' value, retry_count.')
 
+def retry(func=None, on_error=None, on_return=None,
+          limit=None, wait=None, timeout=None, on_retry=None,
+          circuit_breaker=None, budget=None, listener=None, pool=None,
+          hedge=None, clock=None, cache=None, resume=None, key=None,
+          max_keys=1024, max_in_flight=None):
     if func is not None:
         return retry(None,
                      on_error=on_error,
@@ -164,44 +134,279 @@ def retry(func=None, on_error=None, on_return=None,
                      limit=limit,
                      wait=wait,
                      timeout=timeout,
-                     on_retry=on_retry)(func)
+                     on_retry=on_retry,
+                     circuit_breaker=circuit_breaker,
+                     budget=budget,
+                     listener=listener,
+                     pool=pool,
+                     hedge=hedge,
+                     clock=clock,
+                     cache=cache,
+                     resume=resume,
+                     key=key,
+                     max_keys=max_keys,
+                     max_in_flight=max_in_flight)(func)
+
+    policy = RetryPolicy(on_error=on_error,
+                         on_return=on_return,
+                         limit=limit,
+                         wait=wait,
+                         timeout=timeout,
+                         on_retry=on_retry,
+                         circuit_breaker=circuit_breaker,
+                         budget=budget,
+                         listener=listener,
+                         pool=pool,
+                         hedge=hedge,
+                         clock=clock,
+                         cache=cache,
+                         resume=resume,
+                         key=key,
+                         max_keys=max_keys,
+                         max_in_flight=max_in_flight)
 
     def decorator(function):
-        @functools.wraps(function)
-        def func_wrapper(*args, **kwargs):
-            # the event to break sleep when timeout
-            event_holder = EventHolder()
+        return wrap(function, policy)
 
+    return decorator
+
+
+def wrap(function, policy, stats=None):
+    """ wrap the function with the retry loop of the `RetryPolicy`.
+
+    `retry` builds the policy from its options and calls this.  The
+    policy is kept as the `retry_policy` attribute of the wrapper and
+    the `RetryStats` as its `retry_stats` attribute.
+
+    :param stats: the `RetryStats` to update.  A new one by default.
+    """
+    if stats is None:
+        stats = RetryStats()
+    if policy.key is not None:
+        from retryz import keyed
+        return keyed.wrap(function, policy, stats)
+    if _is_coroutine_function(function):
+        from retryz import aio
+        return aio.wrap(function, policy, stats)
+    if policy.resume is not None:
+        from retryz import stream
+        return stream.wrap(function, policy, stats)
+
+    get_limit = policy.get_limit
+    get_timeout = policy.get_timeout
+    get_wait = policy.get_wait
+    check_return = policy.check_return
+    check_error = policy.check_error
+    call_retry_callback = policy.call_retry_callback
+    breaker = policy.circuit_breaker
+    budget = policy.budget
+    listener = policy.listener
+    record_outcome = policy.record_outcome
+    pool = policy.pool
+    hedge = policy.hedge
+    cache = policy.cache
+    use_state = policy.use_state
+    now, new_check = _time_source(policy.clock)
+    # the calls without deadline share one check, it never expires
+    no_deadline = new_check()
+    stats_shard = stats.shard
+
+    @functools.wraps(function)
+    def func_wrapper(*args, **kwargs):
+        timeout_check = no_deadline
+        need_retry = True
+        tried = 0
+        ret = None
+        to_wait = 0
+        waited = 0
+        outcome = None
+        token = None
+        trial = False
+        if listener is not None:
+            start = now()
+        if use_state:
+            state = RetryState(function, args, kwargs, now=now)
+            state_token = _state.enter(state)
+        else:
+            state = None
+        try:
             max_try = get_limit(args)
-            if timeout is not None:
-                background(on_timeout, event_holder, args)
-            need_retry = True
-            tried = 0
-            ret = None
+            deadline, token = _deadline.enter(get_timeout(args), now)
+            if state is not None:
+                state.deadline = deadline
+            if deadline is not None:
+                timeout_check = new_check()
+                timeout_check.start(deadline - now())
             while need_retry:
-                event_holder.check_timeout()
-                to_wait = get_wait(args, tried)
+                timeout_check.check_timeout()
+                if breaker is not None and breaker.is_open():
+                    raise CircuitOpenError('circuit breaker is open.')
+                to_wait = get_wait(args, tried, to_wait, outcome)
+                if state is not None:
+                    state.wait = to_wait
+                if listener is not None and tried > 0:
+                    listener.retry_scheduled(function, tried, to_wait)
                 if to_wait > 0:
-                    if not event_holder.is_main_set():
-                        event_holder.wait_main(to_wait)
-                    event_holder.check_timeout()
+                    waited += timeout_check.wait(to_wait)
+                    timeout_check.check_timeout()
 
                 call_retry_callback(args, tried)
+                if breaker is not None:
+                    breaker.before_call()
+                    trial = True
+                tried += 1
+                if state is not None:
+                    state.attempt = tried
+                if listener is not None:
+                    listener.attempt_start(function, tried)
+                    started = now()
+                checked = None
+                if hedge is not None:
+                    future, launched, checked = hedge.run(
+                        pool, function, args, kwargs, deadline,
+                        max_try - tried + 1, check_return)
+                    tried += launched - 1
+                    if state is not None:
+                        state.attempt = tried
+                    if future is None:
+                        timeout_check.expire()
+                        timeout_check.check_timeout()
+                elif pool is not None:
+                    future = pool.submit(function, args, kwargs)
+                    if not pool.wait(future, deadline, function):
+                        timeout_check.expire()
+                        timeout_check.check_timeout()
                 try:
-                    tried += 1
-                    ret = function(*args, **kwargs)
-                    need_retry = check_return(args, ret)
-                    if tried >= max_try:
+                    if pool is None:
+                        ret = function(*args, **kwargs)
+                    else:
+                        ret = future.result()
+                    if checked is None:
+                        need_retry = check_return(args, ret)
+                    else:
+                        need_retry = checked
+                    if listener is not None:
+                        listener.attempt_end(function, tried,
+                                             now() - started,
+                                             None, ret)
+                    if breaker is not None:
+                        trial = False
+                        breaker.record(need_retry)
+                    if budget is not None:
+                        budget.record(need_retry)
+                    if record_outcome is not None:
+                        record_outcome(need_retry)
+                    outcome = ret
+                    if state is not None:
+                        state.last_result = ret
+                    if need_retry and (tried >= max_try or
+                                       budget is not None and
+                                       not budget.withdraw()):
                         need_retry = False
+                        stats_shard()[GIVE_UPS] += 1
+                        if listener is not None:
+                            listener.give_up(function, tried, None, ret)
                 # noinspection PyBroadException
                 except Exception as e:
+                    if listener is not None:
+                        listener.attempt_end(function, tried,
+                                             now() - started,
+                                             e, None)
                     need_retry = check_error(args, e)
-                    if tried >= max_try or not need_retry:
-                        event_holder.end_timeout_check_thread()
+                    if breaker is not None:
+                        trial = False
+                        breaker.record(need_retry)
+                    if budget is not None:
+                        budget.record(need_retry)
+                    if record_outcome is not None:
+                        record_outcome(need_retry)
+                    outcome = e
+                    if state is not None:
+                        state.last_error = e
+                    if not need_retry:
                         raise
-            event_holder.end_timeout_check_thread()
-            return ret
+                    if tried >= max_try or (budget is not None and
+                                            not budget.withdraw()):
+                        stats_shard()[GIVE_UPS] += 1
+                        if listener is not None:
+                            listener.give_up(function, tried, e, None)
+                        raise
+        except RetryTimeoutError:
+            if trial:
+                # the try was too slow
+                trial = False
+                breaker.on_failure()
+            shard = stats_shard()
+            shard[FAILURES] += 1
+            if timeout_check.is_expired():
+                shard[TIMEOUTS] += 1
+                if listener is not None:
+                    listener.timeout(function, tried, now() - start)
+            raise
+        except Exception:
+            stats_shard()[FAILURES] += 1
+            raise
+        finally:
+            if trial:
+                # ended by a cancellation or a BaseException
+                breaker.release()
+            _deadline.leave(token)
+            if state is not None:
+                _state.leave(state_token)
+            shard = stats_shard()
+            shard[CALLS] += 1
+            shard[ATTEMPTS] += tried
+            if tried > 1:
+                shard[RETRIES] += tried - 1
+            if waited:
+                shard[WAIT_SECONDS] += waited
+        return ret
 
-        return func_wrapper
+    if cache is not None:
+        func_wrapper = cache.wrap(function, func_wrapper,
+                                  lambda a, r: not check_return(a, r))
+    # functools.wraps does not set it on python 2
+    func_wrapper.__wrapped__ = function
+    func_wrapper.retry_policy = policy
+    func_wrapper.retry_stats = stats
+    return func_wrapper
+
+
+def retry_batch(func=None, on_error=None, on_return=None,
+                limit=None, wait=None, timeout=None, on_retry=None,
+                clock=None):
+    """ retry only the failed items of a bulk operation.
+
+    The batch is the last positional argument of the decorated function,
+    which returns one result per item in the same order.  After each
+    try, only the failed items are sent again and their new results are
+    merged back in place.  An item failed if its result is an exception
+    (filtered by `on_error` if specified) or if `on_return` accepts it.
+    An error raised by the function retries the whole remaining batch
+    if `on_error` accepts it.
+
+    When `limit` is reached, the failed items keep their last result.
+    """
+    if func is not None:
+        return retry_batch(None,
+                           on_error=on_error,
+                           on_return=on_return,
+                           limit=limit,
+                           wait=wait,
+                           timeout=timeout,
+                           on_retry=on_retry,
+                           clock=clock)(func)
+
+    policy = RetryPolicy(on_error=on_error,
+                         on_return=on_return,
+                         limit=limit,
+                         wait=wait,
+                         timeout=timeout,
+                         on_retry=on_retry,
+                         clock=clock)
+
+    def decorator(function):
+        from retryz import batch
+        return batch.wrap(function, policy, RetryStats())
 
     return decorator
@@ -0,0 +1,167 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+""" wait strategy adapting to the recent outcomes and to server hints.
+
+.. code-block:: python
+
+    @retry(on_error=IOError, limit=5, wait=Adaptive(Exponential(0.1)))
+    def fetch():
+        ...
+
+Unlike the strategies in `retryz.backoff`, `Adaptive` keeps state: the
+outcomes of the recent tries of the function it is attached to.
+"""
+import array
+import calendar
+import itertools
+import numbers
+import time
+from email.utils import parsedate_tz, mktime_tz
+
+from retryz.backoff import Backoff, Exponential
+
+__author__ = 'Cedric Zhuang'
+
+
+def _parse_retry_after(value):
+    """ seconds from a `Retry-After` value: seconds or an HTTP date. """
+    if isinstance(value, numbers.Number):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        parsed = parsedate_tz(value)
+    except TypeError:
+        parsed = None
+    if parsed is None:
+        return None
+    return mktime_tz(parsed) - calendar.timegm(time.gmtime())
+
+
+def retry_after(outcome):
+    """ seconds the outcome asks to wait, `None` if it gives no hint.
+
+    Looks for a `retry_after` attribute, then for a `Retry-After` header
+    in `outcome.headers` or `outcome.response.headers` (as in the errors
+    of `requests`).
+    """
+    value = getattr(outcome, 'retry_after', None)
+    if value is None:
+        headers = getattr(outcome, 'headers', None)
+        if headers is None:
+            headers = getattr(getattr(outcome, 'response', None),
+                              'headers', None)
+        if headers is not None:
+            try:
+                value = headers.get('Retry-After')
+            except AttributeError:
+                value = None
+    if value is None:
+        return None
+    seconds = _parse_retry_after(value)
+    if seconds is not None:
+        seconds = max(seconds, 0)
+    return seconds
+
+
+class Adaptive(Backoff):
+    """ stretch or shrink the waits of `base` by the recent failure rate.
+
+    The outcomes of the last `window` tries are kept in a ring buffer of
+    bytes.  The failure rate is their exponentially weighted mean, the
+    newest weighing most.  The wait of `base` is multiplied by a scale
+    going from `shrink` (no failure) to `stretch` (all failed).
+
+    If `hint` returns a number for the error or the return value of the
+    last try, that wait is used instead.
+
+    :param base: the wait strategy to scale.
+    :param window: number of recent tries considered.
+    :param decay: weight ratio between two consecutive tries (0~1).
+    :param hint: `hint(outcome)` returns the seconds to wait or `None`.
+    """
+    __slots__ = ('base', 'window', 'decay', 'shrink', 'stretch', 'hint',
+                 '_outcomes', '_counter', '_last')
+    use_outcome = True
+
+    def __init__(self, base=None, window=64, decay=0.9, shrink=0.5,
+                 stretch=4, hint=retry_after, cap=None):
+        super(Adaptive, self).__init__(cap)
+        if window < 1:
+            raise ValueError('window should be at least 1.')
+        if not 0 < decay <= 1:
+            raise ValueError('decay should be in (0, 1].')
+        if base is None:
+            base = Exponential(0.1)
+        self.base = base
+        self.window = window
+        self.decay = decay
+        self.shrink = shrink
+        self.stretch = stretch
+        self.hint = hint
+        self._outcomes = array.array('b', [0] * window)
+        self._counter = itertools.count()
+        # index of the newest outcome, -1 if none
+        self._last = -1
+
+    def __reduce__(self):
+        # a copy in another process starts with no outcome recorded
+        return Adaptive, (self.base, self.window, self.decay, self.shrink,
+                          self.stretch, self.hint, self.cap)
+
+    def record(self, failed):
+        """ record the outcome of a try, called by the retry loop. """
+        i = next(self._counter)
+        self._outcomes[i % self.window] = 1 if failed else 0
+        self._last = i
+
+    def failure_rate(self):
+        """ weighted failure rate of the recent tries, `None` if none. """
+        last = self._last
+        if last < 0:
+            return None
+        count = min(last + 1, self.window)
+        outcomes = self._outcomes
+        weight = 1.0
+        failed = 0.0
+        total = 0.0
+        for k in range(count):
+            failed += weight * outcomes[(last - k) % self.window]
+            total += weight
+            weight *= self.decay
+        return failed / total
+
+    def scale(self):
+        rate = self.failure_rate()
+        if rate is None:
+            ret = 1
+        else:
+            ret = self.shrink + (self.stretch - self.shrink) * rate
+        return ret
+
+    def compute(self, tried, previous, outcome=None):
+        seconds = None
+        if outcome is not None and self.hint is not None:
+            seconds = self.hint(outcome)
+        if seconds is None:
+            if self.base.use_outcome:
+                seconds = self.base.compute(tried, previous, outcome)
+            else:
+                seconds = self.base.compute(tried, previous)
+            seconds *= self.scale()
+        return min(seconds, self.cap)
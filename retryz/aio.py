@@ -0,0 +1,459 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+""" asyncio support of the `retry` decorator.
+
+This module is only imported when `retry` decorates a coroutine function.
+"""
+import asyncio
+import functools
+import inspect
+
+from retryz import RetryTimeoutError, CircuitOpenError, ClockTimeoutCheck
+from retryz import deadline as _deadline
+from retryz import state as _state
+from retryz.metrics import CALLS, ATTEMPTS, RETRIES, GIVE_UPS, TIMEOUTS, \
+    FAILURES, WAIT_SECONDS
+from retryz.state import RetryState
+from retryz.timer import monotonic
+
+__author__ = 'Cedric Zhuang'
+
+get_running_loop = getattr(asyncio, 'get_running_loop',
+                           asyncio.get_event_loop)
+
+
+async def resolve(value):
+    """ await the value if a callback returns an awaitable. """
+    if inspect.isawaitable(value):
+        value = await value
+    return value
+
+
+class AsyncTimeoutCheck(object):
+    """ the asyncio counterpart of the `TimeoutCheck`.
+
+    The timeout is a loop timer instead of a thread.  When it fires, the
+    pending sleep (if any) is cancelled so that the wrapper could raise
+    `RetryTimeoutError` right away.
+    """
+
+    def __init__(self):
+        self.expired = False
+        self.deadline = None
+        self.timer = None
+        self.sleep = None
+
+    def start(self, seconds):
+        if seconds is None:
+            pass
+        elif seconds <= 0:
+            self.expire()
+        else:
+            self.deadline = monotonic() + seconds
+            loop = get_running_loop()
+            self.timer = loop.call_later(seconds, self.expire)
+
+    def cancel(self):
+        if self.timer is not None:
+            self.timer.cancel()
+
+    def expire(self):
+        self.expired = True
+        if self.sleep is not None:
+            self.sleep.cancel()
+
+    async def wait(self, seconds):
+        """ sleep until the deadline at most, return the seconds slept. """
+        if self.deadline is not None:
+            seconds = min(seconds, self.deadline - monotonic())
+        if seconds <= 0:
+            return 0
+        self.sleep = asyncio.ensure_future(asyncio.sleep(seconds))
+        try:
+            await self.sleep
+        except asyncio.CancelledError:
+            if not self.expired:
+                raise
+        finally:
+            self.sleep = None
+        return seconds
+
+    def check_timeout(self):
+        if self.expired:
+            raise RetryTimeoutError('retry timeout.')
+
+
+class AsyncClockTimeoutCheck(ClockTimeoutCheck):
+    """ the `ClockTimeoutCheck` of coroutine functions. """
+
+    def cancel(self):
+        # no loop timer with a clock
+        pass
+
+    async def wait(self, seconds):
+        if self.deadline is not None:
+            seconds = min(seconds, self.deadline - self.now())
+        if seconds > 0:
+            await resolve(self.clock.sleep(seconds))
+        else:
+            seconds = 0
+        # let the other tasks run even if the clock does not sleep
+        await asyncio.sleep(0)
+        return seconds
+
+
+async def run_hedged(hedge, function, args, kwargs, deadline, max_tries,
+                     check_return):
+    """ the asyncio counterpart of `Hedge.run`.
+
+    The hedged tries are tasks on the running loop.  The losers are
+    cancelled.
+    """
+    def start():
+        submitted = monotonic()
+        task = asyncio.ensure_future(function(*args, **kwargs))
+
+        def record(_):
+            if not task.cancelled():
+                hedge.latency.record(monotonic() - submitted)
+
+        task.add_done_callback(record)
+        return task
+
+    primary = start()
+    pending = {primary}
+    launched = 1
+    hedges = 0
+    last = None
+    need_retry = None
+    delay = hedge.get_delay()
+    while True:
+        can_hedge = hedges < hedge.max_hedges and launched < max_tries
+        if deadline is None:
+            timeout = None
+        else:
+            timeout = max(deadline - monotonic(), 0)
+        if can_hedge and (timeout is None or delay < timeout):
+            timeout = delay
+
+        done, pending = await asyncio.wait(
+            pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            last = task
+            if task.exception() is None:
+                need_retry = await resolve(check_return(args, task.result()))
+                if not need_retry:
+                    if task is not primary:
+                        hedge.won += 1
+                    for loser in pending:
+                        loser.cancel()
+                    return task, launched, need_retry
+            else:
+                need_retry = None
+        if not pending:
+            return last, launched, need_retry
+        if done and launched < max_tries:
+            for loser in pending:
+                loser.cancel()
+            return last, launched, need_retry
+        if deadline is not None and monotonic() >= deadline:
+            for loser in pending:
+                loser.cancel()
+            return None, launched, None
+        if not done and can_hedge:
+            if hedge._acquire():
+                task = start()
+                task.add_done_callback(hedge._release)
+                pending.add(task)
+                launched += 1
+                hedges += 1
+            else:
+                # too many hedges in flight, wait for what we have
+                hedges = hedge.max_hedges
+
+
+def wrap(function, policy, stats):
+    """ build the coroutine wrapper of `function`.
+
+    The helpers of the `RetryPolicy` may return an awaitable if the
+    callback behind it is a coroutine function.
+    """
+    get_limit = policy.get_limit
+    get_timeout = policy.get_timeout
+    get_wait = policy.get_wait
+    check_return = policy.check_return
+    check_error = policy.check_error
+    call_retry_callback = policy.call_retry_callback
+    retry_on_none = policy.retry_on_none
+    breaker = policy.circuit_breaker
+    budget = policy.budget
+    listener = policy.listener
+    record_outcome = policy.record_outcome
+    # coroutine attempts are cancelled at the deadline, no thread is used
+    interrupt = policy.pool is not None
+    hedge = policy.hedge
+    use_state = policy.use_state
+    clock = policy.clock
+    if clock is None:
+        now = monotonic
+        new_check = AsyncTimeoutCheck
+    else:
+        now = clock.now
+        new_check = functools.partial(AsyncClockTimeoutCheck, clock)
+    stats_shard = stats.shard
+
+    @functools.wraps(function)
+    async def func_wrapper(*args, **kwargs):
+        timeout_check = new_check()
+
+        need_retry = True
+        tried = 0
+        ret = None
+        to_wait = 0
+        waited = 0
+        outcome = None
+        token = None
+        trial = False
+        if listener is not None:
+            start = now()
+        if use_state:
+            state = RetryState(function, args, kwargs, now=now)
+            state_token = _state.enter(state)
+        else:
+            state = None
+        try:
+            max_try = await resolve(get_limit(args))
+            timeout = await resolve(get_timeout(args))
+            deadline, token = _deadline.enter(timeout, now)
+            if state is not None:
+                state.deadline = deadline
+            if deadline is not None:
+                timeout_check.start(deadline - now())
+            while need_retry:
+                timeout_check.check_timeout()
+                if breaker is not None and breaker.is_open():
+                    raise CircuitOpenError('circuit breaker is open.')
+                to_wait = await resolve(
+                    get_wait(args, tried, to_wait, outcome))
+                if to_wait is None:
+                    raise ValueError('wait should be a number or '
+                                     'a callback of try count.')
+                if state is not None:
+                    state.wait = to_wait
+                if listener is not None and tried > 0:
+                    listener.retry_scheduled(function, tried, to_wait)
+                if to_wait > 0:
+                    waited += await timeout_check.wait(to_wait)
+                    timeout_check.check_timeout()
+
+                await resolve(call_retry_callback(args, tried))
+                if breaker is not None:
+                    breaker.before_call()
+                    trial = True
+                tried += 1
+                if state is not None:
+                    state.attempt = tried
+                if listener is not None:
+                    listener.attempt_start(function, tried)
+                    started = now()
+                attempt = None
+                checked = None
+                if hedge is not None:
+                    attempt, launched, checked = await run_hedged(
+                        hedge, function, args, kwargs, deadline,
+                        max_try - tried + 1, check_return)
+                    tried += launched - 1
+                    if state is not None:
+                        state.attempt = tried
+                    if attempt is None:
+                        timeout_check.expire()
+                        timeout_check.check_timeout()
+                elif interrupt and deadline is not None:
+                    attempt = asyncio.ensure_future(function(*args, **kwargs))
+                    done, _ = await asyncio.wait(
+                        (attempt,), timeout=max(deadline - now(), 0))
+                    if not done:
+                        attempt.cancel()
+                        timeout_check.expire()
+                        timeout_check.check_timeout()
+                try:
+                    if attempt is None:
+                        ret = await function(*args, **kwargs)
+                    else:
+                        ret = attempt.result()
+                    if checked is None:
+                        need_retry = await resolve(check_return(args, ret))
+                    else:
+                        need_retry = checked
+                    if need_retry is None:
+                        need_retry = retry_on_none
+                    if listener is not None:
+                        listener.attempt_end(function, tried,
+                                             now() - started,
+                                             None, ret)
+                    if breaker is not None:
+                        trial = False
+                        breaker.record(need_retry)
+                    if budget is not None:
+                        budget.record(need_retry)
+                    if record_outcome is not None:
+                        record_outcome(need_retry)
+                    outcome = ret
+                    if state is not None:
+                        state.last_result = ret
+                    if need_retry and (tried >= max_try or
+                                       budget is not None and
+                                       not budget.withdraw()):
+                        need_retry = False
+                        stats_shard()[GIVE_UPS] += 1
+                        if listener is not None:
+                            listener.give_up(function, tried, None, ret)
+                # noinspection PyBroadException
+                except Exception as e:
+                    if listener is not None:
+                        listener.attempt_end(function, tried,
+                                             now() - started,
+                                             e, None)
+                    need_retry = await resolve(check_error(args, e))
+                    if breaker is not None:
+                        trial = False
+                        breaker.record(need_retry)
+                    if budget is not None:
+                        budget.record(need_retry)
+                    if record_outcome is not None:
+                        record_outcome(need_retry)
+                    outcome = e
+                    if state is not None:
+                        state.last_error = e
+                    if not need_retry:
+                        raise
+                    if tried >= max_try or (budget is not None and
+                                            not budget.withdraw()):
+                        stats_shard()[GIVE_UPS] += 1
+                        if listener is not None:
+                            listener.give_up(function, tried, e, None)
+                        raise
+        except RetryTimeoutError:
+            if trial:
+                # the try was too slow
+                trial = False
+                breaker.on_failure()
+            shard = stats_shard()
+            shard[FAILURES] += 1
+            if timeout_check.expired:
+                shard[TIMEOUTS] += 1
+                if listener is not None:
+                    listener.timeout(function, tried, now() - start)
+            raise
+        except Exception:
+            stats_shard()[FAILURES] += 1
+            raise
+        finally:
+            if trial:
+                # ended by a cancellation or a BaseException
+                breaker.release()
+            timeout_check.cancel()
+            _deadline.leave(token)
+            if state is not None:
+                _state.leave(state_token)
+            shard = stats_shard()
+            shard[CALLS] += 1
+            shard[ATTEMPTS] += tried
+            if tried > 1:
+                shard[RETRIES] += tried - 1
+            if waited:
+                shard[WAIT_SECONDS] += waited
+        return ret
+
+    async def accept(args, r):
+        need_retry = await resolve(check_return(args, r))
+        if need_retry is None:
+            need_retry = retry_on_none
+        return not need_retry
+
+    if policy.cache is not None:
+        func_wrapper = cached(policy.cache, function, func_wrapper, accept)
+    # functools.wraps does not set it on python 2
+    func_wrapper.__wrapped__ = function
+    func_wrapper.retry_policy = policy
+    func_wrapper.retry_stats = stats
+    return func_wrapper
+
+
+def cached(cache, function, func_wrapper, accept):
+    """ the asyncio counterpart of `ResultCache.wrap`.
+
+    The calls waiting for the same key await the task of the first one.
+    The task is shielded: cancelling any of the callers, the first one
+    included, does not cancel it for the others.
+    """
+    tasks = {}
+
+    @functools.wraps(function)
+    async def cached_wrapper(*args, **kwargs):
+        key = cache.call_key(function, args, kwargs)
+        if key is None:
+            return await func_wrapper(*args, **kwargs)
+        found, result = cache.get(key)
+        if found:
+            return result
+
+        task = tasks.get(key)
+        if task is not None:
+            cache.coalesced += 1
+            # the leader could be cancelled, don't cancel it with us
+            return await asyncio.shield(task)
+
+        async def lead():
+            try:
+                result = await func_wrapper(*args, **kwargs)
+                if await accept(args, result):
+                    cache.put(key, result)
+                return result
+            finally:
+                del tasks[key]
+
+        task = tasks[key] = asyncio.ensure_future(lead())
+        return await asyncio.shield(task)
+
+    return cached_wrapper
+
+
+def keyed(function, select):
+    """ coroutine function awaiting the retry loop of the key.
+
+    :param select: `select(args, kwargs)` returns the wrapped coroutine
+        function of the key of the call.
+    """
+    @functools.wraps(function)
+    async def func_wrapper(*args, **kwargs):
+        return await select(args, kwargs)(*args, **kwargs)
+
+    return func_wrapper
+
+
+def limited(wrapper, in_flight, busy):
+    """ the coroutine counterpart of `retryz.keyed.limited`. """
+    @functools.wraps(wrapper)
+    async def func_wrapper(*args, **kwargs):
+        if not in_flight.acquire(False):
+            raise busy()
+        try:
+            return await wrapper(*args, **kwargs)
+        finally:
+            in_flight.release()
+
+    return func_wrapper
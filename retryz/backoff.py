@@ -0,0 +1,164 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+""" wait strategies which could be used as the `wait` option of `retry`.
+
+.. code-block:: python
+
+    @retry(on_error=IOError, wait=backoff.FullJitter(0.1, cap=10))
+    def fetch():
+        ...
+
+Each strategy computes the wait from the retry count (starting from 1)
+and the previous wait in O(1).  The strategies keep no per call state so
+that one instance could be shared by concurrent calls.
+"""
+import math
+
+__author__ = 'Cedric Zhuang'
+
+INF = float('inf')
+
+
+class Backoff(object):
+    """ base class of the wait strategies.
+
+    Sub-classes implement `compute(tried, previous)` where `tried` is the
+    retry count (1 for the first retry) and `previous` is the last wait
+    (0 before the first retry).  The result is never larger than `cap`.
+
+    Sub-classes setting `use_outcome` implement
+    `compute(tried, previous, outcome)` instead.  `outcome` is the error
+    raised by the last try or its return value.
+    """
+    __slots__ = ('cap',)
+    use_outcome = False
+
+    def __init__(self, cap=None):
+        if cap is None:
+            cap = INF
+        if cap < 0:
+            raise ValueError('cap should not be negative.')
+        self.cap = cap
+
+    def __call__(self, tried, previous=0):
+        return self.compute(tried, previous)
+
+    def compute(self, tried, previous):
+        raise NotImplementedError()
+
+
+class Constant(Backoff):
+    """ wait the same seconds before each retry. """
+    __slots__ = ('seconds',)
+
+    def __init__(self, seconds, cap=None):
+        super(Constant, self).__init__(cap)
+        self.seconds = min(seconds, self.cap)
+
+    def compute(self, tried, previous):
+        return self.seconds
+
+
+class Linear(Backoff):
+    """ wait `start + step * (tried - 1)` seconds. """
+    __slots__ = ('start', 'step')
+
+    def __init__(self, start, step=None, cap=None):
+        super(Linear, self).__init__(cap)
+        if step is None:
+            step = start
+        self.start = start
+        self.step = step
+
+    def compute(self, tried, previous):
+        return min(self.cap, self.start + self.step * (tried - 1))
+
+
+class Exponential(Backoff):
+    """ wait `base * factor ** (tried - 1)` seconds. """
+    __slots__ = ('base', 'factor', 'max_exp')
+
+    def __init__(self, base, factor=2, cap=None):
+        super(Exponential, self).__init__(cap)
+        if base <= 0 or factor < 1:
+            raise ValueError('base should be positive and factor should be '
+                             'no less than 1.')
+        self.base = base
+        self.factor = factor
+        # the exponent beyond which the cap is always reached.
+        # clamp to it to avoid huge numbers or float overflow.
+        if factor == 1 or self.cap == INF:
+            self.max_exp = 1023
+        else:
+            ratio = max(self.cap / float(base), 1)
+            self.max_exp = int(math.ceil(math.log(ratio, factor)))
+
+    def ceiling(self, tried):
+        exp = min(tried - 1, self.max_exp)
+        try:
+            ret = self.base * self.factor ** exp
+        except OverflowError:
+            ret = INF
+        return min(self.cap, ret)
+
+    def compute(self, tried, previous):
+        return self.ceiling(tried)
+
+
+class FullJitter(Exponential):
+    """ wait a random value between 0 and the exponential backoff. """
+    __slots__ = ('random',)
+
+    def __init__(self, base, factor=2, cap=None, rand=None):
+        super(FullJitter, self).__init__(base, factor, cap)
+        if rand is None:
+            import random
+            rand = random.random
+        self.random = rand
+
+    def compute(self, tried, previous):
+        return self.random() * self.ceiling(tried)
+
+
+class EqualJitter(FullJitter):
+    """ wait half of the exponential backoff plus a random half. """
+    __slots__ = ()
+
+    def compute(self, tried, previous):
+        half = self.ceiling(tried) / 2.0
+        return half + self.random() * half
+
+
+class DecorrelatedJitter(Backoff):
+    """ wait a random value between `base` and 3 times the previous wait.
+
+    The previous wait of the first retry is taken as `base`.
+    """
+    __slots__ = ('base', 'random')
+
+    def __init__(self, base, cap=None, rand=None):
+        super(DecorrelatedJitter, self).__init__(cap)
+        if base <= 0:
+            raise ValueError('base should be positive.')
+        if rand is None:
+            import random
+            rand = random.random
+        self.base = base
+        self.random = rand
+
+    def compute(self, tried, previous):
+        upper = max(previous, self.base) * 3
+        return min(self.cap, self.base + self.random() * (upper - self.base))
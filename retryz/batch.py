@@ -0,0 +1,168 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+""" per item retry of bulk operations for `retry_batch`.
+
+This module is only imported when `retry_batch` decorates a function.
+"""
+import functools
+
+from retryz import _time_source, RetryTimeoutError
+from retryz import deadline as _deadline
+from retryz import state as _state
+from retryz.metrics import CALLS, ATTEMPTS, RETRIES, GIVE_UPS, TIMEOUTS, \
+    FAILURES, WAIT_SECONDS
+from retryz.state import RetryState
+
+__author__ = 'Cedric Zhuang'
+
+
+def _compile_item(policy):
+    """ whether the result of an item needs retry.
+
+    An item failed if its result is an exception accepted by `on_error`
+    (any exception if `on_error` is not specified), or if `on_return`
+    accepts its result.
+    """
+    check_error = policy.check_error
+    check_return = policy.check_return
+    any_error = policy.on_error is None
+    check_value = policy.on_return is not None
+
+    def failed(args, r):
+        if isinstance(r, Exception):
+            ret = any_error or check_error(args, r)
+        elif check_value:
+            ret = check_return(args, r)
+        else:
+            ret = False
+        return ret
+
+    return failed
+
+
+def wrap(function, policy, stats):
+    """ build the wrapper of a batch function.
+
+    The batch is the last positional argument of the function.  The
+    function returns one result per item, in the order of the items.
+    """
+    get_limit = policy.get_limit
+    get_timeout = policy.get_timeout
+    get_wait = policy.get_wait
+    check_error = policy.check_error
+    call_retry_callback = policy.call_retry_callback
+    item_failed = _compile_item(policy)
+    now, new_check = _time_source(policy.clock)
+    use_state = policy.use_state
+    stats_shard = stats.shard
+
+    @functools.wraps(function)
+    def func_wrapper(*args, **kwargs):
+        if not args:
+            raise TypeError('the batch should be the last positional '
+                            'argument of {}.'.format(function.__name__))
+        head = args[:-1]
+        items = list(args[-1])
+        results = [None] * len(items)
+        pending = list(range(len(items)))
+        timeout_check = new_check()
+
+        tried = 0
+        to_wait = 0
+        waited = 0
+        token = None
+        if use_state:
+            state = RetryState(function, args, kwargs, now=now)
+            state_token = _state.enter(state)
+        else:
+            state = None
+        try:
+            max_try = get_limit(args)
+            deadline, token = _deadline.enter(get_timeout(args), now)
+            if state is not None:
+                state.deadline = deadline
+            if deadline is not None:
+                timeout_check.start(deadline - now())
+            while pending and tried < max_try:
+                timeout_check.check_timeout()
+                to_wait = get_wait(args, tried, to_wait)
+                if state is not None:
+                    state.wait = to_wait
+                if to_wait > 0:
+                    waited += timeout_check.wait(to_wait)
+                    timeout_check.check_timeout()
+
+                call_retry_callback(args, tried)
+                tried += 1
+                if state is not None:
+                    state.attempt = tried
+                batch = [items[i] for i in pending]
+                try:
+                    returned = function(*(head + (batch,)), **kwargs)
+                # noinspection PyBroadException
+                except Exception as e:
+                    if state is not None:
+                        state.last_error = e
+                    # the whole batch failed, resend it
+                    if not check_error(args, e):
+                        raise
+                    if tried >= max_try:
+                        stats_shard()[GIVE_UPS] += 1
+                        raise
+                    continue
+
+                returned = list(returned)
+                if state is not None:
+                    state.last_result = returned
+                if len(returned) != len(batch):
+                    raise ValueError(
+                        '{} returned {} results for {} items.'.format(
+                            function.__name__, len(returned), len(batch)))
+                failed = []
+                for i, r in zip(pending, returned):
+                    results[i] = r
+                    if item_failed(args, r):
+                        failed.append(i)
+                pending = failed
+            if pending:
+                stats_shard()[GIVE_UPS] += 1
+        except RetryTimeoutError:
+            shard = stats_shard()
+            shard[FAILURES] += 1
+            if timeout_check.is_expired():
+                shard[TIMEOUTS] += 1
+            raise
+        except Exception:
+            stats_shard()[FAILURES] += 1
+            raise
+        finally:
+            _deadline.leave(token)
+            if state is not None:
+                _state.leave(state_token)
+            shard = stats_shard()
+            shard[CALLS] += 1
+            shard[ATTEMPTS] += tried
+            if tried > 1:
+                shard[RETRIES] += tried - 1
+            if waited:
+                shard[WAIT_SECONDS] += waited
+        return results
+
+    # functools.wraps does not set it on python 2
+    func_wrapper.__wrapped__ = function
+    func_wrapper.retry_policy = policy
+    func_wrapper.retry_stats = stats
+    return func_wrapper
@@ -0,0 +1,136 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import threading
+
+from retryz.timer import monotonic
+
+__author__ = 'Cedric Zhuang'
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker(object):
+    """ circuit breaker shared by the calls of `retry` decorated functions.
+
+    * closed: calls go through.  The breaker opens after
+      `failure_threshold` consecutive failures.
+    * open: calls fail with `CircuitOpenError` without calling the
+      function.  After `recovery_timeout` seconds the breaker is half-open.
+    * half-open: at most `half_open_max` trial calls go through.  A
+      success closes the breaker.  A failure opens it again.
+
+    A failure is a try which `retry` would retry: an error accepted by
+    `on_error` or a return value accepted by `on_return`.
+    """
+
+    def __init__(self, failure_threshold=5, recovery_timeout=30,
+                 half_open_max=1, clock=monotonic):
+        if failure_threshold < 1:
+            raise ValueError('failure_threshold should be at least 1.')
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max = half_open_max
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0
+        self._trials = 0
+
+    def __reduce__(self):
+        # a copy in another process starts closed
+        return CircuitBreaker, (self.failure_threshold,
+                                self.recovery_timeout, self.half_open_max,
+                                self._clock)
+
+    @property
+    def state(self):
+        state = self._state
+        if state == OPEN and self._recovered():
+            state = HALF_OPEN
+        return state
+
+    def _recovered(self):
+        return self._clock() - self._opened_at >= self.recovery_timeout
+
+    def is_open(self):
+        """ whether calls are rejected now.  Reserves nothing. """
+        return self._state == OPEN and not self._recovered()
+
+    def before_call(self):
+        """ reserve a call or raise `CircuitOpenError`. """
+        with self._lock:
+            if self._state == OPEN:
+                if not self._recovered():
+                    raise CircuitOpenError('circuit breaker is open.')
+                self._state = HALF_OPEN
+                self._trials = 0
+            if self._state == HALF_OPEN:
+                if self._trials >= self.half_open_max:
+                    raise CircuitOpenError('circuit breaker is half-open.')
+                self._trials += 1
+
+    def release(self):
+        """ give back a call reserved by `before_call` but not recorded.
+
+        For the tries ended by a cancellation or a `BaseException`.
+        """
+        with self._lock:
+            if self._state == HALF_OPEN and self._trials > 0:
+                self._trials -= 1
+
+    def record(self, failed):
+        if failed:
+            self.on_failure()
+        else:
+            self.on_success()
+
+    def on_success(self):
+        if self._state == CLOSED and self._failures == 0:
+            # fast path without the lock
+            return
+        with self._lock:
+            self._failures = 0
+            if self._state == HALF_OPEN:
+                self._state = CLOSED
+                self._trials = 0
+
+    def on_failure(self):
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._open()
+            elif self._state == CLOSED:
+                self._failures += 1
+                if self._failures >= self.failure_threshold:
+                    self._open()
+
+    def _open(self):
+        self._state = OPEN
+        self._opened_at = self._clock()
+        self._failures = 0
+        self._trials = 0
+
+    def reset(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._trials = 0
@@ -0,0 +1,101 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import itertools
+import threading
+
+from retryz.timer import monotonic
+
+__author__ = 'Cedric Zhuang'
+
+
+class RetryBudget(object):
+    """ token bucket capping the retries across all calls sharing it.
+
+    Each successful call deposits `ratio` token.  Each retry withdraws
+    one token.  `min_per_second` tokens are added per second so that
+    some retries are allowed even when nothing succeeds.  The balance
+    never exceeds `max_tokens`.
+
+    Deposits happen on every successful call, so they don't take the lock:
+    they only advance an `itertools.count`, which is atomic.  The count is
+    credited to the balance by `withdraw`, which only runs on retries.
+    """
+
+    def __init__(self, ratio=0.2, min_per_second=10, max_tokens=None,
+                 clock=monotonic):
+        if ratio < 0 or min_per_second < 0:
+            raise ValueError('ratio and min_per_second should not be '
+                             'negative.')
+        if max_tokens is None:
+            max_tokens = max(min_per_second, 1) * 10
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        # number of `next` calls made by `_credit` on the counter
+        self._reads = 0
+        self._credited = 0
+        self._balance = float(max_tokens)
+        self._refilled_at = clock()
+
+    def __reduce__(self):
+        # a copy in another process starts with a full bucket
+        return RetryBudget, (self.ratio, self.min_per_second,
+                             self.max_tokens, self._clock)
+
+    def deposit(self):
+        next(self._counter)
+
+    def record(self, failed):
+        if not failed:
+            next(self._counter)
+
+    def _credit(self):
+        """ move deposits and time refill into the balance.
+
+        Should be called with the lock acquired.
+        """
+        deposits = next(self._counter) - self._reads
+        self._reads += 1
+        now = self._clock()
+        balance = (self._balance +
+                   (deposits - self._credited) * self.ratio +
+                   (now - self._refilled_at) * self.min_per_second)
+        self._credited = deposits
+        self._refilled_at = now
+        self._balance = min(balance, self.max_tokens)
+
+    def withdraw(self):
+        """ take one token for a retry.
+
+        :return: `False` if the budget is exhausted.
+        """
+        with self._lock:
+            self._credit()
+            if self._balance >= 1:
+                self._balance -= 1
+                ret = True
+            else:
+                ret = False
+        return ret
+
+    @property
+    def balance(self):
+        with self._lock:
+            self._credit()
+            return self._balance
@@ -0,0 +1,191 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+""" result cache of `retry(cache=...)`.
+
+The results are cached by the arguments of the call.  Concurrent calls
+with the same arguments share one retry loop: the first call runs it and
+the others wait for its result or its error (single-flight).  Errors are
+never cached.
+"""
+import collections
+import functools
+import threading
+
+from retryz.timer import monotonic
+
+__author__ = 'Cedric Zhuang'
+
+_KWARGS_MARK = object()
+
+
+def make_key(args, kwargs):
+    """ default key of a call, `None` if an argument is not hashable. """
+    key = args
+    if kwargs:
+        key += (_KWARGS_MARK,) + tuple(sorted(kwargs.items()))
+    try:
+        hash(key)
+    except TypeError:
+        key = None
+    return key
+
+
+class _Flight(object):
+    """ a retry loop in progress, shared by the calls with the same key. """
+    __slots__ = ('event', 'result', 'error', 'abandoned')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        # the leader ended with a `BaseException`, there is no outcome
+        self.abandoned = False
+
+
+class ResultCache(object):
+    """ LRU cache of the successful results with an optional TTL.
+
+    :param ttl: seconds a result stays valid.  `None` for no expiry.
+    :param max_size: max number of results.  The least recently used is
+        evicted first.
+    :param key: `key(args, kwargs)` returns a hashable key of the call or
+        `None` to bypass the cache.
+    :param clock: function returning the current time in seconds.
+    """
+
+    def __init__(self, ttl=None, max_size=128, key=make_key,
+                 clock=monotonic):
+        if max_size < 1:
+            raise ValueError('max_size should be at least 1.')
+        self.ttl = ttl
+        self.max_size = max_size
+        self.key = key
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> (expire time, result)
+        self._items = collections.OrderedDict()
+        self._flights = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def __reduce__(self):
+        # a copy in another process starts empty
+        return ResultCache, (self.ttl, self.max_size, self.key,
+                             self._clock)
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        """ tuple of (found, result). """
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                expire, result = item
+                if expire is None or self._clock() < expire:
+                    self._move_to_end(key)
+                    self.hits += 1
+                    return True, result
+                del self._items[key]
+            self.misses += 1
+        return False, None
+
+    def put(self, key, result):
+        if self.ttl is None:
+            expire = None
+        else:
+            expire = self._clock() + self.ttl
+        with self._lock:
+            self._items[key] = (expire, result)
+            self._move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def _move_to_end(self, key):
+        move = getattr(self._items, 'move_to_end', None)
+        if move is not None:
+            move(key)
+        else:
+            self._items[key] = self._items.pop(key)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def call_key(self, function, args, kwargs):
+        """ key of the call in this cache, `None` to bypass the cache. """
+        key = self.key(args, kwargs)
+        if key is not None:
+            # the cache could be shared by several functions
+            key = (function, key)
+        return key
+
+    def wrap(self, function, func_wrapper, accept):
+        """ add the cache in front of the retry loop `func_wrapper`.
+
+        :param accept: `accept(args, result)` tells whether the result is
+            a success which could be cached.
+        """
+        @functools.wraps(function)
+        def cached(*args, **kwargs):
+            key = self.call_key(function, args, kwargs)
+            if key is None:
+                return func_wrapper(*args, **kwargs)
+            while True:
+                found, result = self.get(key)
+                if found:
+                    return result
+
+                with self._lock:
+                    flight = self._flights.get(key)
+                    leader = flight is None
+                    if leader:
+                        flight = self._flights[key] = _Flight()
+                    else:
+                        self.coalesced += 1
+                if leader:
+                    break
+                flight.event.wait()
+                if flight.abandoned:
+                    # the leader was interrupted, lead the next flight
+                    continue
+                if flight.error is not None:
+                    raise flight.error
+                return flight.result
+
+            try:
+                result = func_wrapper(*args, **kwargs)
+                if accept(args, result):
+                    self.put(key, result)
+                flight.result = result
+            except Exception as e:
+                flight.error = e
+                raise
+            except BaseException:
+                flight.abandoned = True
+                raise
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.event.set()
+            return result
+
+        return cached
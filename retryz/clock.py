@@ -0,0 +1,80 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+""" time source and sleeper of `retry(clock=...)`.
+
+By default `retry` sleeps with `time.sleep` and checks the timeout
+against the monotonic time.  With a clock, the waits call `clock.sleep`
+and the timeout is checked against `clock.now()`.  `VirtualClock` never sleeps:
+it moves its time forward instead, so retry sequences with long waits
+and timeouts run in no time, and always the same way.
+
+.. code-block:: python
+
+    clock = VirtualClock()
+
+    @retry(on_error=IOError, wait=10, timeout=60, clock=clock)
+    def fetch():
+        clock.advance(0.5)    # simulate the latency of the call
+        ...
+"""
+import threading
+import time
+
+from retryz.timer import monotonic
+
+__author__ = 'Cedric Zhuang'
+
+
+class Clock(object):
+    """ the real time.
+
+    Sub-class it to change how `retry` reads the time and sleeps.  For
+    coroutine functions, `sleep` could return an awaitable.
+    """
+
+    def now(self):
+        """ seconds on a monotonic clock. """
+        return monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+class VirtualClock(Clock):
+    """ a clock whose time only moves by `sleep` and `advance`. """
+
+    def __init__(self, start=0.0):
+        self._now = start
+        self._lock = threading.Lock()
+        # total seconds and number of the sleeps
+        self.slept = 0.0
+        self.sleeps = 0
+
+    def __reduce__(self):
+        return VirtualClock, (self._now,)
+
+    def now(self):
+        return self._now
+
+    def sleep(self, seconds):
+        with self._lock:
+            self.slept += seconds
+            self.sleeps += 1
+            self._now += seconds
+
+    def advance(self, seconds):
+        with self._lock:
+            self._now += seconds
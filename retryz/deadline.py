@@ -0,0 +1,129 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+""" deadline of the enclosing `retry` call.
+
+When a function decorated with `retry(timeout=...)` calls another retried
+function, the inner call inherits the outer deadline: its timeout is
+clamped to what remains of the outer one.  The deadline is kept in a
+context variable so that it follows threads and asyncio tasks.
+"""
+import threading
+
+from retryz.timer import monotonic
+
+__author__ = 'Cedric Zhuang'
+
+
+class _Token(object):
+    """ token of `_LocalVar.set`, holding the value it replaced. """
+    __slots__ = ('old_value',)
+
+    def __init__(self, old_value):
+        self.old_value = old_value
+
+
+class _LocalVar(object):
+    """ thread local fallback for interpreters without contextvars. """
+
+    def __init__(self, name, default=None):
+        self.name = name
+        self._default = default
+        self._local = threading.local()
+
+    def get(self):
+        return getattr(self._local, 'value', self._default)
+
+    def set(self, value):
+        token = _Token(self.get())
+        self._local.value = value
+        return token
+
+    def reset(self, token):
+        self._local.value = token.old_value
+
+
+try:
+    from contextvars import ContextVar
+except ImportError:
+    ContextVar = _LocalVar
+
+_current = ContextVar('retryz_deadline', default=None)
+
+
+def current():
+    """ the deadline (on the `monotonic` clock) or `None`. """
+    return _current.get()
+
+
+def remaining():
+    """ seconds left before the deadline, `None` if there is none. """
+    deadline = _current.get()
+    if deadline is None:
+        ret = None
+    else:
+        ret = max(deadline - monotonic(), 0)
+    return ret
+
+
+def enter(timeout, now=monotonic):
+    """ start a call with `timeout` seconds under the current deadline.
+
+    :param now: function returning the current time.  Nested calls should
+        use the same clock.
+    :return: tuple of the effective deadline (`None` if there is none)
+        and a token to pass to `leave`.
+    """
+    outer = _current.get()
+    if timeout is None:
+        return outer, None
+    deadline = now() + timeout
+    if outer is not None and outer <= deadline:
+        return outer, None
+    return deadline, _current.set(deadline)
+
+
+def leave(token):
+    if token is not None:
+        _current.reset(token)
+
+
+class Deadline(object):
+    """ context manager setting a deadline for a block.
+
+    .. code-block:: python
+
+        with Deadline(5):
+            fetch_all()    # retried calls inside give up within 5 seconds
+
+    Pass the `clock` of the retried calls if they have one.
+    """
+
+    def __init__(self, timeout, clock=None):
+        self.timeout = timeout
+        self.clock = clock
+        self._token = None
+
+    def __enter__(self):
+        if self.clock is None:
+            now = monotonic
+        else:
+            now = self.clock.now
+        deadline, self._token = enter(self.timeout, now)
+        return self
+
+    def __exit__(self, *_):
+        leave(self._token)
+        self._token = None
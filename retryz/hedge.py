@@ -0,0 +1,169 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+""" hedged (speculative) tries for `retry(hedge=...)`.
+
+When a try is slow rather than failed, another try is started in the
+pool after a delay.  The first result accepted by `on_return` wins and
+the other tries are cancelled (if not started) or ignored.  Each hedged
+try counts in `limit`.
+"""
+import threading
+
+from retryz.metrics import DEFAULT_BOUNDS, LatencyHistogram
+from retryz.timer import monotonic
+
+__author__ = 'Cedric Zhuang'
+
+
+class Hedge(object):
+    """ when and how many hedged tries to start.
+
+    :param delay: seconds to wait before starting a hedged try.
+    :param percentile: if specified, the delay is the observed latency of
+        this percentile (from a fixed bucket histogram) once
+        `min_samples` tries are recorded.  `delay` is used before that.
+    :param max_hedges: max number of hedged tries started for one try.
+    :param max_concurrent: max number of hedged tries in flight for all
+        the calls sharing this object.
+    """
+
+    def __init__(self, delay=0.1, percentile=None, max_hedges=1,
+                 max_concurrent=16, min_samples=20, bounds=DEFAULT_BOUNDS):
+        if max_hedges < 1 or max_concurrent < 1:
+            raise ValueError('max_hedges and max_concurrent should be at '
+                             'least 1.')
+        self.delay = delay
+        self.percentile = percentile
+        self.max_hedges = max_hedges
+        self.max_concurrent = max_concurrent
+        self.min_samples = min_samples
+        self.latency = LatencyHistogram(bounds)
+        self.hedged = 0
+        self.won = 0
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    def __reduce__(self):
+        # a copy in another process starts with no latency recorded
+        return Hedge, (self.delay, self.percentile, self.max_hedges,
+                       self.max_concurrent, self.min_samples,
+                       self.latency.bounds)
+
+    def get_delay(self):
+        ret = self.delay
+        if (self.percentile is not None and
+                self.latency.total >= self.min_samples):
+            observed = self.latency.percentile(self.percentile)
+            if observed != float('inf'):
+                ret = observed
+        return ret
+
+    def _acquire(self):
+        with self._lock:
+            if self._in_flight >= self.max_concurrent:
+                return False
+            self._in_flight += 1
+            self.hedged += 1
+            return True
+
+    def _release(self, _):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _submit(self, pool, function, args, kwargs):
+        submitted = monotonic()
+        future = pool.submit(function, args, kwargs)
+
+        def record(_):
+            if not future.cancelled():
+                duration = monotonic() - submitted
+                with self._lock:
+                    self.latency.record(duration)
+
+        future.add_done_callback(record)
+        return future
+
+    def run(self, pool, function, args, kwargs, deadline, max_tries,
+            check_return):
+        """ run the try and its hedges in the pool.
+
+        :param max_tries: tries left in `limit`.
+        :param check_return: `check_return(args, ret)` of the policy.
+        :return: tuple of (future, launched, need_retry).  `future` is the
+            winner, or the last one done if none wins, or `None` if the
+            deadline is reached.  `launched` is the number of tries
+            started.  `need_retry` is the `check_return` result of the
+            future, `None` if it raised.
+        """
+        from concurrent import futures
+
+        pending = {self._submit(pool, function, args, kwargs)}
+        primary = next(iter(pending))
+        launched = 1
+        hedges = 0
+        last = None
+        need_retry = None
+        delay = self.get_delay()
+        while True:
+            can_hedge = hedges < self.max_hedges and launched < max_tries
+            if deadline is None:
+                timeout = None
+            else:
+                timeout = max(deadline - monotonic(), 0)
+            if can_hedge and (timeout is None or delay < timeout):
+                timeout = delay
+
+            done, pending = futures.wait(
+                pending, timeout=timeout,
+                return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                last = future
+                if future.exception() is None:
+                    need_retry = check_return(args, future.result())
+                    if not need_retry:
+                        if future is not primary:
+                            with self._lock:
+                                self.won += 1
+                        self._cancel(pending)
+                        return future, launched, need_retry
+                else:
+                    need_retry = None
+            if not pending:
+                return last, launched, need_retry
+            if done and launched < max_tries:
+                # let the retry loop go on instead of waiting for the
+                # slow tries, unless they are the last ones in `limit`
+                self._cancel(pending)
+                return last, launched, need_retry
+            if deadline is not None and monotonic() >= deadline:
+                for future in pending:
+                    pool.abandon(future, function)
+                return None, launched, None
+            if not done and can_hedge:
+                if self._acquire():
+                    future = self._submit(pool, function, args, kwargs)
+                    future.add_done_callback(self._release)
+                    pending.add(future)
+                    launched += 1
+                    hedges += 1
+                else:
+                    # too many hedges in flight, wait for what we have
+                    hedges = self.max_hedges
+
+    @staticmethod
+    def _cancel(pending):
+        for future in pending:
+            future.cancel()
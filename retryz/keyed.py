@@ -0,0 +1,172 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+""" per-key retry state for `retry(key=...)`.
+
+A function calling many backends or tenants picks the key of each call
+(host, account...) with `key(args, kwargs)`.  Each key gets its own
+retry loop whose `circuit_breaker`, `budget`, `hedge` and `Backoff` wait
+are fresh copies of the ones given to `retry`, so that retries piling up
+on a failing key don't exhaust the budget or open the breaker of the
+healthy ones.  The keys are kept in an LRU map of `max_keys` entries.
+An evicted key starts again from fresh copies.
+
+With `max_in_flight`, each key also admits at most that many calls at
+once.  The calls past it raise `KeyBusyError` without waiting, so the
+callers stuck retrying a failing key could not take all the threads.
+
+Calls whose key is `None` use the objects given to `retry` themselves.
+The `retry_stats` of the wrapper count the calls of all the keys.
+
+This module is only imported when `key` is specified.
+"""
+import collections
+import functools
+import threading
+
+__author__ = 'Cedric Zhuang'
+
+
+class KeyedWrappers(object):
+    """ LRU map of key -> retry loop with its own policy. """
+
+    def __init__(self, function, policy, stats):
+        from retryz import wrap
+
+        self.function = function
+        self.policy = policy
+        self.stats = stats
+        self.max_keys = policy.max_keys
+        self.max_in_flight = policy.max_in_flight
+        self.evicted = 0
+        self._wrap = wrap
+        self._lock = threading.Lock()
+        self._items = collections.OrderedDict()
+        # serves the calls with no key
+        self.default = self._create(None,
+                                    policy.copy(key=None, fresh=False))
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def keys(self):
+        with self._lock:
+            return list(self._items)
+
+    def get(self, key):
+        """ the retry loop of the key, created if needed. """
+        if key is None:
+            return self.default
+        with self._lock:
+            ret = self._items.get(key)
+            if ret is not None:
+                self._move_to_end(key)
+                return ret
+        # compiled out of the lock, a concurrent call may win the race
+        created = self._create(key, self.policy.copy(key=None, fresh=True))
+        with self._lock:
+            ret = self._items.setdefault(key, created)
+            self._move_to_end(key)
+            while len(self._items) > self.max_keys:
+                self._items.popitem(last=False)
+                self.evicted += 1
+        return ret
+
+    def _create(self, key, policy):
+        ret = self._wrap(self.function, policy, self.stats)
+        if self.max_in_flight is not None:
+            ret = limited(ret, self.max_in_flight, key)
+        return ret
+
+    def select(self, args, kwargs):
+        """ the retry loop of the call. """
+        return self.get(self.policy.key(args, kwargs))
+
+    def policy_of(self, key):
+        """ the `RetryPolicy` of the key, `None` if it's not kept. """
+        if key is None:
+            return self.default.retry_policy
+        wrapper = self._items.get(key)
+        if wrapper is None:
+            return None
+        return wrapper.retry_policy
+
+    def _move_to_end(self, key):
+        move = getattr(self._items, 'move_to_end', None)
+        if move is not None:
+            move(key)
+        else:
+            self._items[key] = self._items.pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+def limited(wrapper, max_in_flight, key):
+    """ reject the calls of the key past `max_in_flight` at once.
+
+    The semaphore is kept as the `in_flight` attribute of the wrapper.
+    """
+    from retryz import _is_coroutine_function, KeyBusyError
+
+    in_flight = threading.BoundedSemaphore(max_in_flight)
+
+    def busy():
+        return KeyBusyError('{} calls of key {!r} in flight.'.format(
+            max_in_flight, key))
+
+    if _is_coroutine_function(wrapper):
+        from retryz import aio
+        func_wrapper = aio.limited(wrapper, in_flight, busy)
+    else:
+        @functools.wraps(wrapper)
+        def func_wrapper(*args, **kwargs):
+            if not in_flight.acquire(False):
+                raise busy()
+            try:
+                return wrapper(*args, **kwargs)
+            finally:
+                in_flight.release()
+
+    func_wrapper.retry_policy = wrapper.retry_policy
+    func_wrapper.retry_stats = wrapper.retry_stats
+    func_wrapper.in_flight = in_flight
+    return func_wrapper
+
+
+def wrap(function, policy, stats):
+    """ dispatch each call to the retry loop of its key. """
+    from retryz import _is_coroutine_function
+
+    wrappers = KeyedWrappers(function, policy, stats)
+    select = wrappers.select
+
+    if _is_coroutine_function(function):
+        from retryz import aio
+        func_wrapper = aio.keyed(function, select)
+    else:
+        @functools.wraps(function)
+        def func_wrapper(*args, **kwargs):
+            return select(args, kwargs)(*args, **kwargs)
+
+    func_wrapper.__wrapped__ = function
+    func_wrapper.retry_policy = policy
+    func_wrapper.retry_stats = stats
+    func_wrapper.retry_keys = wrappers
+    return func_wrapper
@@ -0,0 +1,313 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import array
+import bisect
+import threading
+import weakref
+
+__author__ = 'Cedric Zhuang'
+
+# upper bounds (in seconds) of the histogram buckets.  the last bucket
+# holds everything larger than the last bound.
+DEFAULT_BOUNDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                  0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class RetryListener(object):
+    """ receives the events of the retry loop.
+
+    Pass an instance as the `listener` option of `retry`.  Override the
+    events you are interested in.  `function` is the decorated function.
+    `attempt` starts from 1.
+    """
+
+    def attempt_start(self, function, attempt):
+        pass
+
+    def attempt_end(self, function, attempt, duration, error, result):
+        """ `error` is `None` if the attempt returned `result`. """
+        pass
+
+    def retry_scheduled(self, function, attempt, wait):
+        """ `attempt` will be retried after `wait` seconds. """
+        pass
+
+    def give_up(self, function, attempt, error, result):
+        """ the last attempt still needs retry but the limit or the budget
+        is reached. """
+        pass
+
+    def timeout(self, function, attempt, elapsed):
+        pass
+
+
+class LatencyHistogram(object):
+    """ histogram with fixed buckets stored in an array. """
+    __slots__ = ('bounds', 'counts', 'total', 'sum')
+
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        self.bounds = tuple(bounds)
+        self.counts = array.array('l', [0] * (len(self.bounds) + 1))
+        self.total = 0
+        self.sum = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.total += 1
+        self.sum += seconds
+
+    def percentile(self, q):
+        """ upper bound of the bucket holding the `q` (0~100) percentile.
+
+        `inf` if it's in the last bucket.  `None` if nothing recorded.
+        """
+        if self.total == 0:
+            return None
+        rank = self.total * q / 100.0
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count > 0:
+                break
+        if i < len(self.bounds):
+            ret = self.bounds[i]
+        else:
+            ret = float('inf')
+        return ret
+
+    def mean(self):
+        if self.total == 0:
+            return None
+        return self.sum / self.total
+
+
+class FunctionMetrics(object):
+    """ counters and histograms of one decorated function. """
+
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.attempts = 0
+        self.errors = 0
+        self.retries = 0
+        self.give_ups = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.latency = LatencyHistogram(bounds)
+        self.waits = LatencyHistogram(bounds)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'calls': self.calls,
+                'attempts': self.attempts,
+                'errors': self.errors,
+                'retries': self.retries,
+                'give_ups': self.give_ups,
+                'timeouts': self.timeouts,
+                'wait_seconds': self.wait_seconds,
+                'latency_p50': self.latency.percentile(50),
+                'latency_p99': self.latency.percentile(99),
+                'latency_buckets': list(self.latency.counts),
+            }
+
+
+class RetryMetrics(RetryListener):
+    """ built-in listener aggregating the events per decorated function.
+
+    .. code-block:: python
+
+        metrics = RetryMetrics()
+
+        @retry(on_error=IOError, limit=3, listener=metrics)
+        def fetch():
+            ...
+
+        metrics.get(fetch).snapshot()
+    """
+
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        self.bounds = bounds
+        self._lock = threading.Lock()
+        self._functions = {}
+
+    def __reduce__(self):
+        # a copy in another process starts from zero
+        return RetryMetrics, (self.bounds,)
+
+    def get(self, function):
+        """ metrics of the function (wrapped or not). """
+        function = getattr(function, '__wrapped__', function)
+        ret = self._functions.get(function)
+        if ret is None:
+            with self._lock:
+                ret = self._functions.setdefault(
+                    function, FunctionMetrics(self.bounds))
+        return ret
+
+    def functions(self):
+        return list(self._functions)
+
+    def attempt_start(self, function, attempt):
+        m = self.get(function)
+        with m.lock:
+            if attempt == 1:
+                m.calls += 1
+            m.attempts += 1
+
+    def attempt_end(self, function, attempt, duration, error, result):
+        m = self.get(function)
+        with m.lock:
+            if error is not None:
+                m.errors += 1
+            m.latency.record(duration)
+
+    def retry_scheduled(self, function, attempt, wait):
+        m = self.get(function)
+        with m.lock:
+            m.retries += 1
+            m.wait_seconds += wait
+            m.waits.record(wait)
+
+    def give_up(self, function, attempt, error, result):
+        m = self.get(function)
+        with m.lock:
+            m.give_ups += 1
+
+    def timeout(self, function, attempt, elapsed):
+        m = self.get(function)
+        with m.lock:
+            m.timeouts += 1
+
+
+# fields of the shards of `RetryStats`
+STATS_FIELDS = ('calls', 'attempts', 'retries', 'give_ups', 'timeouts',
+                'failures', 'wait_seconds')
+CALLS, ATTEMPTS, RETRIES, GIVE_UPS, TIMEOUTS, FAILURES, WAIT_SECONDS = \
+    range(len(STATS_FIELDS))
+
+
+# guards the shard lists of all the `RetryStats`
+_stats_lock = threading.Lock()
+
+
+class RetryStats(object):
+    """ counters kept by each decorated function.
+
+    Available as `wrapped.retry_stats`.  Call it (or `snapshot`) for a
+    dict of the counters.
+
+    Each thread updates its own shard, so the calls never share a lock.
+    The lock is only taken when a thread makes its first call and when
+    the shards are read.  The shards of the finished threads are merged
+    when read, and when new threads have doubled the shards.  `reset`
+    subtracts the current counts from the following snapshots instead of
+    clearing the shards of the other threads.
+    Nothing is allocated before the first call.
+    """
+    __slots__ = ('_local', '_shards', '_retired', '_baseline', '_prune_at')
+
+    def __init__(self):
+        self._local = None
+        # tuples of (weak reference of the thread, shard)
+        self._shards = []
+        self._retired = None
+        self._baseline = None
+        # number of shards merging those of the finished threads
+        self._prune_at = 16
+
+    def __reduce__(self):
+        # a copy in another process starts from zero
+        return RetryStats, ()
+
+    def shard(self):
+        """ the counters of the current thread. """
+        try:
+            return self._local.shard
+        except AttributeError:
+            return self._new_shard()
+
+    def _new_shard(self):
+        shard = [0] * len(STATS_FIELDS)
+        with _stats_lock:
+            if self._local is None:
+                self._local = threading.local()
+            self._local.shard = shard
+            if len(self._shards) >= self._prune_at:
+                # bounded even if the stats are never read
+                self._prune()
+                self._prune_at = max(16, 2 * len(self._shards))
+            self._shards.append(
+                (weakref.ref(threading.current_thread()), shard))
+        return shard
+
+    def _prune(self):
+        """ merge the shards of the finished threads.  Called with the lock.
+        """
+        if self._retired is None:
+            self._retired = [0] * len(STATS_FIELDS)
+        alive = []
+        for thread_ref, shard in self._shards:
+            thread = thread_ref()
+            if thread is None or not thread.is_alive():
+                # nothing is written to it anymore
+                for i, count in enumerate(shard):
+                    self._retired[i] += count
+            else:
+                alive.append((thread_ref, shard))
+        self._shards = alive
+
+    def _totals(self):
+        """ sum of the shards.  Called with the lock. """
+        self._prune()
+        totals = list(self._retired)
+        for _, shard in self._shards:
+            for i, count in enumerate(shard):
+                totals[i] += count
+        return totals
+
+    def snapshot(self):
+        with _stats_lock:
+            totals = self._totals()
+            baseline = self._baseline or [0] * len(STATS_FIELDS)
+            return {name: totals[i] - baseline[i]
+                    for i, name in enumerate(STATS_FIELDS)}
+
+    __call__ = snapshot
+
+    def reset(self):
+        with _stats_lock:
+            self._baseline = self._totals()
+
+
+def merge_snapshots(snapshots, bounds=DEFAULT_BOUNDS):
+    """ sum the `FunctionMetrics.snapshot` of several processes.
+
+    The percentiles are computed again from the summed buckets.
+    """
+    latency = LatencyHistogram(bounds)
+    ret = {'calls': 0, 'attempts': 0, 'errors': 0, 'retries': 0,
+           'give_ups': 0, 'timeouts': 0, 'wait_seconds': 0.0}
+    for snapshot in snapshots:
+        for key in ret:
+            ret[key] += snapshot[key]
+        for i, count in enumerate(snapshot['latency_buckets']):
+            latency.counts[i] += count
+            latency.total += count
+    ret['latency_p50'] = latency.percentile(50)
+    ret['latency_p99'] = latency.percentile(99)
+    ret['latency_buckets'] = list(latency.counts)
+    return ret
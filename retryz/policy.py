@@ -0,0 +1,486 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import functools
+import types
+import weakref
+
+from retryz import state as _state
+from retryz.backoff import Backoff
+
+__author__ = 'Cedric Zhuang'
+
+_FUNCTION_TYPES = (types.FunctionType, types.MethodType, classmethod,
+                   staticmethod, functools.partial)
+
+
+def is_function(f):
+    return isinstance(f, _FUNCTION_TYPES)
+
+
+def is_number(value):
+    if isinstance(value, (int, float)):
+        return True
+    import numbers
+    return isinstance(value, numbers.Number)
+
+
+def get_inst(args):
+    if len(args) > 0:
+        inst = args[0]
+    else:
+        inst = None
+    return inst
+
+
+def _probe(f):
+    """ invoke by trial when the signature is not available. """
+
+    def invoke(func_args, *args):
+        try:
+            ret = f(*args)
+        except TypeError:
+            ret = f(get_inst(func_args), *args)
+        return ret
+
+    return invoke
+
+
+# what is learnt from the signature of each callback.  one callback is
+# usually shared by many decorated functions.
+_inspected = weakref.WeakKeyDictionary()
+
+
+def _inspect(f, key, compute):
+    """ `compute()` memoized by the callback `f` and `key`. """
+    try:
+        found = _inspected.get(f)
+    except TypeError:
+        # not hashable or not weakly referenceable
+        return compute()
+    if found is None:
+        found = _inspected.setdefault(f, {})
+    if key not in found:
+        found[key] = compute()
+    return found[key]
+
+
+def _needs_inst(f, sig, arg_count, **kwargs):
+    def compute():
+        placeholders = (None,) * arg_count
+        try:
+            sig.bind(*placeholders, **kwargs)
+            ret = False
+        except TypeError:
+            try:
+                sig.bind(None, *placeholders, **kwargs)
+                ret = True
+            except TypeError:
+                # let the call itself report the mismatch
+                ret = False
+        return ret
+
+    return _inspect(f, (arg_count, tuple(kwargs)), compute)
+
+
+def _has_signature():
+    import inspect
+    return getattr(inspect, 'signature', None) is not None
+
+
+def _signature(f):
+    def compute():
+        if not _has_signature():
+            return None
+        import inspect
+        try:
+            ret = inspect.signature(f)
+        except (TypeError, ValueError):
+            ret = None
+        return ret
+
+    return _inspect(f, 'signature', compute)
+
+
+def wants_state(f):
+    """ whether the callback declares a `state` parameter. """
+    if isinstance(f, (staticmethod, classmethod)):
+        f = f.__func__
+    sig = _signature(f)
+    return sig is not None and 'state' in sig.parameters
+
+
+def bind(f, arg_count):
+    """ resolve how to invoke the callback `f`.
+
+    The callback could be a function, a bound method, a function defined
+    in the class body which needs `self`, a classmethod, a staticmethod
+    or a partial.  The binding is decided once from the signature of the
+    callback.  A callback declaring a `state` parameter also receives
+    the `RetryState` of the call.
+
+    :param f: the callback.
+    :param arg_count: number of arguments supplied by `retry`.
+    :return: function `invoke(func_args, *args)`.  `func_args` are the
+        arguments of the decorated function.  The first of them is used
+        as `self` if the callback requires it.
+    """
+    with_state = wants_state(f)
+    if isinstance(f, staticmethod):
+        f = f.__func__
+    elif isinstance(f, classmethod):
+        func = f.__func__
+
+        def invoke(func_args, *args):
+            inst = get_inst(func_args)
+            if not isinstance(inst, type):
+                inst = type(inst)
+            if with_state:
+                return func(inst, *args, state=_state.current())
+            return func(inst, *args)
+
+        return invoke
+
+    if not _has_signature():
+        return _probe(f)
+    sig = _signature(f)
+
+    if with_state:
+        if _needs_inst(f, sig, arg_count, state=None):
+            def invoke(func_args, *args):
+                return f(get_inst(func_args), *args, state=_state.current())
+        else:
+            def invoke(_, *args):
+                return f(*args, state=_state.current())
+    elif sig is not None and _needs_inst(f, sig, arg_count):
+        def invoke(func_args, *args):
+            return f(get_inst(func_args), *args)
+    else:
+        def invoke(_, *args):
+            return f(*args)
+    return invoke
+
+
+# the callables compiled from constant options, shared by the policies
+_shared = {}
+_MAX_SHARED = 256
+
+
+def _share(key, build):
+    """ the callable built by `build()` for `key`, built once. """
+    try:
+        ret = _shared.get(key)
+    except TypeError:
+        # the option is not hashable
+        return build()
+    if ret is None:
+        ret = build()
+        if len(_shared) < _MAX_SHARED:
+            ret = _shared.setdefault(key, ret)
+    return ret
+
+
+def _constant(value):
+    def build():
+        def f(*_):
+            return value
+
+        return f
+
+    return _share(('constant', type(value), value), build)
+
+
+# the options of `retry` in the order of `RetryPolicy.__init__`
+_OPTIONS = ('on_error', 'on_return', 'limit', 'wait', 'timeout', 'on_retry',
+            'circuit_breaker', 'budget', 'listener', 'pool', 'hedge',
+            'clock', 'cache', 'resume', 'key', 'max_keys', 'max_in_flight')
+
+
+class RetryPolicy(object):
+    """ the options of `retry` compiled into callables.
+
+    The type of each option is checked once when the policy is built.
+    Each option is then replaced by a callable specialized for that type
+    so that the wrapper does no introspection when it is called.
+
+    * `get_limit(args)`: max number of tries.
+    * `get_timeout(args)`: timeout in seconds or `None`.
+    * `get_wait(args, retry_count, previous, outcome)`: seconds to wait
+      before the try.  `previous` is the last wait.  `outcome` is the error
+      or the return value of the last try.
+    * `check_return(args, ret)`: whether to retry on the return value.
+    * `check_error(args, err)`: whether to retry on the error.
+    * `call_retry_callback(args, retry_count)`: invoke `on_retry`.
+    * `get_resume(args, count, last)`: keyword arguments resuming a
+      generator after `count` items, `last` being the last one.  `None`
+      if `resume` is not specified.
+
+    `key`, `max_keys` and `max_in_flight` are kept as is, see
+    `retryz.keyed`.
+    """
+    __slots__ = ('on_error', 'on_return', 'limit', 'wait', 'timeout',
+                 'on_retry', 'circuit_breaker', 'budget', 'listener',
+                 'pool', 'hedge', 'clock', 'cache', 'retry_on_none',
+                 'record_outcome', 'use_state', 'resume', 'get_resume',
+                 'key', 'max_keys', 'max_in_flight',
+                 'get_limit', 'get_timeout', 'get_wait',
+                 'check_return', 'check_error', 'call_retry_callback')
+
+    def __init__(self, on_error=None, on_return=None,
+                 limit=None, wait=None, timeout=None, on_retry=None,
+                 circuit_breaker=None, budget=None, listener=None,
+                 pool=None, hedge=None, clock=None, cache=None,
+                 resume=None, key=None, max_keys=1024,
+                 max_in_flight=None):
+        if key is not None and not callable(key):
+            raise ValueError('key should be a function of the arguments '
+                             'and the keyword arguments of the call.')
+        if max_keys < 1:
+            raise ValueError('max_keys should be at least 1.')
+        if max_in_flight is not None and max_in_flight < 1:
+            raise ValueError('max_in_flight should be at least 1.')
+        self.on_error = on_error
+        self.on_return = on_return
+        self.limit = limit
+        self.wait = wait
+        self.timeout = timeout
+        self.on_retry = on_retry
+        self.circuit_breaker = circuit_breaker
+        self.budget = budget
+        self.listener = listener
+        if hedge is not None and pool is None:
+            pool = True
+        self.pool = self._resolve_pool(pool)
+        self.hedge = hedge
+        if clock is not None and self.pool is not None:
+            raise ValueError('pool and hedge wait in real time, they could '
+                             'not be used with a clock.')
+        self.clock = clock
+        self.cache = cache
+        if resume is not None and (self.pool is not None or
+                                   cache is not None):
+            raise ValueError('resume could not be used with pool, hedge '
+                             'or cache.')
+        self.resume = resume
+        self.key = key
+        self.max_keys = max_keys
+        self.max_in_flight = max_in_flight
+        # retry on return values if no error option is specified
+        self.retry_on_none = on_error is None
+        # create a `RetryState` for each call if a callback asks for it
+        self.use_state = any(
+            is_function(option) and wants_state(option)
+            for option in (on_error, on_return, limit, wait, timeout,
+                           on_retry))
+
+        self.get_limit = self._compile_limit(limit)
+        self.get_timeout = self._compile_timeout(timeout)
+        self.get_wait = self._compile_wait(wait)
+        # adaptive waits learn from the result of every try
+        if isinstance(wait, Backoff):
+            self.record_outcome = getattr(wait, 'record', None)
+        else:
+            self.record_outcome = None
+        self.check_return = self._compile_return(on_return)
+        self.check_error = self._compile_error(on_error)
+        self.call_retry_callback = self._compile_retry(on_retry)
+        self.get_resume = self._compile_resume(resume)
+
+    def options(self):
+        """ the options of `retry` as a dict. """
+        return {name: getattr(self, name) for name in _OPTIONS}
+
+    def __reduce__(self):
+        """ pickle the options only, they are compiled again. """
+        return RetryPolicy, tuple(getattr(self, name) for name in _OPTIONS)
+
+    def copy(self, fresh=False, **options):
+        """ a policy with the same options except the given ones.
+
+        :param fresh: whether the copy gets its own `circuit_breaker`,
+            `budget`, `hedge` and `Backoff` wait, starting from their
+            initial state like in another process.
+        """
+        values = self.options()
+        if fresh:
+            import copy
+            for name in ('circuit_breaker', 'budget', 'hedge'):
+                if values[name] is not None:
+                    values[name] = copy.copy(values[name])
+            if isinstance(values['wait'], Backoff):
+                values['wait'] = copy.copy(values['wait'])
+        values.update(options)
+        return RetryPolicy(**values)
+
+    @staticmethod
+    def _resolve_pool(pool):
+        if pool is True:
+            from retryz.pool import default_pool
+            pool = default_pool()
+        elif pool is False:
+            pool = None
+        return pool
+
+    @staticmethod
+    def _compile_limit(limit):
+        if limit is None:
+            ret = _constant(float('inf'))
+        elif is_number(limit):
+            ret = _constant(limit)
+        elif is_function(limit):
+            invoke = bind(limit, 0)
+
+            def ret(args):
+                value = invoke(args)
+                if value is None:
+                    raise ValueError('limit should be a number of'
+                                     'a callback with no parameter.')
+                return value
+        else:
+            raise ValueError('limit should be a number of'
+                             'a callback with no parameter.')
+        return ret
+
+    @staticmethod
+    def _compile_timeout(timeout):
+        if timeout is None:
+            ret = _constant(None)
+        elif is_number(timeout):
+            ret = _constant(timeout)
+        elif is_function(timeout):
+            ret = bind(timeout, 0)
+        else:
+            ret = _constant(None)
+        return ret
+
+    @staticmethod
+    def _compile_wait(wait):
+        if wait is None:
+            ret = _constant(0)
+        elif is_number(wait):
+            def build():
+                def f(_, retry_count, previous, outcome=None):
+                    if retry_count == 0:
+                        return 0
+                    return wait
+
+                return f
+
+            ret = _share(('wait', type(wait), wait), build)
+        elif isinstance(wait, Backoff) and wait.use_outcome:
+            compute = wait.compute
+
+            def ret(_, retry_count, previous, outcome=None):
+                if retry_count == 0:
+                    return 0
+                return compute(retry_count, previous, outcome)
+        elif isinstance(wait, Backoff):
+            compute = wait.compute
+
+            def ret(_, retry_count, previous, outcome=None):
+                if retry_count == 0:
+                    return 0
+                return compute(retry_count, previous)
+        elif is_function(wait):
+            invoke = bind(wait, 1)
+
+            def ret(args, retry_count, previous, outcome=None):
+                if retry_count == 0:
+                    return 0
+                value = invoke(args, retry_count)
+                if value is None:
+                    raise ValueError('wait should be a number or '
+                                     'a callback of try count.')
+                return value
+        else:
+            raise ValueError('wait should be a number or '
+                             'a callback of try count.')
+        return ret
+
+    def _compile_return(self, on_return):
+        retry_on_none = self.retry_on_none
+        if on_return is None:
+            ret = _constant(retry_on_none)
+        elif is_function(on_return):
+            invoke = bind(on_return, 1)
+
+            def ret(args, r):
+                value = invoke(args, r)
+                if value is None:
+                    value = retry_on_none
+                return value
+        else:
+            def build():
+                def f(_, r):
+                    return r == on_return
+
+                return f
+
+            ret = _share(('return', type(on_return), on_return), build)
+        return ret
+
+    @staticmethod
+    def _compile_error(on_error):
+        if on_error is None:
+            ret = _constant(False)
+        elif is_function(on_error):
+            ret = bind(on_error, 1)
+        else:
+            def build():
+                def f(_, err):
+                    return isinstance(err, on_error)
+
+                return f
+
+            ret = _share(('error', on_error), build)
+        return ret
+
+    @staticmethod
+    def _compile_retry(on_retry):
+        if on_retry is None:
+            ret = _constant(None)
+        elif is_function(on_retry):
+            invoke = bind(on_retry, 0)
+
+            def ret(args, retry_count):
+                if retry_count == 0:
+                    return None
+                return invoke(args)
+        else:
+            raise ValueError('on_retry should be a function accept two params:'
+                             ' value, retry_count.')
+        return ret
+
+    @staticmethod
+    def _compile_resume(resume):
+        if resume is None:
+            ret = None
+        elif isinstance(resume, str):
+            def ret(_, count, last):
+                return {resume: count}
+        elif is_function(resume):
+            invoke = bind(resume, 2)
+
+            def ret(args, count, last):
+                value = invoke(args, count, last)
+                if not isinstance(value, dict):
+                    raise ValueError('resume should return the keyword '
+                                     'arguments as a dict.')
+                return value
+        else:
+            raise ValueError('resume should be the name of a keyword '
+                             'argument or a callback of the count and the '
+                             'last item.')
+        return ret
@@ -0,0 +1,167 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+""" worker pool running the attempts of `retry(pool=...)`.
+
+Without a pool, `timeout` is only checked between the attempts, so a hung
+attempt could block far past the timeout.  With a pool, each attempt runs
+on a worker thread and the caller stops waiting for it at the deadline.
+The attempt itself could not be killed.  It keeps its worker until it
+returns and is reported as an overrun.
+"""
+import logging
+import threading
+from concurrent import futures
+
+from retryz.timer import monotonic
+
+try:
+    import contextvars
+except ImportError:
+    contextvars = None
+
+__author__ = 'Cedric Zhuang'
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 16
+
+
+def _new_executor(max_workers, thread_name_prefix):
+    try:
+        ret = futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+    except TypeError:
+        # python 3.4 and 3.5 do not name the threads
+        ret = futures.ThreadPoolExecutor(max_workers=max_workers)
+    return ret
+
+
+def _name(function):
+    return getattr(function, '__qualname__',
+                   getattr(function, '__name__', repr(function)))
+
+
+class AttemptPool(object):
+    """ bounded thread pool shared by the decorated functions.
+
+    The worker threads are created on demand, up to `max_workers`.
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS,
+                 thread_name_prefix='retryz-attempt'):
+        if max_workers < 1:
+            raise ValueError('max_workers should be at least 1.')
+        self.max_workers = max_workers
+        self.thread_name_prefix = thread_name_prefix
+        self._lock = threading.Lock()
+        self._executor = None
+        # attempts still running when the caller timed out
+        self.overruns = 0
+        # overrun attempts which have not returned yet
+        self.running_overruns = 0
+
+    def __reduce__(self):
+        # the threads are not copied, another process starts its own
+        if self is _default_pool:
+            return default_pool, ()
+        return AttemptPool, (self.max_workers, self.thread_name_prefix)
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = _new_executor(
+                        self.max_workers, self.thread_name_prefix)
+        return self._executor
+
+    @property
+    def thread_count(self):
+        if self._executor is None:
+            ret = 0
+        else:
+            ret = len(self._executor._threads)
+        return ret
+
+    def submit(self, function, args, kwargs):
+        """ run the attempt in the pool with the context of the caller. """
+        if contextvars is not None:
+            ctx = contextvars.copy_context()
+            ret = self.executor.submit(ctx.run, function, *args, **kwargs)
+        else:
+            ret = self.executor.submit(function, *args, **kwargs)
+        return ret
+
+    def wait(self, future, deadline, function=None):
+        """ wait for the attempt until the deadline.
+
+        :param future: future returned by `submit`.
+        :param deadline: deadline on the `monotonic` clock.  `None` to wait
+            until the attempt is done.
+        :param function: the function of the attempt, used in the log.
+        :return: `False` if the deadline is reached.  The attempt is then
+            abandoned.
+        """
+        if deadline is None:
+            timeout = None
+        else:
+            timeout = max(deadline - monotonic(), 0)
+        done, _ = futures.wait((future,), timeout=timeout)
+        if done:
+            ret = True
+        else:
+            self.abandon(future, function)
+            ret = False
+        return ret
+
+    def abandon(self, future, function=None):
+        """ stop waiting for the attempt. """
+        if future.cancel():
+            # not started yet, nothing is running
+            return
+        with self._lock:
+            self.overruns += 1
+            self.running_overruns += 1
+        abandoned_at = monotonic()
+
+        def done(_):
+            with self._lock:
+                self.running_overruns -= 1
+            log.warning('attempt of %s returned %.3f seconds after the '
+                        'retry deadline.', _name(function),
+                        monotonic() - abandoned_at)
+
+        future.add_done_callback(done)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+_default_pool = None
+_default_lock = threading.Lock()
+
+
+def default_pool():
+    """ the pool used by `retry(pool=True)`. """
+    global _default_pool
+    if _default_pool is None:
+        with _default_lock:
+            if _default_pool is None:
+                _default_pool = AttemptPool()
+    return _default_pool
@@ -0,0 +1,176 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+""" run a retried function in a process pool.
+
+.. code-block:: python
+
+    def render(page):
+        ...
+
+    with ProcessRetry(render, on_error=IOError, limit=3,
+                      budget=RetryBudget()) as runner:
+        images = runner.map(pages)
+        print(runner.report()['total'])
+
+The function and the `RetryPolicy` are pickled and the wrapper is built
+once in each worker.  The budget, the breaker and the metrics are
+pickled with their options only, so each worker keeps its own.  The
+metrics of the workers are merged by `report`.
+"""
+import os
+import uuid
+from concurrent import futures
+
+import retryz
+from retryz.metrics import DEFAULT_BOUNDS, RetryMetrics, merge_snapshots
+from retryz.policy import RetryPolicy
+
+__author__ = 'Cedric Zhuang'
+
+# wrappers built in this process, by token of the `ProcessRetry`
+_wrappers = {}
+
+
+def _get_wrapper(token, function, policy):
+    ret = _wrappers.get(token)
+    if ret is None:
+        if policy is None:
+            ret = function
+        else:
+            ret = retryz.wrap(function, policy)
+        _wrappers[token] = ret
+    return ret
+
+
+def _metrics_of(wrapper):
+    policy = getattr(wrapper, 'retry_policy', None)
+    if policy is not None and isinstance(policy.listener, RetryMetrics):
+        ret = policy.listener
+    else:
+        ret = None
+    return ret
+
+
+def _call(token, function, policy, item):
+    """ the task run in the worker. """
+    wrapper = _get_wrapper(token, function, policy)
+    result = None
+    error = None
+    try:
+        result = wrapper(item)
+    # noinspection PyBroadException
+    except Exception as e:
+        error = e
+    metrics = _metrics_of(wrapper)
+    if metrics is None:
+        snapshot = None
+    else:
+        snapshot = metrics.get(wrapper).snapshot()
+    return os.getpid(), result, error, snapshot
+
+
+class ProcessRetry(object):
+    """ run a function with retry on the items in a process pool.
+
+    :param function: a picklable function, or a function decorated by
+        `retry` at module level if no option is given.
+    :param max_workers: number of processes.
+    :param options: options of `retry`.  A `RetryMetrics` listener is
+        added if none is given.
+    """
+
+    def __init__(self, function, max_workers=None, mp_context=None,
+                 **options):
+        if options:
+            if hasattr(function, 'retry_policy'):
+                raise ValueError('{} is already retried, pass no option.'
+                                 .format(function.__name__))
+            options.setdefault('listener', RetryMetrics())
+            self.policy = RetryPolicy(**options)
+        else:
+            self.policy = None
+        self.function = function
+        self.max_workers = max_workers
+        self.mp_context = mp_context
+        self._token = uuid.uuid4().hex
+        self._executor = None
+        # pid -> latest metrics snapshot of the worker
+        self._snapshots = {}
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            kwargs = {}
+            if self.mp_context is not None:
+                kwargs['mp_context'] = self.mp_context
+            self._executor = futures.ProcessPoolExecutor(
+                max_workers=self.max_workers, **kwargs)
+        return self._executor
+
+    def map(self, items, return_exceptions=False):
+        """ results of the items, in order.
+
+        :param return_exceptions: if `True`, the error of an item is put
+            in the results.  Otherwise the first error is raised once all
+            the items are done.
+        """
+        tasks = [self.executor.submit(_call, self._token, self.function,
+                                      self.policy, item)
+                 for item in items]
+        results = []
+        first_error = None
+        for task in tasks:
+            pid, result, error, snapshot = task.result()
+            self._record(pid, snapshot)
+            if error is not None:
+                result = error
+                if first_error is None:
+                    first_error = error
+            results.append(result)
+        if first_error is not None and not return_exceptions:
+            raise first_error
+        return results
+
+    def _record(self, pid, snapshot):
+        if snapshot is None:
+            return
+        latest = self._snapshots.get(pid)
+        if latest is None or latest['calls'] <= snapshot['calls']:
+            self._snapshots[pid] = snapshot
+
+    def report(self):
+        """ metrics of each worker and their sum. """
+        metrics = _metrics_of(self.function)
+        if self.policy is not None:
+            metrics = self.policy.listener
+        if isinstance(metrics, RetryMetrics):
+            bounds = metrics.bounds
+        else:
+            bounds = DEFAULT_BOUNDS
+        workers = dict(self._snapshots)
+        return {'workers': workers,
+                'total': merge_snapshots(workers.values(), bounds)}
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.shutdown()
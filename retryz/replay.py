@@ -0,0 +1,481 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+""" record the tries of production calls and replay them offline.
+
+`ReplayRecorder` is a `RetryListener` appending one binary record per
+try to a ring buffer, in memory or in an mmap-backed file:
+
+.. code-block:: python
+
+    recorder = ReplayRecorder(path='/var/tmp/fetch.replay')
+
+    @retry(on_error=IOError, limit=3, wait=0.5, listener=recorder)
+    def fetch():
+        ...
+
+`replay` runs another set of `retry` options against the recorded calls
+in virtual time, to compare the latency and the number of tries before
+deploying them::
+
+    python -m retryz.replay /var/tmp/fetch.replay --limit 5 --wait 0.2
+
+Return values are not recorded, only whether the recorded call retried
+them.  When the candidate tries more than the recorded call did, the
+last recorded try is assumed to happen again.
+"""
+from __future__ import print_function
+
+import itertools
+import struct
+import threading
+
+from retryz.deadline import ContextVar
+from retryz.metrics import LatencyHistogram, RetryListener
+
+__author__ = 'Cedric Zhuang'
+
+MAGIC = b'RETRYZR1'
+# magic, record size, capacity, records written, bytes of names used
+HEADER = struct.Struct('<8sHIQI')
+# call id, function, attempt, outcome, flags, duration, wait before the try
+RECORD = struct.Struct('<IHHHBff')
+
+# flags of a record
+RETRIED = 1
+TIMED_OUT = 2
+
+# name of the outcome of the tries which returned
+RETURNED = 'return'
+UNKNOWN = 0xffff
+
+_calls = ContextVar('retryz_replay_calls', default=None)
+
+
+def _name(function):
+    return '{}.{}'.format(
+        getattr(function, '__module__', None),
+        getattr(function, '__qualname__',
+                getattr(function, '__name__', repr(function))))
+
+
+class _Call(object):
+    """ the call being recorded in the context. """
+    __slots__ = ('call_id', 'wait', 'index')
+
+    def __init__(self, call_id):
+        self.call_id = call_id
+        self.wait = 0.0
+        self.index = None
+
+
+class Record(object):
+    """ one try read from a replay log. """
+    __slots__ = ('call_id', 'function', 'attempt', 'outcome', 'flags',
+                 'duration', 'wait')
+
+    def __init__(self, call_id, function, attempt, outcome, flags,
+                 duration, wait):
+        self.call_id = call_id
+        self.function = function
+        self.attempt = attempt
+        self.outcome = outcome
+        self.flags = flags
+        self.duration = duration
+        self.wait = wait
+
+    @property
+    def returned(self):
+        return self.outcome == RETURNED
+
+    @property
+    def retried(self):
+        return bool(self.flags & RETRIED)
+
+    @property
+    def timed_out(self):
+        return bool(self.flags & TIMED_OUT)
+
+    def __repr__(self):
+        return ('Record(call_id={}, function={}, attempt={}, outcome={}, '
+                'flags={}, duration={:.6f}, wait={:.6f})'.format(
+                    self.call_id, self.function, self.attempt,
+                    self.outcome, self.flags, self.duration, self.wait))
+
+
+class ReplayRecorder(RetryListener):
+    """ listener appending the tries to a ring buffer.
+
+    The buffer holds a header, a table of the function and error class
+    names, and `capacity` records of `RECORD.size` bytes.  The oldest
+    records are overwritten when it's full.
+
+    :param capacity: max number of records kept.
+    :param path: file to map the buffer to.  It is created or truncated.
+        `None` to keep the buffer in memory, see `dump`.
+    :param names_size: bytes reserved for the names.  The names which
+        don't fit are recorded as unknown.
+    """
+
+    def __init__(self, capacity=65536, path=None, names_size=65536):
+        if capacity < 1:
+            raise ValueError('capacity should be at least 1.')
+        self.capacity = capacity
+        self.path = path
+        self.names_size = names_size
+        self._lock = threading.Lock()
+        self._call_ids = itertools.count(1)
+        self._names = {}
+        self._names_used = 0
+        self._written = 0
+        self._records_at = HEADER.size + names_size
+        size = self._records_at + capacity * RECORD.size
+        if path is None:
+            self._file = None
+            self.buffer = bytearray(size)
+        else:
+            import mmap
+            self._file = open(path, 'w+b')
+            self._file.truncate(size)
+            self.buffer = mmap.mmap(self._file.fileno(), size)
+        self._write_header()
+        self._name_id(RETURNED)
+
+    def __reduce__(self):
+        # a copy in another process records in memory from empty
+        return ReplayRecorder, (self.capacity, None, self.names_size)
+
+    @property
+    def written(self):
+        """ number of records written, including the overwritten ones. """
+        return self._written
+
+    def _write_header(self):
+        HEADER.pack_into(self.buffer, 0, MAGIC, RECORD.size, self.capacity,
+                         self._written, self._names_used)
+
+    def _name_id(self, name):
+        """ index of the name in the table.  Called with the lock. """
+        ret = self._names.get(name)
+        if ret is None:
+            data = name.encode('utf-8') + b'\n'
+            if (len(self._names) >= UNKNOWN or
+                    self._names_used + len(data) > self.names_size):
+                return UNKNOWN
+            at = HEADER.size + self._names_used
+            self.buffer[at:at + len(data)] = data
+            self._names_used += len(data)
+            ret = self._names[name] = len(self._names)
+        return ret
+
+    def _call(self, function):
+        calls = _calls.get()
+        if calls is None:
+            return None
+        return calls.get(function)
+
+    def attempt_start(self, function, attempt):
+        if attempt == 1:
+            # a new dict so that the tasks sharing the context don't see it
+            calls = dict(_calls.get() or {})
+            calls[function] = _Call(next(self._call_ids) & 0xffffffff)
+            _calls.set(calls)
+
+    def attempt_end(self, function, attempt, duration, error, result):
+        call = self._call(function)
+        if call is None:
+            return
+        if error is None:
+            outcome = RETURNED
+        else:
+            outcome = _name(type(error))
+        with self._lock:
+            index = self._written
+            offset = self._records_at + index % self.capacity * RECORD.size
+            RECORD.pack_into(self.buffer, offset, call.call_id,
+                             self._name_id(_name(function)),
+                             min(attempt, 0xffff), self._name_id(outcome),
+                             0, duration, call.wait)
+            self._written += 1
+            self._write_header()
+        call.index = index
+
+    def _flag(self, function, flag):
+        """ add the flag to the last record of the call. """
+        call = self._call(function)
+        if call is None or call.index is None:
+            return
+        with self._lock:
+            if self._written - call.index > self.capacity:
+                # overwritten
+                return
+            offset = (self._records_at +
+                      call.index % self.capacity * RECORD.size)
+            values = RECORD.unpack_from(self.buffer, offset)
+            RECORD.pack_into(self.buffer, offset, *(
+                values[:4] + (values[4] | flag,) + values[5:]))
+
+    def retry_scheduled(self, function, attempt, wait):
+        self._flag(function, RETRIED)
+        call = self._call(function)
+        if call is not None:
+            call.wait = wait
+
+    def give_up(self, function, attempt, error, result):
+        self._flag(function, RETRIED)
+
+    def timeout(self, function, attempt, elapsed):
+        self._flag(function, TIMED_OUT)
+
+    def dump(self, path):
+        """ write the buffer to a file which `ReplayLog.load` reads. """
+        with self._lock:
+            data = bytes(self.buffer)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def log(self):
+        """ the `ReplayLog` of what is recorded so far. """
+        with self._lock:
+            return ReplayLog(bytes(self.buffer))
+
+    def close(self):
+        if self._file is not None:
+            self.buffer.flush()
+            self.buffer.close()
+            self._file.close()
+            self._file = None
+
+
+class ReplayLog(object):
+    """ the records of a `ReplayRecorder` buffer, oldest first. """
+
+    def __init__(self, data):
+        magic, record_size, capacity, written, names_used = \
+            HEADER.unpack_from(data, 0)
+        if magic != MAGIC or record_size != RECORD.size:
+            raise ValueError('not a replay log of this version.')
+        at = HEADER.size
+        self.names = data[at:at + names_used].decode('utf-8').split('\n')
+        self.names.pop()
+        records_at = len(data) - capacity * RECORD.size
+        self.records = []
+        for index in range(max(written - capacity, 0), written):
+            offset = records_at + index % capacity * RECORD.size
+            values = RECORD.unpack_from(data, offset)
+            self.records.append(Record(
+                values[0], self._get_name(values[1]), values[2],
+                self._get_name(values[3]), values[4], values[5],
+                values[6]))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls(f.read())
+
+    def _get_name(self, index):
+        if index < len(self.names):
+            ret = self.names[index]
+        else:
+            ret = '<unknown>'
+        return ret
+
+    def functions(self):
+        return sorted(set(r.function for r in self.records))
+
+    def traces(self, function=None):
+        """ the records of each call, in the order of the calls.
+
+        The calls whose first tries are overwritten are skipped.
+        """
+        traces = {}
+        for record in self.records:
+            if function is None or record.function == function:
+                traces.setdefault(record.call_id, []).append(record)
+        return [trace for trace in traces.values()
+                if trace[0].attempt == 1]
+
+
+def _summary(latencies, attempts, failures, waits):
+    histogram = LatencyHistogram()
+    for latency in latencies:
+        histogram.record(latency)
+    return {'calls': len(latencies),
+            'attempts': attempts,
+            'failures': failures,
+            'latency': sum(latencies),
+            'latency_p50': histogram.percentile(50),
+            'latency_p99': histogram.percentile(99),
+            'wait': waits}
+
+
+def _failed(record):
+    return not record.returned or record.retried or record.timed_out
+
+
+def recorded(traces):
+    """ the summary of the recorded calls, see `replay`. """
+    latencies = []
+    attempts = 0
+    failures = 0
+    waits = 0.0
+    for trace in traces:
+        attempts += len(trace)
+        failures += _failed(trace[-1])
+        wait = sum(r.wait for r in trace)
+        waits += wait
+        latencies.append(sum(r.duration for r in trace) + wait)
+    return _summary(latencies, attempts, failures, waits)
+
+
+_classes = {}
+
+
+def error_class(name):
+    """ the exception class of a recorded name.
+
+    A sub-class of `Exception` with the same name is created if the class
+    could not be imported.
+    """
+    ret = _classes.get(name)
+    if ret is not None:
+        return ret
+    import importlib
+
+    parts = name.split('.')
+    for i in range(len(parts) - 1, 0, -1):
+        try:
+            ret = importlib.import_module('.'.join(parts[:i]))
+        except ImportError:
+            continue
+        try:
+            for part in parts[i:]:
+                ret = getattr(ret, part)
+        except AttributeError:
+            ret = None
+        break
+    if not (isinstance(ret, type) and issubclass(ret, BaseException)):
+        ret = type(parts[-1], (Exception,), {'__module__': parts[0]})
+    _classes[name] = ret
+    return ret
+
+
+def _raise(name):
+    cls = error_class(name)
+    # skip the __init__, its arguments are not recorded
+    raise cls.__new__(cls)
+
+
+class _Rejected(object):
+    """ value of a replayed try whose recorded return was retried. """
+
+    def __repr__(self):
+        return 'REJECTED'
+
+
+REJECTED = _Rejected()
+ACCEPTED = object()
+
+
+def replay(traces, clock=None, **options):
+    """ run the `retry` options against the recorded calls.
+
+    The calls are replayed one after another in virtual time.  Each try
+    takes its recorded duration, then raises an instance of the recorded
+    error class or returns `REJECTED` if the recorded call retried the
+    return value, `ACCEPTED` otherwise.  `on_return` is set to retry the
+    `REJECTED` values.
+
+    :param traces: the `ReplayLog.traces`.
+    :param clock: a `VirtualClock`.  Pass it if other options, like a
+        circuit breaker, should use the virtual time too.
+    :param options: options of `retry`, except `on_return` and `clock`.
+        `limit` or `timeout` should be specified since the failures of
+        the last recorded try happen again.
+    :return: dict of `calls`, `attempts` (the load of the backend),
+        `failures` (calls ending with an error or a rejected value),
+        `latency` (total seconds), `latency_p50`, `latency_p99` and
+        `wait` (total seconds waited).
+    """
+    from retryz import retry
+    from retryz.clock import VirtualClock
+
+    if options.get('limit') is None and options.get('timeout') is None:
+        raise ValueError('limit or timeout should be specified to replay.')
+    if clock is None:
+        clock = VirtualClock()
+    current = []
+
+    def attempt():
+        trace, tried = current
+        record = trace[min(tried, len(trace) - 1)]
+        current[1] += 1
+        clock.advance(record.duration)
+        if not record.returned:
+            _raise(record.outcome)
+        if record.retried or record.timed_out:
+            return REJECTED
+        return ACCEPTED
+
+    wrapped = retry(attempt, on_return=lambda r: r is REJECTED, clock=clock,
+                    **options)
+    latencies = []
+    attempts = 0
+    failures = 0
+    slept = clock.slept
+    for trace in traces:
+        current[:] = [trace, 0]
+        start = clock.now()
+        try:
+            failures += wrapped() is REJECTED
+        except Exception:
+            failures += 1
+        latencies.append(clock.now() - start)
+        attempts += current[1]
+    return _summary(latencies, attempts, failures, clock.slept - slept)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='compare retry options against a replay log.')
+    parser.add_argument('log', help='file of a ReplayRecorder.')
+    parser.add_argument('-f', '--function', help='replay this function '
+                        'only.  All the functions by default.')
+    parser.add_argument('--on-error', action='append', default=[],
+                        help='error class to retry, like builtins.OSError.'
+                             '  Could be repeated.')
+    parser.add_argument('--limit', type=int)
+    parser.add_argument('--wait', type=float)
+    parser.add_argument('--timeout', type=float)
+    args = parser.parse_args(argv)
+
+    log = ReplayLog.load(args.log)
+    traces = log.traces(args.function)
+    on_error = tuple(error_class(name) for name in args.on_error)
+    candidate = replay(traces, on_error=on_error or Exception,
+                       limit=args.limit, wait=args.wait,
+                       timeout=args.timeout)
+    baseline = recorded(traces)
+    print('{:<14} {:>14} {:>14}'.format('', 'recorded', 'candidate'))
+    for key in ('calls', 'attempts', 'failures', 'latency', 'latency_p50',
+                'latency_p99', 'wait'):
+        print('{:<14} {:>14.4g} {:>14.4g}'.format(
+            key, baseline[key] or 0, candidate[key] or 0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+""" state of a `retry` call, given to the callbacks asking for it.
+
+A callback declaring a parameter named `state` receives the `RetryState`
+of the call as that keyword argument:
+
+.. code-block:: python
+
+    def is_retryable(e, state):
+        return state.remaining is None or state.remaining > 1
+
+The state is only created for the policies having such a callback.
+"""
+from retryz.deadline import ContextVar
+from retryz.timer import monotonic
+
+__author__ = 'Cedric Zhuang'
+
+_current = ContextVar('retryz_state', default=None)
+
+
+def current():
+    """ the state of the innermost running `retry` call, or `None`. """
+    return _current.get()
+
+
+def enter(state):
+    return _current.set(state)
+
+
+def leave(token):
+    _current.reset(token)
+
+
+class RetryState(object):
+    """ one invocation of a retried function.
+
+    * `attempt`: number of tries started, 0 before the first one.
+    * `start`: time of the invocation on the clock of `retry`.
+    * `deadline`: the deadline on that clock, `None` if there is none.
+    * `last_error` and `last_result`: outcome of the last try.  While
+      `on_error` or `on_return` checks a try, they still hold the
+      outcome of the try before.
+    * `wait`: seconds waited before the current try.
+    """
+    __slots__ = ('function', 'args', 'kwargs', 'attempt', 'start',
+                 'deadline', 'last_error', 'last_result', 'wait', '_now')
+
+    def __init__(self, function, args, kwargs, deadline=None,
+                 now=monotonic):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.attempt = 0
+        self._now = now
+        self.start = now()
+        self.deadline = deadline
+        self.last_error = None
+        self.last_result = None
+        self.wait = 0
+
+    @property
+    def elapsed(self):
+        return self._now() - self.start
+
+    @property
+    def remaining(self):
+        """ seconds left before the deadline, `None` if there is none. """
+        if self.deadline is None:
+            return None
+        return max(self.deadline - self._now(), 0)
+
+    def __repr__(self):
+        return ('RetryState(function={}, attempt={}, elapsed={:.3f}, '
+                'last_error={!r})'.format(
+                    getattr(self.function, '__name__', self.function),
+                    self.attempt, self.elapsed, self.last_error))
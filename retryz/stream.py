@@ -0,0 +1,207 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+""" streaming retry of generators for `retry(resume=...)`.
+
+This module is only imported when `resume` is specified.
+"""
+import functools
+
+from retryz import _time_source, RetryTimeoutError
+from retryz import deadline as _deadline
+from retryz import state as _state
+from retryz.breaker import CircuitOpenError
+from retryz.metrics import CALLS, ATTEMPTS, RETRIES, GIVE_UPS, TIMEOUTS, \
+    FAILURES, WAIT_SECONDS
+from retryz.state import RetryState
+
+__author__ = 'Cedric Zhuang'
+
+
+def wrap(function, policy, stats):
+    """ build the generator wrapping a function returning an iterable.
+
+    The wrapper yields the items of the iterable, usually a generator.
+    When the call or the iteration raises an error accepted by
+    `on_error`, the function is called again with the keyword arguments
+    given by `resume`, and the items continue from there.  `limit`
+    counts the tries which failed before yielding anything, so a long
+    stream could recover from many errors.  The timeout covers the whole
+    stream and is checked before each retry.
+
+    A try succeeds for the circuit breaker and the budget when it yields
+    its first item or ends without error.
+    """
+    get_limit = policy.get_limit
+    get_timeout = policy.get_timeout
+    get_wait = policy.get_wait
+    check_error = policy.check_error
+    call_retry_callback = policy.call_retry_callback
+    get_resume = policy.get_resume
+    listener = policy.listener
+    breaker = policy.circuit_breaker
+    budget = policy.budget
+    record_outcome = policy.record_outcome
+    use_state = policy.use_state
+    now, new_check = _time_source(policy.clock)
+    stats_shard = stats.shard
+
+    def record(failed):
+        if breaker is not None:
+            breaker.record(failed)
+        if budget is not None:
+            budget.record(failed)
+        if record_outcome is not None:
+            record_outcome(failed)
+
+    @functools.wraps(function)
+    def func_wrapper(*args, **kwargs):
+        timeout_check = new_check()
+        # the state is only current while the wrapper runs, not in the
+        # consumer between the items
+        if use_state:
+            state = RetryState(function, args, kwargs, now=now)
+            state_token = _state.enter(state)
+        else:
+            state = None
+        count = 0
+        last = None
+        attempt = 0
+        # tries failed since the last item
+        failures = 0
+        to_wait = 0
+        waited = 0
+        # the error of the last try, for the adaptive waits
+        outcome = None
+        call_kwargs = kwargs
+        # the try has not succeeded or failed yet
+        pending = False
+        try:
+            max_try = get_limit(args)
+            # the deadline is not entered in the context: it would leak to
+            # the consumer between the items
+            timeout = get_timeout(args)
+            outer = _deadline.current()
+            if timeout is None:
+                deadline = outer
+            else:
+                deadline = now() + timeout
+                if outer is not None:
+                    deadline = min(deadline, outer)
+            if state is not None:
+                state.deadline = deadline
+            if deadline is not None:
+                timeout_check.start(deadline - now())
+            while True:
+                if attempt > 0:
+                    timeout_check.check_timeout()
+                    to_wait = get_wait(args, failures, to_wait, outcome)
+                    if state is not None:
+                        state.wait = to_wait
+                    if listener is not None:
+                        listener.retry_scheduled(function, attempt, to_wait)
+                    if to_wait > 0:
+                        waited += timeout_check.wait(to_wait)
+                        timeout_check.check_timeout()
+                    call_retry_callback(args, attempt)
+                    call_kwargs = dict(kwargs)
+                    call_kwargs.update(get_resume(args, count, last))
+                if breaker is not None:
+                    if breaker.is_open():
+                        raise CircuitOpenError('circuit breaker is open.')
+                    breaker.before_call()
+                pending = True
+                attempt += 1
+                if state is not None:
+                    state.attempt = attempt
+                if listener is not None:
+                    listener.attempt_start(function, attempt)
+                    started = now()
+                iterator = None
+                try:
+                    iterator = iter(function(*args, **call_kwargs))
+                    for item in iterator:
+                        if pending:
+                            pending = False
+                            record(False)
+                        failures = 0
+                        count += 1
+                        last = item
+                        if state is not None:
+                            state.last_result = item
+                            _state.leave(state_token)
+                            state_token = None
+                        yield item
+                        if state is not None:
+                            state_token = _state.enter(state)
+                    if pending:
+                        pending = False
+                        record(False)
+                    if listener is not None:
+                        listener.attempt_end(function, attempt,
+                                             now() - started, None, count)
+                    return
+                # noinspection PyBroadException
+                except Exception as e:
+                    if listener is not None:
+                        listener.attempt_end(function, attempt,
+                                             now() - started, e, None)
+                    failures += 1
+                    need_retry = check_error(args, e)
+                    pending = False
+                    record(need_retry)
+                    outcome = e
+                    if state is not None:
+                        state.last_error = e
+                    if not need_retry:
+                        raise
+                    if failures >= max_try or (budget is not None and
+                                               not budget.withdraw()):
+                        stats_shard()[GIVE_UPS] += 1
+                        if listener is not None:
+                            listener.give_up(function, attempt, e, None)
+                        raise
+                finally:
+                    close = getattr(iterator, 'close', None)
+                    if close is not None:
+                        close()
+        except RetryTimeoutError:
+            shard = stats_shard()
+            shard[FAILURES] += 1
+            if timeout_check.is_expired():
+                shard[TIMEOUTS] += 1
+            raise
+        except Exception:
+            stats_shard()[FAILURES] += 1
+            raise
+        finally:
+            if pending and breaker is not None:
+                # closed by the consumer before the first item
+                breaker.release()
+            if state is not None and state_token is not None:
+                _state.leave(state_token)
+            shard = stats_shard()
+            shard[CALLS] += 1
+            shard[ATTEMPTS] += attempt
+            if attempt > 1:
+                shard[RETRIES] += attempt - 1
+            if waited:
+                shard[WAIT_SECONDS] += waited
+
+    # functools.wraps does not set it on python 2
+    func_wrapper.__wrapped__ = function
+    func_wrapper.retry_policy = policy
+    func_wrapper.retry_stats = stats
+    return func_wrapper
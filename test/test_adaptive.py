@@ -0,0 +1,189 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+from email.utils import formatdate
+import time
+from unittest import TestCase
+
+from hamcrest import assert_that, equal_to, raises, close_to, none, \
+    greater_than, less_than
+
+from retryz import retry, backoff
+from retryz.adaptive import Adaptive, retry_after
+
+__author__ = 'Cedric Zhuang'
+
+
+class Throttled(IOError):
+    def __init__(self, retry_after=None, headers=None):
+        super(Throttled, self).__init__('throttled')
+        self.retry_after = retry_after
+        if headers is not None:
+            self.headers = headers
+
+
+class Response(object):
+    def __init__(self, headers):
+        self.headers = headers
+
+
+class HttpError(IOError):
+    def __init__(self, headers):
+        super(HttpError, self).__init__('http error')
+        self.response = Response(headers)
+
+
+class RetryAfterTest(TestCase):
+    def test_attribute(self):
+        assert_that(retry_after(Throttled(retry_after=3)), equal_to(3))
+
+    def test_header_seconds(self):
+        e = Throttled(headers={'Retry-After': '2'})
+        assert_that(retry_after(e), equal_to(2))
+
+    def test_response_header(self):
+        e = HttpError({'Retry-After': '1.5'})
+        assert_that(retry_after(e), equal_to(1.5))
+
+    def test_header_date(self):
+        date = formatdate(time.time() + 30, usegmt=True)
+        e = HttpError({'Retry-After': date})
+        assert_that(retry_after(e), close_to(30, 2))
+
+    def test_past_date(self):
+        date = formatdate(time.time() - 30, usegmt=True)
+        assert_that(retry_after(HttpError({'Retry-After': date})),
+                    equal_to(0))
+
+    def test_no_hint(self):
+        assert_that(retry_after(IOError()), none())
+        assert_that(retry_after(HttpError({})), none())
+        assert_that(retry_after(HttpError({'Retry-After': 'soon'})),
+                    none())
+        assert_that(retry_after(None), none())
+
+
+class AdaptiveTest(TestCase):
+    def test_no_history(self):
+        wait = Adaptive(backoff.Constant(1))
+        assert_that(wait.failure_rate(), none())
+        assert_that(wait.compute(1, 0), equal_to(1))
+
+    def test_stretch(self):
+        wait = Adaptive(backoff.Constant(1), shrink=0.5, stretch=4)
+        for _ in range(10):
+            wait.record(True)
+        assert_that(wait.failure_rate(), equal_to(1))
+        assert_that(wait.compute(1, 0), equal_to(4))
+
+    def test_shrink(self):
+        wait = Adaptive(backoff.Constant(1), shrink=0.5, stretch=4)
+        for _ in range(10):
+            wait.record(False)
+        assert_that(wait.compute(1, 0), equal_to(0.5))
+
+    def test_recent_weighs_more(self):
+        wait = Adaptive(backoff.Constant(1), window=8, decay=0.5)
+        for _ in range(4):
+            wait.record(True)
+        for _ in range(4):
+            wait.record(False)
+        assert_that(wait.failure_rate(), less_than(0.1))
+        for _ in range(2):
+            wait.record(True)
+        assert_that(wait.failure_rate(), greater_than(0.7))
+
+    def test_ring_buffer(self):
+        wait = Adaptive(window=4, decay=1)
+        for _ in range(100):
+            wait.record(True)
+        for _ in range(4):
+            wait.record(False)
+        assert_that(wait.failure_rate(), equal_to(0))
+
+    def test_cap(self):
+        wait = Adaptive(backoff.Constant(5), stretch=4, cap=8)
+        wait.record(True)
+        assert_that(wait.compute(1, 0), equal_to(8))
+        assert_that(wait.compute(1, 0, Throttled(retry_after=60)),
+                    equal_to(8))
+
+    def test_hint(self):
+        wait = Adaptive(backoff.Constant(5))
+        assert_that(wait.compute(1, 0, Throttled(retry_after=0.2)),
+                    equal_to(0.2))
+        assert_that(wait.compute(1, 0, IOError()), equal_to(5))
+
+    def test_custom_hint(self):
+        wait = Adaptive(backoff.Constant(5),
+                        hint=lambda r: r.get('reset_in'))
+        assert_that(wait.compute(1, 0, {'reset_in': 2}), equal_to(2))
+        assert_that(wait.compute(1, 0, {}), equal_to(5))
+
+    def test_invalid(self):
+        assert_that(lambda: Adaptive(window=0), raises(ValueError))
+        assert_that(lambda: Adaptive(decay=0), raises(ValueError))
+
+    def test_retry_uses_hint(self):
+        waits = []
+        errors = [Throttled(retry_after=0.01), Throttled(retry_after=0.02)]
+
+        class Recorder(Adaptive):
+            __slots__ = ()
+
+            def compute(self, tried, previous, outcome=None):
+                ret = super(Recorder, self).compute(tried, previous, outcome)
+                waits.append(ret)
+                return ret
+
+        @retry(on_error=IOError, limit=3, wait=Recorder(backoff.Constant(5)))
+        def f():
+            if errors:
+                raise errors.pop(0)
+            return 'ok'
+
+        assert_that(f(), equal_to('ok'))
+        assert_that(waits, equal_to([0.01, 0.02]))
+
+    def test_retry_records_outcomes(self):
+        wait = Adaptive(backoff.Constant(0))
+        calls = []
+
+        @retry(on_return=lambda r: r < 2, wait=wait)
+        def f():
+            calls.append(1)
+            return len(calls)
+
+        assert_that(f(), equal_to(2))
+        assert_that(wait.failure_rate(), close_to(0.9 / 1.9, 0.001))
+
+    def test_outcome_backoff(self):
+        class FromResult(backoff.Backoff):
+            use_outcome = True
+
+            def compute(self, tried, previous, outcome=None):
+                return outcome.get('wait', 0)
+
+        tries = []
+
+        @retry(on_return=lambda r: 'wait' in r, limit=3, wait=FromResult())
+        def f():
+            tries.append(time.time())
+            if len(tries) == 1:
+                return {'wait': 0.05}
+            return {}
+
+        f()
+        assert_that(tries[1] - tries[0], greater_than(0.04))
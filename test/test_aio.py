@@ -0,0 +1,372 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import asyncio
+import functools
+import threading
+import time
+from unittest import TestCase
+
+from hamcrest import assert_that, equal_to, raises, less_than, \
+    less_than_or_equal_to
+
+from retryz import retry, RetryTimeoutError, Hedge, ResultCache, \
+    KeyBusyError, _is_coroutine_function, CircuitBreaker
+from retryz.breaker import CLOSED, OPEN, HALF_OPEN
+from retryz.clock import VirtualClock
+from test.test_breaker import FakeClock, Backend
+from test.test_metrics import Flaky
+from test.test_keyed import Backends, first_arg
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class AsyncRetryDemo(object):
+    def __init__(self):
+        self.call_count = 0
+        self.retry_count = 0
+
+    async def _is_value_error(self, e):
+        await asyncio.sleep(0)
+        return isinstance(e, ValueError)
+
+    async def _on_retry(self):
+        self.retry_count += 1
+
+    @retry(on_error=ValueError)
+    async def on_error(self):
+        self.call_count += 1
+        await asyncio.sleep(0)
+        if self.call_count <= 3:
+            raise ValueError()
+        return self.call_count
+
+    @retry(on_error=_is_value_error, on_retry=_on_retry, limit=5)
+    async def async_callbacks(self):
+        self.call_count += 1
+        raise ValueError()
+
+    @retry(on_return=lambda x: x < 3)
+    async def on_return(self):
+        self.call_count += 1
+        return self.call_count
+
+    @retry(on_return=True, wait=100, timeout=0.05)
+    async def timeout(self):
+        self.call_count += 1
+        return True
+
+
+class AsyncRetryTest(TestCase):
+    def test_is_coroutine_function(self):
+        assert_that(asyncio.iscoroutinefunction(AsyncRetryDemo.on_error),
+                    equal_to(True))
+
+    def test_detect_coroutine_function(self):
+        async def f(x):
+            return x
+
+        class Demo(object):
+            async def method(self):
+                pass
+
+        assert_that(_is_coroutine_function(f), equal_to(True))
+        assert_that(_is_coroutine_function(functools.partial(f, 1)),
+                    equal_to(True))
+        assert_that(_is_coroutine_function(Demo().method), equal_to(True))
+
+    def test_on_error(self):
+        demo = AsyncRetryDemo()
+        assert_that(run(demo.on_error()), equal_to(4))
+
+    def test_async_callbacks(self):
+        demo = AsyncRetryDemo()
+
+        def f():
+            run(demo.async_callbacks())
+
+        assert_that(f, raises(ValueError))
+        assert_that(demo.call_count, equal_to(5))
+        assert_that(demo.retry_count, equal_to(4))
+
+    def test_on_return(self):
+        demo = AsyncRetryDemo()
+        assert_that(run(demo.on_return()), equal_to(3))
+
+    def test_async_wait_callback(self):
+        async def wait(tried):
+            return 0.001
+
+        @retry(on_return=lambda x: x < 3, wait=wait)
+        async def f():
+            f.count += 1
+            return f.count
+
+        f.count = 0
+        assert_that(run(f()), equal_to(3))
+
+    def test_timeout_cancels_sleep(self):
+        demo = AsyncRetryDemo()
+        start = time.time()
+
+        def f():
+            run(demo.timeout())
+
+        assert_that(f, raises(RetryTimeoutError))
+        assert_that(time.time() - start, less_than(1))
+        assert_that(demo.call_count, equal_to(1))
+
+    def test_inner_inherits_outer_deadline(self):
+        @retry(on_return=True, wait=0.5, timeout=10)
+        async def inner():
+            return True
+
+        @retry(on_error=ValueError, timeout=0.1)
+        async def outer():
+            return await inner()
+
+        start = time.time()
+        assert_that(lambda: run(outer()), raises(RetryTimeoutError))
+        assert_that(time.time() - start, less_than(1))
+
+    def test_concurrent_without_threads(self):
+        @retry(on_error=ValueError, wait=0.001, timeout=60)
+        async def f(i):
+            f.calls[i] = f.calls.get(i, 0) + 1
+            if f.calls[i] < 3:
+                raise ValueError()
+            return threading.active_count()
+
+        f.calls = {}
+
+        async def main():
+            return await asyncio.gather(*[f(i) for i in range(1000)])
+
+        before = threading.active_count()
+        counts = run(main())
+        assert_that(max(counts), less_than_or_equal_to(before))
+        assert_that(sum(f.calls.values()), equal_to(3000))
+
+    def test_interrupt_attempt(self):
+        @retry(on_error=ValueError, timeout=0.05, pool=True)
+        async def f():
+            await asyncio.sleep(10)
+
+        start = time.time()
+        assert_that(lambda: run(f()), raises(RetryTimeoutError))
+        assert_that(time.time() - start, less_than(1))
+
+    def test_hedge(self):
+        hedge = Hedge(delay=0.01)
+
+        @retry(on_error=ValueError, hedge=hedge)
+        async def f():
+            f.calls += 1
+            call = f.calls
+            if call == 1:
+                await asyncio.sleep(10)
+            return call
+
+        f.calls = 0
+        start = time.time()
+        assert_that(run(f()), equal_to(2))
+        assert_that(time.time() - start, less_than(1))
+        assert_that(hedge.won, equal_to(1))
+
+    def test_virtual_clock(self):
+        clock = VirtualClock()
+
+        @retry(on_error=ValueError, wait=10, timeout=35, clock=clock)
+        async def f():
+            f.calls += 1
+            raise ValueError()
+
+        f.calls = 0
+        start = time.time()
+        assert_that(lambda: run(f()), raises(RetryTimeoutError))
+        assert_that(time.time() - start, less_than(1))
+        assert_that(f.calls, equal_to(4))
+        assert_that(clock.now(), equal_to(35))
+
+    def test_async_sleeper(self):
+        class AsyncClock(VirtualClock):
+            async def sleep(self, seconds):
+                await asyncio.sleep(0)
+                super(AsyncClock, self).sleep(seconds)
+
+        clock = AsyncClock()
+
+        @retry(on_error=ValueError, limit=3, wait=5, clock=clock)
+        async def f():
+            raise ValueError()
+
+        assert_that(lambda: run(f()), raises(ValueError))
+        assert_that(clock.slept, equal_to(10))
+
+    def test_cache_single_flight(self):
+        cache = ResultCache()
+
+        @retry(on_error=ValueError, cache=cache)
+        async def f(key):
+            f.calls += 1
+            await asyncio.sleep(0.01)
+            return key
+
+        async def main():
+            ret = await asyncio.gather(*[f('k') for _ in range(5)])
+            ret.append(await f('k'))
+            return ret
+
+        f.calls = 0
+        assert_that(run(main()), equal_to(['k'] * 6))
+        assert_that(f.calls, equal_to(1))
+        assert_that(cache.coalesced, equal_to(4))
+        assert_that(cache.hits, equal_to(1))
+
+    def test_cache_leader_cancelled(self):
+        cache = ResultCache()
+
+        @retry(on_error=ValueError, cache=cache)
+        async def f(key):
+            f.calls += 1
+            await asyncio.sleep(0.05)
+            return key
+
+        async def main():
+            first = asyncio.ensure_future(f('k'))
+            await asyncio.sleep(0)
+            second = asyncio.ensure_future(f('k'))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            try:
+                await first
+            except asyncio.CancelledError:
+                pass
+            return first.cancelled(), await second
+
+        f.calls = 0
+        assert_that(run(main()), equal_to((True, 'k')))
+        assert_that(f.calls, equal_to(1))
+
+    def test_cache_rejected(self):
+        @retry(on_return=lambda x: x is None, limit=2, cache=ResultCache())
+        async def f():
+            f.calls += 1
+
+        f.calls = 0
+        run(f())
+        run(f())
+        assert_that(f.calls, equal_to(4))
+
+    def test_state(self):
+        attempts = []
+
+        async def on_error(e, state):
+            await asyncio.sleep(0)
+            attempts.append(state.attempt)
+            return state.attempt < 3
+
+        @retry(on_error=on_error)
+        async def f():
+            raise ValueError()
+
+        assert_that(lambda: run(f()), raises(ValueError))
+        assert_that(attempts, equal_to([1, 2, 3]))
+
+
+class AsyncKeyedTest(TestCase):
+    def test_per_key(self):
+        backends = Backends(down=['bad'])
+
+        @retry(on_error=IOError, limit=2, key=first_arg)
+        async def f(host):
+            return backends.call(host)
+
+        assert_that(_is_coroutine_function(f), equal_to(True))
+        assert_that(run(f('good')), equal_to('good'))
+        assert_that(lambda: run(f('bad')), raises(IOError))
+        assert_that(backends.calls['bad'], equal_to(2))
+        assert_that(len(f.retry_keys), equal_to(2))
+
+    def test_max_in_flight(self):
+        @retry(on_error=IOError, key=first_arg, max_in_flight=1)
+        async def f(host, event):
+            await event.wait()
+            return host
+
+        async def calls():
+            event = asyncio.Event()
+            first = asyncio.ensure_future(f('a', event))
+            await asyncio.sleep(0)
+            try:
+                await f('a', event)
+            except KeyBusyError:
+                busy = True
+            else:
+                busy = False
+            event.set()
+            return busy, await first, await f('a', event)
+
+        assert_that(_is_coroutine_function(f), equal_to(True))
+        assert_that(run(calls()), equal_to((True, 'a', 'a')))
+
+
+class AsyncCircuitBreakerTest(TestCase):
+    def test_cancelled_releases_trial(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=10,
+                                 clock=clock)
+        backend = Backend()
+
+        @retry(on_error=IOError, limit=1, circuit_breaker=breaker)
+        async def f():
+            if backend.slow:
+                await asyncio.sleep(10)
+            return backend.check()
+
+        async def cancel():
+            backend.slow = True
+            task = asyncio.ensure_future(f())
+            await asyncio.sleep(0.01)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            backend.slow = False
+
+        assert_that(lambda: run(f()), raises(IOError))
+        assert_that(breaker.state, equal_to(OPEN))
+        clock.now += 10
+        run(cancel())
+        assert_that(breaker.state, equal_to(HALF_OPEN))
+
+        backend.down = False
+        assert_that(run(f()), equal_to('ok'))
+        assert_that(breaker.state, equal_to(CLOSED))
+
+
+class AsyncRetryStatsTest(TestCase):
+    def test_counts(self):
+        flaky = Flaky(1)
+
+        @retry(on_error=ValueError, limit=2)
+        async def f():
+            return flaky()
+
+        assert_that(run(f()), equal_to(1))
+        assert_that(f.retry_stats()['retries'], equal_to(1))
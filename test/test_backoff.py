@@ -0,0 +1,104 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+from unittest import TestCase
+
+from hamcrest import assert_that, equal_to, raises, less_than_or_equal_to, \
+    greater_than_or_equal_to, close_to
+
+from retryz import retry, backoff
+
+
+class BackoffDemo(object):
+    def __init__(self):
+        self.waits = []
+
+    @retry(on_return=lambda x: x < 4, wait=backoff.Constant(0.001))
+    def constant(self):
+        self.waits.append(None)
+        return len(self.waits)
+
+
+class BackoffTest(TestCase):
+    def test_constant(self):
+        strategy = backoff.Constant(2, cap=1)
+        assert_that(strategy(1), equal_to(1))
+        assert_that(strategy(100), equal_to(1))
+
+    def test_linear(self):
+        strategy = backoff.Linear(1, 2, cap=6)
+        assert_that([strategy(i) for i in range(1, 6)],
+                    equal_to([1, 3, 5, 6, 6]))
+
+    def test_exponential(self):
+        strategy = backoff.Exponential(0.5, cap=5)
+        assert_that([strategy(i) for i in range(1, 7)],
+                    equal_to([0.5, 1, 2, 4, 5, 5]))
+
+    def test_exponential_no_overflow(self):
+        strategy = backoff.Exponential(1.5, factor=10)
+        assert_that(strategy(10 ** 6), equal_to(float('inf')))
+        capped = backoff.Exponential(1.5, factor=10, cap=60)
+        assert_that(capped(10 ** 6), equal_to(60))
+
+    def test_full_jitter(self):
+        strategy = backoff.FullJitter(1, cap=8, rand=lambda: 0.5)
+        assert_that([strategy(i) for i in range(1, 6)],
+                    equal_to([0.5, 1, 2, 4, 4]))
+
+    def test_full_jitter_range(self):
+        strategy = backoff.FullJitter(1, cap=8)
+        for i in range(1, 100):
+            wait = strategy(i)
+            assert_that(wait, greater_than_or_equal_to(0))
+            assert_that(wait, less_than_or_equal_to(8))
+
+    def test_equal_jitter(self):
+        strategy = backoff.EqualJitter(2, cap=8, rand=lambda: 0.5)
+        assert_that(strategy(1), close_to(1.5, 1e-9))
+        assert_that(strategy(10), close_to(6, 1e-9))
+
+    def test_decorrelated_jitter(self):
+        strategy = backoff.DecorrelatedJitter(1, cap=10, rand=lambda: 1)
+        assert_that(strategy(1, 0), equal_to(3))
+        assert_that(strategy(2, 3), equal_to(9))
+        assert_that(strategy(3, 9), equal_to(10))
+        low = backoff.DecorrelatedJitter(1, cap=10, rand=lambda: 0)
+        assert_that(low(3, 9), equal_to(1))
+
+    def test_invalid(self):
+        assert_that(lambda: backoff.Exponential(0),
+                    raises(ValueError, 'base should be positive'))
+        assert_that(lambda: backoff.Constant(1, cap=-1),
+                    raises(ValueError, 'cap should not be negative'))
+
+    def test_retry_wait(self):
+        demo = BackoffDemo()
+        assert_that(demo.constant(), equal_to(4))
+
+    def test_retry_previous_wait(self):
+        waits = []
+
+        class Recorder(backoff.Backoff):
+            def compute(self, tried, previous):
+                waits.append(previous)
+                return tried * 0.001
+
+        @retry(limit=4, wait=Recorder())
+        def f():
+            pass
+
+        f()
+        assert_that(waits, equal_to([0, 0.001, 0.002]))
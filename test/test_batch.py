@@ -0,0 +1,142 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import time
+from unittest import TestCase
+
+from hamcrest import assert_that, equal_to, raises, instance_of, less_than
+
+from retryz import retry_batch, RetryTimeoutError
+
+__author__ = 'Cedric Zhuang'
+
+
+class BulkService(object):
+    def __init__(self, failures=None):
+        # item -> number of times it fails
+        self.failures = dict(failures or {})
+        self.sent = []
+
+    def _put(self, items):
+        self.sent.append(list(items))
+        ret = []
+        for item in items:
+            if self.failures.get(item, 0) > 0:
+                self.failures[item] -= 1
+                ret.append(IOError('failed {}'.format(item)))
+            else:
+                ret.append(item * 10)
+        return ret
+
+    put = retry_batch(_put, on_error=IOError, limit=3)
+
+
+class RetryBatchTest(TestCase):
+    def test_resend_failed_only(self):
+        service = BulkService({3: 1, 7: 2})
+        ret = service.put(range(10))
+        assert_that(ret, equal_to([i * 10 for i in range(10)]))
+        assert_that(service.sent, equal_to([list(range(10)), [3, 7], [7]]))
+
+    def test_all_succeed(self):
+        service = BulkService()
+        assert_that(service.put([1, 2]), equal_to([10, 20]))
+        assert_that(len(service.sent), equal_to(1))
+
+    def test_limit_keeps_last_result(self):
+        service = BulkService({2: 5})
+        ret = service.put([1, 2, 3])
+        assert_that(ret[0], equal_to(10))
+        assert_that(ret[1], instance_of(IOError))
+        assert_that(ret[2], equal_to(30))
+        assert_that(service.sent, equal_to([[1, 2, 3], [2], [2]]))
+
+    def test_error_not_retried(self):
+        sent = []
+
+        @retry_batch(on_error=IOError, limit=3)
+        def put(items):
+            sent.append(items)
+            return [ValueError() if i == 1 else i for i in items]
+
+        ret = put([0, 1])
+        assert_that(ret[1], instance_of(ValueError))
+        assert_that(len(sent), equal_to(1))
+
+    def test_on_return(self):
+        sent = []
+
+        @retry_batch(on_return=lambda r: r == 'busy', limit=3)
+        def put(items):
+            sent.append(items)
+            if len(sent) == 1:
+                return ['ok', 'busy', 'ok']
+            return ['done' for _ in items]
+
+        assert_that(put(['a', 'b', 'c']), equal_to(['ok', 'done', 'ok']))
+        assert_that(sent, equal_to([['a', 'b', 'c'], ['b']]))
+
+    def test_whole_batch_error(self):
+        sent = []
+
+        @retry_batch(on_error=IOError, limit=3)
+        def put(items):
+            sent.append(items)
+            if len(sent) == 1:
+                raise IOError()
+            return items
+
+        assert_that(put([1, 2]), equal_to([1, 2]))
+        assert_that(sent, equal_to([[1, 2], [1, 2]]))
+
+    def test_whole_batch_error_limit(self):
+        def put(items):
+            raise IOError()
+
+        f = retry_batch(put, on_error=IOError, limit=2)
+        assert_that(lambda: f([1]), raises(IOError))
+
+    def test_leading_arguments(self):
+        @retry_batch(on_error=IOError, limit=2)
+        def put(prefix, items, suffix=''):
+            return [prefix + i + suffix for i in items]
+
+        assert_that(put('<', ['a', 'b'], suffix='>'),
+                    equal_to(['<a>', '<b>']))
+
+    def test_result_count_mismatch(self):
+        f = retry_batch(lambda items: [], on_error=IOError)
+        assert_that(lambda: f([1]), raises(ValueError))
+
+    def test_no_batch(self):
+        f = retry_batch(lambda: [], on_error=IOError)
+        assert_that(f, raises(TypeError))
+
+    def test_wait_and_timeout(self):
+        def put(items):
+            return [IOError() for _ in items]
+
+        f = retry_batch(put, on_error=IOError, wait=1, timeout=0.1)
+        start = time.time()
+        assert_that(lambda: f([1]), raises(RetryTimeoutError))
+        assert_that(time.time() - start, less_than(0.5))
+
+    def test_on_retry(self):
+        retried = []
+        service = BulkService({1: 2})
+        f = retry_batch(BulkService._put, on_error=IOError, limit=5,
+                        on_retry=lambda: retried.append(1))
+        assert_that(f(service, [1]), equal_to([10]))
+        assert_that(len(retried), equal_to(2))
@@ -0,0 +1,237 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import threading
+import time
+from unittest import TestCase
+
+from hamcrest import assert_that, equal_to, raises, less_than, \
+    greater_than_or_equal_to
+
+from retryz import retry, CircuitBreaker, CircuitOpenError, \
+    RetryTimeoutError
+from retryz.pool import AttemptPool
+from retryz.breaker import CLOSED, OPEN, HALF_OPEN
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def p99(durations):
+    durations = sorted(durations)
+    return durations[int(len(durations) * 0.99) - 1]
+
+
+class CircuitBreakerTest(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(failure_threshold=2,
+                                      recovery_timeout=10,
+                                      clock=self.clock)
+
+    def test_open_after_threshold(self):
+        self.breaker.on_failure()
+        assert_that(self.breaker.state, equal_to(CLOSED))
+        self.breaker.on_failure()
+        assert_that(self.breaker.state, equal_to(OPEN))
+        assert_that(self.breaker.before_call, raises(CircuitOpenError))
+
+    def test_success_resets_failures(self):
+        self.breaker.on_failure()
+        self.breaker.on_success()
+        self.breaker.on_failure()
+        assert_that(self.breaker.state, equal_to(CLOSED))
+
+    def test_half_open_success(self):
+        self.breaker.on_failure()
+        self.breaker.on_failure()
+        self.clock.now = 10
+        assert_that(self.breaker.state, equal_to(HALF_OPEN))
+        self.breaker.before_call()
+        assert_that(self.breaker.before_call,
+                    raises(CircuitOpenError, 'half-open'))
+        self.breaker.on_success()
+        assert_that(self.breaker.state, equal_to(CLOSED))
+
+    def test_half_open_failure(self):
+        self.breaker.on_failure()
+        self.breaker.on_failure()
+        self.clock.now = 10
+        self.breaker.before_call()
+        self.breaker.on_failure()
+        assert_that(self.breaker.state, equal_to(OPEN))
+        self.clock.now = 15
+        assert_that(self.breaker.before_call, raises(CircuitOpenError))
+
+    def test_half_open_release(self):
+        self.breaker.on_failure()
+        self.breaker.on_failure()
+        self.clock.now = 10
+        self.breaker.before_call()
+        self.breaker.release()
+        assert_that(self.breaker.state, equal_to(HALF_OPEN))
+        self.breaker.before_call()
+        assert_that(self.breaker.before_call,
+                    raises(CircuitOpenError, 'half-open'))
+
+    def test_reset(self):
+        self.breaker.on_failure()
+        self.breaker.on_failure()
+        self.breaker.reset()
+        assert_that(self.breaker.state, equal_to(CLOSED))
+
+
+class RetryCircuitBreakerTest(TestCase):
+    @staticmethod
+    def outage(breaker):
+        @retry(on_error=IOError, limit=4, wait=0.005,
+               circuit_breaker=breaker)
+        def f():
+            f.calls += 1
+            raise IOError('backend down')
+
+        f.calls = 0
+        return f
+
+    @staticmethod
+    def measure(f, count=50):
+        durations = []
+        for _ in range(count):
+            start = time.time()
+            try:
+                f()
+            except (IOError, CircuitOpenError):
+                pass
+            durations.append(time.time() - start)
+        return durations
+
+    def test_fail_fast_when_open(self):
+        f = self.outage(CircuitBreaker(failure_threshold=3,
+                                       recovery_timeout=60))
+        assert_that(f, raises(CircuitOpenError))
+        assert_that(f.calls, equal_to(3))
+        assert_that(f, raises(CircuitOpenError))
+        assert_that(f.calls, equal_to(3))
+
+    def test_p99_during_outage(self):
+        without = self.measure(self.outage(None))
+        breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=60)
+        f = self.outage(breaker)
+        with_breaker = self.measure(f)
+        assert_that(p99(without), greater_than_or_equal_to(0.015))
+        assert_that(p99(with_breaker), less_than(0.005))
+        assert_that(f.calls, equal_to(3))
+
+    def test_non_retryable_error_is_success(self):
+        breaker = CircuitBreaker(failure_threshold=1)
+
+        @retry(on_error=IOError, circuit_breaker=breaker)
+        def f():
+            raise ValueError()
+
+        assert_that(f, raises(ValueError))
+        assert_that(breaker.state, equal_to(CLOSED))
+
+    def test_on_return_failure(self):
+        breaker = CircuitBreaker(failure_threshold=2)
+
+        @retry(on_return=lambda x: x is None, limit=5,
+               circuit_breaker=breaker)
+        def f():
+            f.calls += 1
+
+        f.calls = 0
+        assert_that(f, raises(CircuitOpenError))
+        assert_that(f.calls, equal_to(2))
+
+
+class Interrupted(BaseException):
+    pass
+
+
+class Backend(object):
+    """ fails, hangs or raises as told. """
+
+    def __init__(self):
+        self.down = True
+        self.slow = False
+        self.interrupt = False
+        self.release = threading.Event()
+
+    def check(self):
+        if self.interrupt:
+            raise Interrupted()
+        if self.slow:
+            self.release.wait(1)
+        if self.down:
+            raise IOError('backend down')
+        return 'ok'
+
+    def __call__(self):
+        return self.check()
+
+
+class HalfOpenTrialTest(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(failure_threshold=1,
+                                      recovery_timeout=10,
+                                      clock=self.clock)
+        self.backend = Backend()
+
+    def open_then_recover(self, f, call=None):
+        call = call or f
+        assert_that(call, raises(IOError))
+        assert_that(self.breaker.state, equal_to(OPEN))
+        self.clock.now += 10
+        assert_that(self.breaker.state, equal_to(HALF_OPEN))
+
+    def test_pool_timeout_reopens(self):
+        pool = AttemptPool(4)
+        f = retry(self.backend, on_error=IOError, limit=1, timeout=0.05,
+                  circuit_breaker=self.breaker, pool=pool)
+        try:
+            self.open_then_recover(f)
+            self.backend.slow = True
+            assert_that(f, raises(RetryTimeoutError))
+            # the slow trial counts as a failure
+            assert_that(self.breaker.state, equal_to(OPEN))
+            self.backend.release.set()
+
+            self.clock.now += 10
+            self.backend.slow = False
+            self.backend.down = False
+            assert_that(f(), equal_to('ok'))
+            assert_that(self.breaker.state, equal_to(CLOSED))
+        finally:
+            pool.shutdown()
+
+    def test_base_exception_releases_trial(self):
+        f = retry(self.backend, on_error=IOError, limit=1,
+                  circuit_breaker=self.breaker)
+        self.open_then_recover(f)
+        self.backend.interrupt = True
+        assert_that(f, raises(Interrupted))
+        assert_that(self.breaker.state, equal_to(HALF_OPEN))
+
+        self.backend.interrupt = False
+        self.backend.down = False
+        assert_that(f(), equal_to('ok'))
+        assert_that(self.breaker.state, equal_to(CLOSED))
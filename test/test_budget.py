@@ -0,0 +1,147 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import threading
+from unittest import TestCase
+
+from hamcrest import assert_that, equal_to, raises, close_to, \
+    less_than_or_equal_to
+
+from retryz import retry, RetryBudget
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class RetryBudgetTest(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.budget = RetryBudget(ratio=0.5, min_per_second=1,
+                                  max_tokens=2, clock=self.clock)
+
+    def test_withdraw_until_exhausted(self):
+        assert_that(self.budget.withdraw(), equal_to(True))
+        assert_that(self.budget.withdraw(), equal_to(True))
+        assert_that(self.budget.withdraw(), equal_to(False))
+
+    def test_deposit(self):
+        self.budget.withdraw()
+        self.budget.withdraw()
+        self.budget.deposit()
+        assert_that(self.budget.withdraw(), equal_to(False))
+        self.budget.deposit()
+        assert_that(self.budget.withdraw(), equal_to(True))
+
+    def test_record(self):
+        self.budget.withdraw()
+        self.budget.withdraw()
+        self.budget.record(True)
+        self.budget.record(False)
+        assert_that(self.budget.balance, close_to(0.5, 1e-9))
+
+    def test_refill_by_time(self):
+        self.budget.withdraw()
+        self.budget.withdraw()
+        self.clock.now = 1.5
+        assert_that(self.budget.balance, close_to(1.5, 1e-9))
+        self.clock.now = 100
+        assert_that(self.budget.balance, equal_to(2))
+
+    def test_max_tokens(self):
+        for _ in range(100):
+            self.budget.deposit()
+        assert_that(self.budget.balance, equal_to(2))
+
+    def test_concurrent_deposits(self):
+        budget = RetryBudget(ratio=0.001, min_per_second=0, max_tokens=100,
+                             clock=self.clock)
+        for _ in range(100):
+            budget.withdraw()
+
+        def deposit():
+            for _ in range(1000):
+                budget.deposit()
+
+        threads = [threading.Thread(target=deposit) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert_that(budget.balance, close_to(8, 1e-6))
+
+    def test_invalid(self):
+        assert_that(lambda: RetryBudget(ratio=-1),
+                    raises(ValueError, 'should not be negative'))
+
+
+class RetryWithBudgetTest(TestCase):
+    def test_stop_retry_on_error(self):
+        budget = RetryBudget(ratio=0, min_per_second=0, max_tokens=3)
+
+        @retry(on_error=IOError, limit=10, budget=budget)
+        def f():
+            f.calls += 1
+            raise IOError()
+
+        f.calls = 0
+        assert_that(f, raises(IOError))
+        assert_that(f.calls, equal_to(4))
+        assert_that(f, raises(IOError))
+        assert_that(f.calls, equal_to(5))
+
+    def test_stop_retry_on_return(self):
+        budget = RetryBudget(ratio=0, min_per_second=0, max_tokens=1)
+
+        @retry(on_return=lambda x: x < 10, budget=budget)
+        def f():
+            f.calls += 1
+            return f.calls
+
+        f.calls = 0
+        assert_that(f(), equal_to(2))
+        assert_that(f(), equal_to(3))
+
+    def test_shared_budget(self):
+        budget = RetryBudget(ratio=0, min_per_second=0, max_tokens=5)
+
+        @retry(on_error=IOError, limit=3, budget=budget)
+        def f():
+            raise IOError()
+
+        @retry(on_error=IOError, limit=3, budget=budget)
+        def g():
+            raise IOError()
+
+        for func in (f, g, f, g):
+            assert_that(func, raises(IOError))
+        assert_that(budget.balance, less_than_or_equal_to(0))
+
+    def test_success_deposits(self):
+        budget = RetryBudget(ratio=1, min_per_second=0, max_tokens=5)
+        for _ in range(5):
+            budget.withdraw()
+
+        @retry(on_error=IOError, budget=budget)
+        def f():
+            pass
+
+        f()
+        f()
+        assert_that(budget.balance, equal_to(2))
@@ -0,0 +1,233 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import threading
+from unittest import TestCase
+
+from hamcrest import assert_that, equal_to, raises, none
+
+from retryz import retry, ResultCache
+from retryz.cache import make_key
+from retryz.clock import VirtualClock
+
+__author__ = 'Cedric Zhuang'
+
+
+class ResultCacheTest(TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+
+    def test_ttl(self):
+        cache = ResultCache(ttl=10, clock=self.clock.now)
+        cache.put('a', 1)
+        assert_that(cache.get('a'), equal_to((True, 1)))
+        self.clock.advance(10)
+        assert_that(cache.get('a'), equal_to((False, None)))
+        assert_that(len(cache), equal_to(0))
+
+    def test_lru(self):
+        cache = ResultCache(max_size=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        assert_that(cache.get('b'), equal_to((False, None)))
+        assert_that(cache.get('a'), equal_to((True, 1)))
+        assert_that(cache.get('c'), equal_to((True, 3)))
+
+    def test_invalidate(self):
+        cache = ResultCache()
+        cache.put('a', 1)
+        cache.invalidate('a')
+        cache.invalidate('b')
+        assert_that(cache.get('a'), equal_to((False, None)))
+        cache.put('a', 1)
+        cache.clear()
+        assert_that(len(cache), equal_to(0))
+
+    def test_make_key(self):
+        assert_that(make_key((1, 2), {'b': 1, 'a': 2}),
+                    equal_to(make_key((1, 2), {'a': 2, 'b': 1})))
+        assert_that(make_key(([1],), {}), none())
+
+    def test_invalid_size(self):
+        assert_that(lambda: ResultCache(max_size=0), raises(ValueError))
+
+
+class RetryCacheTest(TestCase):
+    def setUp(self):
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def test_cached(self):
+        cache = ResultCache(ttl=60)
+
+        @retry(on_error=IOError, cache=cache)
+        def get(key):
+            self.calls += 1
+            return key * 2
+
+        assert_that(get(1), equal_to(2))
+        assert_that(get(1), equal_to(2))
+        assert_that(get(2), equal_to(4))
+        assert_that(self.calls, equal_to(2))
+        assert_that(cache.hits, equal_to(1))
+
+    def test_error_not_cached(self):
+        @retry(on_error=IOError, limit=2, cache=ResultCache())
+        def get():
+            self.calls += 1
+            raise IOError()
+
+        assert_that(get, raises(IOError))
+        assert_that(get, raises(IOError))
+        assert_that(self.calls, equal_to(4))
+
+    def test_rejected_not_cached(self):
+        @retry(on_return=None, limit=2, cache=ResultCache())
+        def get():
+            self.calls += 1
+            return None
+
+        get()
+        get()
+        assert_that(self.calls, equal_to(4))
+
+    def test_unhashable_bypass(self):
+        @retry(on_error=IOError, cache=ResultCache())
+        def get(items):
+            self.calls += 1
+            return len(items)
+
+        get([1])
+        get([1])
+        assert_that(self.calls, equal_to(2))
+
+    def test_shared_by_functions(self):
+        cache = ResultCache()
+        f = retry(lambda x: 'f', on_error=IOError, cache=cache)
+        g = retry(lambda x: 'g', on_error=IOError, cache=cache)
+        assert_that(f(1), equal_to('f'))
+        assert_that(g(1), equal_to('g'))
+
+    def test_single_flight(self):
+        cache = ResultCache()
+        started = threading.Event()
+        release = threading.Event()
+
+        @retry(on_error=IOError, limit=3, cache=cache)
+        def get(key):
+            with self.lock:
+                self.calls += 1
+            started.set()
+            release.wait(5)
+            return key
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(get('k')))
+                   for _ in range(8)]
+        threads[0].start()
+        started.wait(5)
+        for t in threads[1:]:
+            t.start()
+        for _ in range(100):
+            if cache.coalesced == 7:
+                break
+            release.wait(0.01)
+        release.set()
+        for t in threads:
+            t.join()
+        assert_that(results, equal_to(['k'] * 8))
+        assert_that(self.calls, equal_to(1))
+        assert_that(cache.coalesced, equal_to(7))
+
+    def test_single_flight_interrupted(self):
+        started = threading.Event()
+        release = threading.Event()
+        cache = ResultCache()
+
+        class Interrupted(BaseException):
+            pass
+
+        @retry(on_error=IOError, cache=cache)
+        def get():
+            with self.lock:
+                self.calls += 1
+                first = self.calls == 1
+            if first:
+                started.set()
+                release.wait(5)
+                raise Interrupted()
+            return 'v'
+
+        outcomes = []
+
+        def call():
+            try:
+                outcomes.append(get())
+            except Interrupted:
+                outcomes.append('interrupted')
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=call)
+        follower.start()
+        for _ in range(100):
+            if cache.coalesced == 1:
+                break
+            release.wait(0.01)
+        release.set()
+        leader.join()
+        follower.join()
+        # the follower runs the call again instead of getting None
+        assert_that(sorted(outcomes), equal_to(['interrupted', 'v']))
+        assert_that(self.calls, equal_to(2))
+
+    def test_single_flight_error(self):
+        started = threading.Event()
+        release = threading.Event()
+        cache = ResultCache()
+
+        @retry(on_error=IOError, limit=2, cache=cache)
+        def get():
+            with self.lock:
+                self.calls += 1
+            started.set()
+            release.wait(5)
+            raise IOError()
+
+        errors = []
+
+        def call():
+            try:
+                get()
+            except IOError as e:
+                errors.append(e)
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=call)
+        follower.start()
+        for _ in range(100):
+            if cache.coalesced == 1:
+                break
+            release.wait(0.01)
+        release.set()
+        leader.join()
+        follower.join()
+        assert_that(len(errors), equal_to(2))
+        assert_that(self.calls, equal_to(2))
@@ -0,0 +1,146 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import time
+from unittest import TestCase
+
+from hamcrest import assert_that, equal_to, raises, less_than
+
+from retryz import retry, retry_batch, backoff, RetryTimeoutError, \
+    RetryMetrics, Deadline, Hedge
+from retryz import deadline
+from retryz.clock import Clock, VirtualClock
+
+__author__ = 'Cedric Zhuang'
+
+
+class VirtualClockTest(TestCase):
+    def test_sleep(self):
+        clock = VirtualClock(start=10)
+        clock.sleep(5)
+        clock.advance(1)
+        assert_that(clock.now(), equal_to(16))
+        assert_that(clock.slept, equal_to(5))
+        assert_that(clock.sleeps, equal_to(1))
+
+    def test_real_clock(self):
+        clock = Clock()
+        start = clock.now()
+        clock.sleep(0.01)
+        assert_that(clock.now() - start, less_than(1))
+
+
+class RetryClockTest(TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.calls = 0
+
+    def fail(self):
+        self.calls += 1
+        raise IOError()
+
+    def test_wait_in_virtual_time(self):
+        f = retry(self.fail, on_error=IOError, limit=5, wait=3600,
+                  clock=self.clock)
+        start = time.time()
+        assert_that(f, raises(IOError))
+        assert_that(time.time() - start, less_than(1))
+        assert_that(self.calls, equal_to(5))
+        assert_that(self.clock.now(), equal_to(4 * 3600))
+
+    def test_timeout(self):
+        f = retry(self.fail, on_error=IOError, wait=10, timeout=35,
+                  clock=self.clock)
+        assert_that(f, raises(RetryTimeoutError))
+        # tries at 0, 10, 20, 30, the wait before 40 ends at the deadline
+        assert_that(self.calls, equal_to(4))
+        assert_that(self.clock.now(), equal_to(35))
+
+    def test_timeout_by_latency(self):
+        def slow():
+            self.calls += 1
+            self.clock.advance(4)
+            raise IOError()
+
+        f = retry(slow, on_error=IOError, timeout=10, clock=self.clock)
+        assert_that(f, raises(RetryTimeoutError))
+        assert_that(self.calls, equal_to(3))
+
+    def test_backoff(self):
+        f = retry(self.fail, on_error=IOError, limit=4,
+                  wait=backoff.Exponential(1), clock=self.clock)
+        assert_that(f, raises(IOError))
+        assert_that(self.clock.now(), equal_to(1 + 2 + 4))
+
+    def test_listener_duration(self):
+        metrics = RetryMetrics()
+
+        def slow():
+            self.clock.advance(0.02)
+            return 1
+
+        f = retry(slow, on_error=IOError, listener=metrics, clock=self.clock)
+        f()
+        assert_that(metrics.get(f).latency.percentile(50), equal_to(0.025))
+
+    def test_nested_deadline(self):
+        inner = retry(self.fail, on_error=IOError, wait=1, timeout=100,
+                      clock=self.clock)
+
+        def outer():
+            assert_that(deadline.current(), equal_to(5))
+            inner()
+
+        f = retry(outer, on_error=ValueError, timeout=5, clock=self.clock)
+        assert_that(f, raises(RetryTimeoutError))
+        assert_that(self.calls, equal_to(5))
+
+    def test_deadline_block(self):
+        f = retry(self.fail, on_error=IOError, wait=1, clock=self.clock)
+        with Deadline(5, clock=self.clock):
+            assert_that(f, raises(RetryTimeoutError))
+        assert_that(self.calls, equal_to(5))
+
+    def test_pool_not_allowed(self):
+        def f():
+            retry(self.fail, on_error=IOError, pool=True, clock=self.clock)
+
+        def g():
+            retry(self.fail, on_error=IOError, hedge=Hedge(),
+                  clock=self.clock)
+
+        assert_that(f, raises(ValueError))
+        assert_that(g, raises(ValueError))
+
+    def test_batch(self):
+        sent = []
+
+        @retry_batch(on_error=IOError, wait=60, timeout=150,
+                     clock=self.clock)
+        def put(items):
+            sent.append(items)
+            return [IOError() if i == 2 else i for i in items]
+
+        assert_that(lambda: put([1, 2]), raises(RetryTimeoutError))
+        assert_that(sent, equal_to([[1, 2], [2], [2]]))
+
+    def test_many_sequences(self):
+        f = retry(self.fail, on_error=IOError, limit=10, wait=30,
+                  clock=self.clock)
+        start = time.time()
+        for _ in range(1000):
+            assert_that(f, raises(IOError))
+        assert_that(time.time() - start, less_than(5))
+        assert_that(self.clock.sleeps, equal_to(9000))
@@ -0,0 +1,137 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import time
+from unittest import TestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from hamcrest import assert_that, equal_to, raises, less_than, none, \
+    greater_than
+
+from retryz import retry, RetryTimeoutError
+from retryz import deadline
+from retryz.deadline import Deadline
+
+
+class DeadlineTest(TestCase):
+    def test_no_deadline(self):
+        assert_that(deadline.current(), none())
+        assert_that(deadline.remaining(), none())
+
+    def test_remaining_in_call(self):
+        @retry(on_error=ValueError, timeout=10)
+        def f():
+            return deadline.remaining()
+
+        assert_that(f(), greater_than(9))
+        assert_that(f(), less_than(10.001))
+        assert_that(deadline.current(), none())
+
+    def test_inner_inherits_outer(self):
+        @retry(on_return=True, wait=0.5, timeout=10)
+        def inner():
+            inner.calls += 1
+            return True
+
+        @retry(on_error=ValueError, timeout=0.1)
+        def outer():
+            return inner()
+
+        inner.calls = 0
+        start = time.time()
+        assert_that(outer, raises(RetryTimeoutError))
+        assert_that(time.time() - start, less_than(1))
+        assert_that(inner.calls, equal_to(1))
+
+    def test_inner_timeout_tighter(self):
+        @retry(on_error=ValueError, timeout=5)
+        def inner():
+            return deadline.remaining()
+
+        @retry(on_error=ValueError, timeout=100)
+        def outer():
+            return inner()
+
+        assert_that(outer(), less_than(5.001))
+
+    def test_wait_longer_than_deadline(self):
+        @retry(on_return=True, wait=10, timeout=0.2)
+        def f():
+            f.calls += 1
+            return True
+
+        f.calls = 0
+        start = time.time()
+        assert_that(f, raises(RetryTimeoutError))
+        # the wait ends at the deadline, not before
+        assert_that(time.time() - start, greater_than(0.19))
+        assert_that(time.time() - start, less_than(1))
+        assert_that(f.calls, equal_to(1))
+
+    def test_expired_before_call(self):
+        @retry(on_error=ValueError, timeout=10)
+        def inner():
+            inner.calls += 1
+
+        inner.calls = 0
+        with Deadline(0.01):
+            time.sleep(0.02)
+            assert_that(inner, raises(RetryTimeoutError))
+        assert_that(inner.calls, equal_to(0))
+        inner()
+        assert_that(inner.calls, equal_to(1))
+
+    def test_deadline_block(self):
+        with Deadline(3):
+            assert_that(deadline.remaining(), less_than(3.001))
+            with Deadline(10):
+                assert_that(deadline.remaining(), less_than(3.001))
+        assert_that(deadline.current(), none())
+
+
+class LocalVarTest(TestCase):
+    """ the fallback of the interpreters without contextvars. """
+
+    def setUp(self):
+        patcher = mock.patch.object(
+            deadline, '_current', deadline._LocalVar('retryz_deadline'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_deadline_left_after_call(self):
+        @retry(on_return=lambda r: False, timeout=0.05)
+        def f():
+            return 1
+
+        @retry(on_error=ValueError, limit=3)
+        def g():
+            return 2
+
+        assert_that(f(), equal_to(1))
+        assert_that(deadline.current(), none())
+        time.sleep(0.1)
+        assert_that(g(), equal_to(2))
+
+    def test_nested_blocks(self):
+        with Deadline(10):
+            outer = deadline.current()
+            with Deadline(3):
+                assert_that(deadline.remaining(), less_than(3.001))
+            assert_that(deadline.current(), equal_to(outer))
+        assert_that(deadline.current(), none())
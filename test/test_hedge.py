@@ -0,0 +1,114 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import threading
+import time
+from unittest import TestCase
+
+from hamcrest import assert_that, equal_to, raises, less_than
+
+from retryz import retry, Hedge, RetryTimeoutError
+from retryz.pool import AttemptPool
+
+
+class HedgeTest(TestCase):
+    def setUp(self):
+        self.pool = AttemptPool(max_workers=8)
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def tearDown(self):
+        self.release.set()
+        self.pool.shutdown()
+
+    def slow_first(self):
+        with self.lock:
+            self.calls += 1
+            call = self.calls
+        if call == 1:
+            self.release.wait(10)
+        return call
+
+    def test_hedge_wins(self):
+        hedge = Hedge(delay=0.01)
+        f = retry(self.slow_first, on_error=ValueError, hedge=hedge,
+                  pool=self.pool)
+        start = time.time()
+        assert_that(f(), equal_to(2))
+        assert_that(time.time() - start, less_than(1))
+        assert_that(hedge.hedged, equal_to(1))
+        assert_that(hedge.won, equal_to(1))
+
+    def test_primary_wins(self):
+        hedge = Hedge(delay=1)
+        f = retry(lambda: 'fast', on_error=ValueError, hedge=hedge,
+                  pool=self.pool)
+        assert_that(f(), equal_to('fast'))
+        assert_that(hedge.hedged, equal_to(0))
+
+    def test_hedge_counts_in_limit(self):
+        hedge = Hedge(delay=0.01, max_hedges=3)
+        f = retry(self.slow_first, on_return=lambda x: x != 1, limit=2,
+                  hedge=hedge, pool=self.pool)
+        threading.Timer(0.1, self.release.set).start()
+        assert_that(f(), equal_to(1))
+        assert_that(self.calls, equal_to(2))
+        assert_that(hedge.hedged, equal_to(1))
+
+    def test_reject_return_value(self):
+        hedge = Hedge(delay=0.01)
+
+        def f():
+            with self.lock:
+                self.calls += 1
+                call = self.calls
+            if call == 1:
+                self.release.wait(10)
+            return call
+
+        wrapped = retry(f, on_return=lambda x: x < 3, hedge=hedge,
+                        pool=self.pool)
+        assert_that(wrapped(), equal_to(3))
+
+    def test_max_concurrent(self):
+        hedge = Hedge(delay=0, max_hedges=5, max_concurrent=2)
+        f = retry(lambda: self.release.wait(10), on_error=ValueError,
+                  timeout=0.2, hedge=hedge, pool=self.pool)
+        assert_that(f, raises(RetryTimeoutError))
+        assert_that(hedge.hedged, equal_to(2))
+
+    def test_errors_retried(self):
+        hedge = Hedge(delay=0.01)
+
+        @retry(on_error=ValueError, limit=3, hedge=hedge, pool=self.pool)
+        def f():
+            with self.lock:
+                self.calls += 1
+            raise ValueError()
+
+        assert_that(f, raises(ValueError))
+        assert_that(self.calls, equal_to(3))
+
+    def test_percentile_delay(self):
+        hedge = Hedge(delay=1, percentile=90, min_samples=10)
+        assert_that(hedge.get_delay(), equal_to(1))
+        for _ in range(10):
+            hedge.latency.record(0.004)
+        assert_that(hedge.get_delay(), equal_to(0.005))
+
+    def test_invalid(self):
+        assert_that(lambda: Hedge(max_hedges=0),
+                    raises(ValueError, 'at least 1'))
@@ -0,0 +1,195 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import pickle
+import threading
+from unittest import TestCase
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from hamcrest import assert_that, equal_to, raises, is_not, same_instance, \
+    less_than, none
+
+from retryz import retry, RetryBudget, CircuitBreaker, CircuitOpenError, \
+    RetryPolicy, KeyBusyError
+from retryz.adaptive import Adaptive
+
+__author__ = 'Cedric Zhuang'
+
+
+def first_arg(args, kwargs):
+    return args[0]
+
+
+class Backends(object):
+    """ `call(host)` fails for the hosts in `down`. """
+
+    def __init__(self, down=()):
+        self.down = set(down)
+        self.calls = {}
+
+    def call(self, host):
+        self.calls[host] = self.calls.get(host, 0) + 1
+        if host in self.down:
+            raise IOError(host)
+        return host
+
+
+class KeyedTest(TestCase):
+    def test_budget_per_key(self):
+        backends = Backends(down=['bad'])
+        budget = RetryBudget(ratio=0, min_per_second=0, max_tokens=2)
+        f = retry(backends.call, on_error=IOError, limit=10, budget=budget,
+                  key=first_arg)
+
+        for _ in range(3):
+            assert_that(lambda: f('bad'), raises(IOError))
+        # 1 try per call plus the 2 retries of its budget
+        assert_that(backends.calls['bad'], equal_to(5))
+
+        backends.down = {'good'}
+        assert_that(lambda: f('good'), raises(IOError))
+        assert_that(backends.calls['good'], equal_to(3))
+        assert_that(budget.balance, equal_to(2))
+
+    def test_breaker_per_key(self):
+        backends = Backends(down=['bad'])
+        breaker = CircuitBreaker(failure_threshold=2)
+        f = retry(backends.call, on_error=IOError, limit=2,
+                  circuit_breaker=breaker, key=first_arg)
+
+        assert_that(lambda: f('bad'), raises(IOError))
+        assert_that(lambda: f('bad'), raises(CircuitOpenError))
+        assert_that(f('good'), equal_to('good'))
+        assert_that(breaker.state, equal_to('closed'))
+
+    def test_copies_per_key(self):
+        budget = RetryBudget()
+        wait = Adaptive()
+        f = retry(lambda host: host, on_error=IOError, budget=budget,
+                  wait=wait, key=first_arg)
+        f('a')
+        f('b')
+        a = f.retry_keys.policy_of('a')
+        b = f.retry_keys.policy_of('b')
+        assert_that(a.budget, is_not(same_instance(budget)))
+        assert_that(a.budget, is_not(same_instance(b.budget)))
+        assert_that(a.wait, is_not(same_instance(b.wait)))
+        assert_that(a.key, none())
+
+    def test_none_key_uses_given_objects(self):
+        budget = RetryBudget()
+        f = retry(lambda host: host, on_error=IOError, budget=budget,
+                  key=lambda args, kwargs: kwargs.get('tenant'))
+        assert_that(f('a'), equal_to('a'))
+        assert_that(len(f.retry_keys), equal_to(0))
+        assert_that(f.retry_keys.policy_of(None).budget,
+                    same_instance(budget))
+
+    def test_key_from_kwargs(self):
+        @retry(on_error=IOError, key=lambda args, kwargs: kwargs['tenant'])
+        def f(x, tenant=None):
+            return x
+
+        assert_that(f(1, tenant='t1'), equal_to(1))
+        assert_that(f.retry_keys.keys(), equal_to(['t1']))
+
+    def test_lru_eviction(self):
+        f = retry(lambda host: host, on_error=IOError, key=first_arg,
+                  max_keys=2)
+        f('a')
+        f('b')
+        f('a')
+        f('c')
+        assert_that(f.retry_keys.keys(), equal_to(['a', 'c']))
+        assert_that(f.retry_keys.evicted, equal_to(1))
+
+    def test_10k_keys_bounded(self):
+        f = retry(lambda host: host, on_error=IOError,
+                  budget=RetryBudget(), key=first_arg, max_keys=100)
+        for i in range(1000):
+            f(i)
+        if tracemalloc is not None:
+            tracemalloc.start()
+        try:
+            for i in range(1000, 10000):
+                f(i)
+            if tracemalloc is not None:
+                retained, _ = tracemalloc.get_traced_memory()
+        finally:
+            if tracemalloc is not None:
+                tracemalloc.stop()
+        assert_that(len(f.retry_keys), equal_to(100))
+        assert_that(f.retry_keys.evicted, equal_to(9900))
+        if tracemalloc is not None:
+            # only the 100 kept keys, not the 9000 created while tracing
+            assert_that(retained, less_than(100 * 4096))
+
+    def test_max_in_flight(self):
+        started = threading.Semaphore(0)
+        release = threading.Event()
+
+        def call(host):
+            if host == 'bad':
+                started.release()
+                release.wait(5)
+                raise IOError(host)
+            return host
+
+        f = retry(call, on_error=IOError, limit=3, key=first_arg,
+                  max_in_flight=2)
+        errors = []
+
+        def stuck():
+            try:
+                f('bad')
+            except Exception as e:
+                errors.append(type(e))
+
+        threads = [threading.Thread(target=stuck) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        started.acquire()
+        started.acquire()
+        try:
+            assert_that(lambda: f('bad'), raises(KeyBusyError, "'bad'"))
+            # the other keys are not blocked
+            assert_that(f('good'), equal_to('good'))
+        finally:
+            release.set()
+            for thread in threads:
+                thread.join()
+        assert_that(errors, equal_to([IOError, IOError]))
+        assert_that(f.retry_keys.get('bad').in_flight.acquire(False),
+                    equal_to(True))
+
+    def test_invalid_key(self):
+        assert_that(lambda: retry(key='host'),
+                    raises(ValueError, 'key should be a function'))
+        assert_that(lambda: retry(key=first_arg, max_keys=0),
+                    raises(ValueError, 'max_keys should be at least 1'))
+        assert_that(lambda: retry(key=first_arg, max_in_flight=0),
+                    raises(ValueError, 'max_in_flight should be at least'))
+
+    def test_pickle_policy(self):
+        policy = RetryPolicy(on_error=IOError, key=first_arg, max_keys=10,
+                             max_in_flight=3)
+        copied = pickle.loads(pickle.dumps(policy))
+        assert_that(copied.key, same_instance(first_arg))
+        assert_that(copied.max_keys, equal_to(10))
+        assert_that(copied.max_in_flight, equal_to(3))
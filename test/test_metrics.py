@@ -0,0 +1,318 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import pickle
+import threading
+from unittest import TestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from hamcrest import assert_that, equal_to, raises, only_contains, \
+    same_instance, less_than
+
+from retryz import retry, RetryListener, RetryMetrics, RetryTimeoutError, \
+    RetryBudget, RetryStats, RetryPolicy, wrap, retry_batch
+from retryz.clock import VirtualClock
+from retryz.metrics import LatencyHistogram, STATS_FIELDS
+
+
+class RecordingListener(RetryListener):
+    def __init__(self):
+        self.events = []
+
+    def attempt_start(self, function, attempt):
+        self.events.append(('start', attempt))
+
+    def attempt_end(self, function, attempt, duration, error, result):
+        if error is not None:
+            self.events.append(('end', attempt, type(error)))
+        else:
+            self.events.append(('end', attempt, result))
+
+    def retry_scheduled(self, function, attempt, wait):
+        self.events.append(('retry', attempt, wait))
+
+    def give_up(self, function, attempt, error, result):
+        self.events.append(('give_up', attempt))
+
+    def timeout(self, function, attempt, elapsed):
+        self.events.append(('timeout', attempt))
+
+
+class ListenerTest(TestCase):
+    def test_events_on_error(self):
+        listener = RecordingListener()
+
+        @retry(on_error=ValueError, limit=2, wait=0.001, listener=listener)
+        def f():
+            raise ValueError()
+
+        assert_that(f, raises(ValueError))
+        assert_that(listener.events, equal_to([
+            ('start', 1), ('end', 1, ValueError),
+            ('retry', 1, 0.001),
+            ('start', 2), ('end', 2, ValueError),
+            ('give_up', 2)]))
+
+    def test_events_on_return(self):
+        listener = RecordingListener()
+
+        @retry(on_return=lambda x: x < 2, listener=listener)
+        def f():
+            f.calls += 1
+            return f.calls
+
+        f.calls = 0
+        assert_that(f(), equal_to(2))
+        assert_that(listener.events, equal_to([
+            ('start', 1), ('end', 1, 1), ('retry', 1, 0),
+            ('start', 2), ('end', 2, 2)]))
+
+    def test_no_give_up_on_unexpected_error(self):
+        listener = RecordingListener()
+
+        @retry(on_error=ValueError, listener=listener)
+        def f():
+            raise TypeError()
+
+        assert_that(f, raises(TypeError))
+        assert_that(listener.events, equal_to([
+            ('start', 1), ('end', 1, TypeError)]))
+
+    def test_give_up_on_budget(self):
+        listener = RecordingListener()
+        budget = RetryBudget(ratio=0, min_per_second=0, max_tokens=0)
+
+        @retry(on_return=True, listener=listener, budget=budget)
+        def f():
+            return True
+
+        assert_that(f(), equal_to(True))
+        assert_that(listener.events[-1], equal_to(('give_up', 1)))
+
+    def test_timeout(self):
+        listener = RecordingListener()
+
+        @retry(on_return=True, wait=10, timeout=0.01, listener=listener)
+        def f():
+            return True
+
+        assert_that(f, raises(RetryTimeoutError))
+        assert_that(listener.events[-1], equal_to(('timeout', 1)))
+
+
+def py2_wraps(wrapped):
+    """ `functools.wraps` of python 2, which does not set `__wrapped__`. """
+    def update(wrapper):
+        wrapper.__name__ = wrapped.__name__
+        wrapper.__doc__ = wrapped.__doc__
+        return wrapper
+
+    return update
+
+
+class LatencyHistogramTest(TestCase):
+    def test_record(self):
+        histogram = LatencyHistogram((1, 2, 3))
+        for seconds in (0.5, 1, 1.5, 2.5, 10):
+            histogram.record(seconds)
+        assert_that(list(histogram.counts), equal_to([2, 1, 1, 1]))
+        assert_that(histogram.total, equal_to(5))
+
+    def test_percentile(self):
+        histogram = LatencyHistogram((1, 2, 3))
+        assert_that(histogram.percentile(50), equal_to(None))
+        for _ in range(98):
+            histogram.record(0.5)
+        histogram.record(2.5)
+        histogram.record(10)
+        assert_that(histogram.percentile(50), equal_to(1))
+        assert_that(histogram.percentile(99), equal_to(3))
+        assert_that(histogram.percentile(100), equal_to(float('inf')))
+
+
+class RetryMetricsTest(TestCase):
+    def test_aggregate(self):
+        metrics = RetryMetrics()
+
+        @retry(on_error=ValueError, limit=3, listener=metrics)
+        def f():
+            raise ValueError()
+
+        @retry(on_error=ValueError, listener=metrics)
+        def g():
+            pass
+
+        assert_that(f, raises(ValueError))
+        g()
+        g()
+        snapshot = metrics.get(f).snapshot()
+        assert_that(snapshot['calls'], equal_to(1))
+        assert_that(snapshot['attempts'], equal_to(3))
+        assert_that(snapshot['errors'], equal_to(3))
+        assert_that(snapshot['retries'], equal_to(2))
+        assert_that(snapshot['give_ups'], equal_to(1))
+        assert_that(metrics.get(g).snapshot()['calls'], equal_to(2))
+        assert_that(metrics.functions(), only_contains(f.__wrapped__,
+                                                       g.__wrapped__))
+
+    def test_get_without_wraps_setting_wrapped(self):
+        metrics = RetryMetrics()
+
+        def get():
+            return 1
+
+        def read(offset=0):
+            yield 1
+
+        def put(items):
+            return [True for _ in items]
+
+        with mock.patch('functools.wraps', py2_wraps):
+            f = retry(get, on_error=IOError, listener=metrics)
+            g = retry(read, on_error=IOError, resume='offset',
+                      listener=metrics)
+            h = retry_batch(put, on_error=IOError)
+            k = retry(get, on_error=IOError, listener=metrics,
+                      key=lambda args, kwargs: 'k')
+        f()
+        list(g())
+        assert_that(metrics.get(f).snapshot()['calls'], equal_to(1))
+        assert_that(metrics.get(g).snapshot()['calls'], equal_to(1))
+        assert_that(h.__wrapped__, same_instance(put))
+        assert_that(k.__wrapped__, same_instance(get))
+
+
+class Flaky(object):
+    def __init__(self, failures):
+        self.failures = failures
+
+    def __call__(self):
+        if self.failures > 0:
+            self.failures -= 1
+            raise ValueError()
+        return 1
+
+
+class RetryStatsTest(TestCase):
+    def test_empty(self):
+        f = retry(lambda: 1, on_error=ValueError)
+        assert_that(f.retry_stats(),
+                    equal_to({name: 0 for name in STATS_FIELDS}))
+
+    def test_counts(self):
+        f = retry(Flaky(2), on_error=ValueError, limit=3, wait=0.5,
+                  clock=VirtualClock())
+        f()
+        f()
+        stats = f.retry_stats()
+        assert_that(stats['calls'], equal_to(2))
+        assert_that(stats['attempts'], equal_to(4))
+        assert_that(stats['retries'], equal_to(2))
+        assert_that(stats['wait_seconds'], equal_to(1))
+        assert_that(stats['give_ups'], equal_to(0))
+        assert_that(stats['failures'], equal_to(0))
+
+    def test_give_up(self):
+        f = retry(Flaky(5), on_error=ValueError, limit=2)
+        assert_that(f, raises(ValueError))
+        stats = f.retry_stats.snapshot()
+        assert_that(stats['give_ups'], equal_to(1))
+        assert_that(stats['failures'], equal_to(1))
+
+    def test_error_not_retried(self):
+        f = retry(Flaky(5), on_error=TypeError, limit=2)
+        assert_that(f, raises(ValueError))
+        stats = f.retry_stats()
+        assert_that(stats['give_ups'], equal_to(0))
+        assert_that(stats['failures'], equal_to(1))
+        assert_that(stats['attempts'], equal_to(1))
+
+    def test_timeout(self):
+        f = retry(Flaky(5), on_error=ValueError, wait=1, timeout=2.5,
+                  clock=VirtualClock())
+        assert_that(f, raises(RetryTimeoutError))
+        stats = f.retry_stats()
+        assert_that(stats['timeouts'], equal_to(1))
+        assert_that(stats['failures'], equal_to(1))
+        # the last wait ends at the deadline
+        assert_that(stats['wait_seconds'], equal_to(2.5))
+
+    def test_reset(self):
+        f = retry(Flaky(1), on_error=ValueError, limit=2)
+        f()
+        f.retry_stats.reset()
+        f()
+        stats = f.retry_stats()
+        assert_that(stats['calls'], equal_to(1))
+        assert_that(stats['retries'], equal_to(0))
+
+    def test_many_threads(self):
+        f = retry(Flaky(0), on_error=ValueError)
+        barrier = threading.Barrier(100)
+
+        def run():
+            barrier.wait()
+            for _ in range(100):
+                f()
+
+        threads = [threading.Thread(target=run) for _ in range(100)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert_that(f.retry_stats()['calls'], equal_to(100 * 100))
+        # the shards of the finished threads are merged
+        assert_that(len(f.retry_stats._shards), equal_to(0))
+        f()
+        assert_that(f.retry_stats()['calls'], equal_to(100 * 100 + 1))
+
+    def test_finished_threads_merged_without_reads(self):
+        f = retry(Flaky(0), on_error=ValueError)
+        for _ in range(20):
+            threads = [threading.Thread(target=f) for _ in range(100)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        # at most the shards added since the last merge
+        assert_that(len(f.retry_stats._shards), less_than(100))
+        assert_that(f.retry_stats()['calls'], equal_to(2000))
+
+    def test_shared_stats(self):
+        stats = RetryStats()
+        policy = RetryPolicy(on_error=ValueError)
+        f = wrap(lambda: 1, policy, stats)
+        g = wrap(lambda: 2, policy, stats)
+        f()
+        g()
+        assert_that(f.retry_stats, same_instance(stats))
+        assert_that(stats()['calls'], equal_to(2))
+
+    def test_keyed(self):
+        f = retry(lambda host: host, on_error=ValueError,
+                  key=lambda args, kwargs: args[0])
+        f('a')
+        f('b')
+        assert_that(f.retry_stats()['calls'], equal_to(2))
+
+    def test_pickle(self):
+        f = retry(lambda: 1, on_error=ValueError)
+        f()
+        copied = pickle.loads(pickle.dumps(f.retry_stats))
+        assert_that(copied()['calls'], equal_to(0))
@@ -0,0 +1,171 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import functools
+import subprocess
+import sys
+from unittest import TestCase
+
+from hamcrest import assert_that, equal_to, raises, is_not, same_instance
+
+from retryz import retry, _is_coroutine_function
+from retryz.policy import bind, RetryPolicy
+
+
+class BindDemo(object):
+    def __init__(self):
+        self.calls = 0
+
+    def method(self, x):
+        return self, x
+
+    @classmethod
+    def class_method(cls, x):
+        return cls, x
+
+    @staticmethod
+    def static_method(x):
+        return x
+
+    def _broken(self, e):
+        self.calls += 1
+        raise TypeError('broken callback')
+
+    @retry(on_error=_broken)
+    def broken(self):
+        raise ValueError()
+
+    @staticmethod
+    def _static_error(e):
+        return False
+
+    @classmethod
+    def _class_limit(cls):
+        return 2
+
+    @retry(on_error=_static_error, limit=_class_limit)
+    def static_error(self):
+        self.calls += 1
+        raise ValueError()
+
+    @retry(on_return=lambda x: x < 3, limit=_class_limit)
+    def class_limit(self):
+        self.calls += 1
+        return self.calls
+
+
+class BindTest(TestCase):
+    def test_function(self):
+        invoke = bind(lambda x: x, 1)
+        assert_that(invoke(('inst',), 1), equal_to(1))
+
+    def test_bound_method(self):
+        demo = BindDemo()
+        invoke = bind(demo.method, 1)
+        assert_that(invoke(('inst',), 1), equal_to((demo, 1)))
+
+    def test_unbound_method(self):
+        invoke = bind(BindDemo.method, 1)
+        assert_that(invoke(('inst',), 1), equal_to(('inst', 1)))
+
+    def test_class_method(self):
+        invoke = bind(BindDemo.class_method, 1)
+        assert_that(invoke(('inst',), 1), equal_to((BindDemo, 1)))
+
+    def test_class_method_object(self):
+        invoke = bind(BindDemo.__dict__['class_method'], 1)
+        assert_that(invoke((BindDemo(),), 1), equal_to((BindDemo, 1)))
+
+    def test_static_method_object(self):
+        invoke = bind(BindDemo.__dict__['static_method'], 1)
+        assert_that(invoke(('inst',), 1), equal_to(1))
+
+    def test_partial(self):
+        def f(inst, x, y):
+            return inst, x, y
+
+        invoke = bind(functools.partial(f, y=2), 1)
+        assert_that(invoke(('inst',), 1), equal_to(('inst', 1, 2)))
+
+    def test_callback_type_error_called_once(self):
+        demo = BindDemo()
+        assert_that(demo.broken, raises(TypeError, 'broken callback'))
+        assert_that(demo.calls, equal_to(1))
+
+    def test_descriptor_in_class_body(self):
+        demo = BindDemo()
+        assert_that(demo.static_error, raises(ValueError))
+        assert_that(demo.calls, equal_to(1))
+
+    def test_class_method_limit(self):
+        demo = BindDemo()
+        assert_that(demo.class_limit(), equal_to(2))
+
+
+class RetryPolicyTest(TestCase):
+    def test_invalid_limit(self):
+        assert_that(lambda: RetryPolicy(limit='3'),
+                    raises(ValueError, 'limit should be a number'))
+
+    def test_constant_options(self):
+        policy = RetryPolicy(on_error=ValueError, limit=3, wait=1)
+        assert_that(policy.get_limit(()), equal_to(3))
+        assert_that(policy.get_wait((), 0, 0), equal_to(0))
+        assert_that(policy.get_wait((), 1, 0), equal_to(1))
+        assert_that(policy.check_error((), ValueError()), equal_to(True))
+        assert_that(policy.check_return((), None), equal_to(False))
+
+    def test_constant_options_shared(self):
+        a = RetryPolicy(on_error=ValueError, limit=3, wait=1, timeout=5)
+        b = RetryPolicy(on_error=ValueError, limit=3, wait=1, timeout=5)
+        assert_that(a.check_error, same_instance(b.check_error))
+        assert_that(a.get_limit, same_instance(b.get_limit))
+        assert_that(a.get_wait, same_instance(b.get_wait))
+        assert_that(a.get_timeout, same_instance(b.get_timeout))
+
+    def test_constant_options_keep_type(self):
+        a = RetryPolicy(limit=1)
+        b = RetryPolicy(limit=True)
+        assert_that(a.get_limit, is_not(same_instance(b.get_limit)))
+        assert_that(type(a.get_limit(())), equal_to(int))
+
+    def test_unhashable_on_return(self):
+        policy = RetryPolicy(on_return=[1])
+        assert_that(policy.check_return((), [1]), equal_to(True))
+        assert_that(policy.check_return((), [2]), equal_to(False))
+
+    def test_lambda_callbacks_not_shared(self):
+        a = RetryPolicy(on_error=lambda e: True)
+        b = RetryPolicy(on_error=lambda e: False)
+        assert_that(a.check_error((), ValueError()), equal_to(True))
+        assert_that(b.check_error((), ValueError()), equal_to(False))
+
+
+class StartupTest(TestCase):
+    def test_import_is_light(self):
+        script = ('import sys, retryz; print(sorted(m for m in ('
+                  '"inspect", "logging", "concurrent.futures", "random") '
+                  'if m in sys.modules))')
+        out = subprocess.check_output([sys.executable, '-c', script])
+        assert_that(out.decode().strip(), equal_to('[]'))
+
+    def test_not_coroutine_function(self):
+        def g(x):
+            return x
+
+        assert_that(_is_coroutine_function(g), equal_to(False))
+        assert_that(_is_coroutine_function(functools.partial(g, 1)),
+                    equal_to(False))
+        assert_that(_is_coroutine_function(len), equal_to(False))
@@ -0,0 +1,143 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import threading
+import time
+from concurrent import futures
+from unittest import TestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from hamcrest import assert_that, equal_to, raises, less_than, \
+    less_than_or_equal_to, greater_than
+
+from retryz import retry, RetryTimeoutError
+from retryz import deadline
+from retryz.pool import AttemptPool, default_pool
+
+
+class AttemptPoolTest(TestCase):
+    def setUp(self):
+        self.pool = AttemptPool(max_workers=4)
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        self.pool.shutdown()
+
+    def hang(self):
+        self.release.wait(10)
+        return 'released'
+
+    def test_latency_bound(self):
+        f = retry(self.hang, on_error=ValueError, timeout=0.05,
+                  pool=self.pool)
+        start = time.time()
+        assert_that(f, raises(RetryTimeoutError))
+        assert_that(time.time() - start, less_than(0.5))
+        assert_that(self.pool.overruns, equal_to(1))
+        assert_that(self.pool.running_overruns, equal_to(1))
+        self.release.set()
+        for _ in range(100):
+            if self.pool.running_overruns == 0:
+                break
+            time.sleep(0.01)
+        assert_that(self.pool.running_overruns, equal_to(0))
+
+    def test_latency_bound_when_saturated(self):
+        f = retry(self.hang, on_error=ValueError, timeout=0.05,
+                  pool=self.pool)
+        errors = []
+
+        def call():
+            try:
+                f()
+            except RetryTimeoutError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(10)]
+        start = time.time()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert_that(time.time() - start, less_than(0.5))
+        assert_that(len(errors), equal_to(10))
+        assert_that(self.pool.thread_count, less_than_or_equal_to(4))
+        assert_that(self.pool.overruns, less_than_or_equal_to(4))
+
+    def test_thread_count(self):
+        @retry(on_error=ValueError, timeout=10, pool=self.pool)
+        def f():
+            return threading.current_thread().name
+
+        names = set(f() for _ in range(100))
+        assert_that(len(names), less_than_or_equal_to(4))
+        assert_that(self.pool.thread_count, less_than_or_equal_to(4))
+        assert_that(self.pool.overruns, equal_to(0))
+
+    def test_retry_in_pool(self):
+        @retry(on_error=ValueError, limit=3, pool=self.pool)
+        def f():
+            f.calls += 1
+            raise ValueError()
+
+        f.calls = 0
+        assert_that(f, raises(ValueError))
+        assert_that(f.calls, equal_to(3))
+
+    def test_no_deadline(self):
+        f = retry(lambda: 1, on_error=ValueError, pool=self.pool)
+        assert_that(f(), equal_to(1))
+
+    def test_deadline_in_worker(self):
+        @retry(on_error=ValueError, timeout=10, pool=self.pool)
+        def f():
+            return deadline.remaining()
+
+        assert_that(f(), greater_than(9))
+
+    def test_default_pool(self):
+        assert_that(default_pool(), equal_to(default_pool()))
+
+    def test_thread_name(self):
+        name = self.pool.submit(
+            lambda: threading.current_thread().name, (), {}).result()
+        assert_that(name.startswith('retryz-attempt'), equal_to(True))
+
+    def test_executor_without_thread_name(self):
+        executor = futures.ThreadPoolExecutor
+
+        def old_executor(max_workers, **kwargs):
+            # the signature of python 3.4 and 3.5
+            if kwargs:
+                raise TypeError('unexpected keyword argument')
+            return executor(max_workers)
+
+        with mock.patch('concurrent.futures.ThreadPoolExecutor',
+                        side_effect=old_executor):
+            pool = AttemptPool(max_workers=2)
+            try:
+                assert_that(pool.submit(lambda: 1, (), {}).result(),
+                            equal_to(1))
+            finally:
+                pool.shutdown()
+
+    def test_invalid(self):
+        assert_that(lambda: AttemptPool(0),
+                    raises(ValueError, 'at least 1'))
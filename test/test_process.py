@@ -0,0 +1,132 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import pickle
+from unittest import TestCase
+
+from hamcrest import assert_that, equal_to, raises, instance_of
+
+from retryz import retry, backoff, RetryPolicy, RetryBudget, RetryMetrics, \
+    CircuitBreaker, Hedge, ResultCache
+from retryz.adaptive import Adaptive
+from retryz.metrics import merge_snapshots
+from retryz.pool import default_pool
+from retryz.process import ProcessRetry
+
+__author__ = 'Cedric Zhuang'
+
+# items already seen by this process
+_seen = set()
+
+metrics = RetryMetrics()
+
+
+def fail_once(item):
+    if item not in _seen:
+        _seen.add(item)
+        raise IOError(item)
+    return item * item
+
+
+def always_fail(item):
+    if item == 3:
+        raise ValueError(item)
+    return item
+
+
+@retry(on_error=IOError, limit=2, listener=metrics)
+def decorated(item):
+    return fail_once(item)
+
+
+class PickleTest(TestCase):
+    def test_policy(self):
+        policy = RetryPolicy(on_error=IOError, limit=3, wait=1)
+        copied = pickle.loads(pickle.dumps(policy))
+        assert_that(copied.get_limit(()), equal_to(3))
+        assert_that(copied.get_wait((), 1, 0), equal_to(1))
+        assert_that(copied.check_error((), IOError()), equal_to(True))
+
+    def test_state_not_copied(self):
+        budget = RetryBudget(min_per_second=0, max_tokens=2)
+        budget.withdraw()
+        budget.withdraw()
+        breaker = CircuitBreaker(failure_threshold=1)
+        breaker.record(True)
+        policy = RetryPolicy(on_error=IOError, budget=budget,
+                             circuit_breaker=breaker, listener=metrics)
+        copied = pickle.loads(pickle.dumps(policy))
+        assert_that(copied.budget.balance, equal_to(2))
+        assert_that(copied.circuit_breaker.state, equal_to('closed'))
+        assert_that(copied.listener.functions(), equal_to([]))
+
+    def test_options(self):
+        policy = RetryPolicy(on_error=IOError, hedge=Hedge(delay=0.5),
+                             cache=ResultCache(ttl=5),
+                             wait=Adaptive(backoff.FullJitter(0.1)))
+        copied = pickle.loads(pickle.dumps(policy))
+        assert_that(copied.hedge.delay, equal_to(0.5))
+        assert_that(copied.pool, equal_to(default_pool()))
+        assert_that(copied.cache.ttl, equal_to(5))
+        assert_that(copied.wait.base, instance_of(backoff.FullJitter))
+
+    def test_decorated_function(self):
+        assert_that(pickle.loads(pickle.dumps(decorated)),
+                    equal_to(decorated))
+        assert_that(decorated.retry_policy, instance_of(RetryPolicy))
+
+    def test_merge_snapshots(self):
+        m = RetryMetrics()
+        m.attempt_start(len, 1)
+        m.attempt_end(len, 1, 0.003, None, 1)
+        total = merge_snapshots([m.get(len).snapshot()] * 2)
+        assert_that(total['calls'], equal_to(2))
+        assert_that(total['latency_p50'], equal_to(0.005))
+
+
+class ProcessRetryTest(TestCase):
+    def test_map(self):
+        with ProcessRetry(fail_once, max_workers=2, on_error=IOError,
+                          limit=2) as runner:
+            results = runner.map(range(10))
+            report = runner.report()
+        assert_that(results, equal_to([i * i for i in range(10)]))
+        assert_that(report['total']['calls'], equal_to(10))
+        assert_that(report['total']['attempts'], equal_to(20))
+        assert_that(report['total']['retries'], equal_to(10))
+        assert_that(sum(s['calls'] for s in report['workers'].values()),
+                    equal_to(10))
+
+    def test_error(self):
+        runner = ProcessRetry(always_fail, max_workers=2, on_error=IOError)
+        try:
+            assert_that(lambda: runner.map(range(5)), raises(ValueError))
+            results = runner.map(range(5), return_exceptions=True)
+        finally:
+            runner.shutdown()
+        assert_that(results[3], instance_of(ValueError))
+        assert_that(results[4], equal_to(4))
+        assert_that(runner.report()['total']['errors'], equal_to(2))
+
+    def test_decorated(self):
+        with ProcessRetry(decorated, max_workers=2) as runner:
+            results = runner.map([11, 12, 13])
+            total = runner.report()['total']
+        assert_that(results, equal_to([121, 144, 169]))
+        assert_that(total['attempts'], equal_to(6))
+
+    def test_retried_with_options(self):
+        assert_that(lambda: ProcessRetry(decorated, on_error=IOError),
+                    raises(ValueError))
@@ -0,0 +1,205 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from hamcrest import assert_that, equal_to, raises, close_to, \
+    same_instance, contains_string
+
+from retryz import retry
+from retryz.clock import VirtualClock
+from retryz.replay import ReplayRecorder, ReplayLog, Record, replay, \
+    recorded, error_class, main, RETRIED, RETURNED
+
+__author__ = 'Cedric Zhuang'
+
+
+class Flaky(object):
+    def __init__(self, failures):
+        self.failures = failures
+
+    def __call__(self):
+        if self.failures > 0:
+            self.failures -= 1
+            raise IOError()
+        return 1
+
+
+def trace(call_id, *outcomes):
+    """ records of one call, each try takes 1 second. """
+    ret = []
+    for i, (outcome, flags) in enumerate(outcomes):
+        ret.append(Record(call_id, 'f', i + 1, outcome, flags, 1.0,
+                          0.5 if i else 0.0))
+    return ret
+
+
+ERROR = 'builtins.OSError'
+
+
+class ReplayRecorderTest(TestCase):
+    def test_record_tries(self):
+        recorder = ReplayRecorder()
+        clock = VirtualClock()
+        f = retry(Flaky(2), on_error=IOError, limit=5, wait=0.5,
+                  listener=recorder, clock=clock)
+        assert_that(f(), equal_to(1))
+
+        records = recorder.log().records
+        assert_that([r.attempt for r in records], equal_to([1, 2, 3]))
+        assert_that([r.outcome for r in records],
+                    equal_to([ERROR, ERROR, RETURNED]))
+        assert_that([r.retried for r in records],
+                    equal_to([True, True, False]))
+        assert_that([r.wait for r in records], equal_to([0, 0.5, 0.5]))
+        assert_that(records[0].function, contains_string('Flaky'))
+
+    def test_give_up_flagged(self):
+        recorder = ReplayRecorder()
+        f = retry(Flaky(5), on_error=IOError, limit=2, listener=recorder)
+        assert_that(f, raises(IOError))
+        records = recorder.log().records
+        assert_that([r.flags for r in records], equal_to([RETRIED] * 2))
+
+    def test_error_not_retried(self):
+        recorder = ReplayRecorder()
+        f = retry(Flaky(5), on_error=TypeError, limit=2, listener=recorder)
+        assert_that(f, raises(IOError))
+        records = recorder.log().records
+        assert_that([r.flags for r in records], equal_to([0]))
+
+    def test_one_call_id_per_call(self):
+        recorder = ReplayRecorder()
+        f = retry(Flaky(1), on_error=IOError, limit=3, listener=recorder)
+        f()
+        f()
+        traces = recorder.log().traces()
+        assert_that([len(t) for t in traces], equal_to([2, 1]))
+
+    def test_ring_buffer(self):
+        recorder = ReplayRecorder(capacity=4)
+        f = retry(Flaky(1), on_error=IOError, limit=3, listener=recorder)
+        for _ in range(5):
+            f()
+        log = recorder.log()
+        assert_that(recorder.written, equal_to(6))
+        assert_that(len(log.records), equal_to(4))
+        # the first call lost its first try
+        assert_that(len(log.traces()), equal_to(4))
+
+    def test_mmap_file(self):
+        folder = tempfile.mkdtemp()
+        try:
+            path = os.path.join(folder, 'f.replay')
+            recorder = ReplayRecorder(capacity=16, path=path)
+            f = retry(Flaky(1), on_error=IOError, limit=3, listener=recorder)
+            f()
+            recorder.close()
+            log = ReplayLog.load(path)
+            assert_that([r.outcome for r in log.records],
+                        equal_to([ERROR, RETURNED]))
+        finally:
+            shutil.rmtree(folder)
+
+    def test_invalid_log(self):
+        assert_that(lambda: ReplayLog(b'\0' * 64),
+                    raises(ValueError, 'not a replay log'))
+
+
+class ReplayTest(TestCase):
+    def setUp(self):
+        self.traces = [
+            trace(1, (RETURNED, 0)),
+            trace(2, (ERROR, RETRIED), (ERROR, RETRIED), (RETURNED, 0)),
+            trace(3, (ERROR, RETRIED), (ERROR, RETRIED)),
+        ]
+
+    def test_recorded(self):
+        summary = recorded(self.traces)
+        assert_that(summary['calls'], equal_to(3))
+        assert_that(summary['attempts'], equal_to(6))
+        assert_that(summary['failures'], equal_to(1))
+        assert_that(summary['latency'], close_to(7.5, 1e-6))
+
+    def test_more_tries(self):
+        summary = replay(self.traces, on_error=IOError, limit=4, wait=2)
+        # the last try of call 3 fails again
+        assert_that(summary['attempts'], equal_to(1 + 3 + 4))
+        assert_that(summary['failures'], equal_to(1))
+        assert_that(summary['wait'], equal_to(2 * 2 + 3 * 2))
+        assert_that(summary['latency'], equal_to(1 + 7 + 10))
+
+    def test_fewer_tries(self):
+        summary = replay(self.traces, on_error=IOError, limit=2)
+        assert_that(summary['attempts'], equal_to(5))
+        assert_that(summary['failures'], equal_to(2))
+
+    def test_timeout(self):
+        summary = replay(self.traces, on_error=IOError, wait=1, timeout=2.5)
+        # 1s try, 1s wait, 1s try, no time left to wait again
+        assert_that(summary['attempts'], equal_to(5))
+        assert_that(summary['failures'], equal_to(2))
+
+    def test_rejected_return(self):
+        traces = [trace(1, (RETURNED, RETRIED), (RETURNED, 0))]
+        assert_that(replay(traces, limit=1)['failures'], equal_to(1))
+        assert_that(replay(traces, limit=2)['failures'], equal_to(0))
+
+    def test_shared_clock(self):
+        clock = VirtualClock()
+        replay(self.traces, clock=clock, on_error=IOError, limit=1)
+        assert_that(clock.now(), equal_to(3))
+
+    def test_limit_or_timeout_required(self):
+        assert_that(lambda: replay(self.traces, on_error=IOError),
+                    raises(ValueError, 'limit or timeout'))
+
+    def test_error_class(self):
+        assert_that(error_class('builtins.OSError'), same_instance(OSError))
+        missing = error_class('no.such.module.Error')
+        assert_that(missing.__name__, equal_to('Error'))
+        assert_that(error_class('no.such.module.Error'),
+                    same_instance(missing))
+
+    def test_main(self):
+        recorder = ReplayRecorder()
+        f = retry(Flaky(1), on_error=IOError, limit=3, listener=recorder)
+        f()
+        folder = tempfile.mkdtemp()
+        try:
+            path = os.path.join(folder, 'f.replay')
+            recorder.dump(path)
+            out = StringIO()
+            with mock.patch('sys.stdout', out):
+                main([path, '--limit', '1', '--on-error',
+                      'builtins.OSError'])
+        finally:
+            shutil.rmtree(folder)
+        lines = out.getvalue().splitlines()
+        assert_that(lines[2].split(), equal_to(['attempts', '2', '1']))
+        assert_that(lines[3].split(), equal_to(['failures', '0', '1']))
@@ -14,12 +14,19 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 import functools
+import threading
 from unittest import TestCase
 
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
 from hamcrest import assert_that, instance_of, equal_to, raises, \
     greater_than, less_than, contains_string
 
-from retryz import retry, RetryTimeoutError
+from retryz import retry, RetryTimeoutError, TimeoutCheck
+from retryz.timer import monotonic
 
 
 def _return_callback(ret):
@@ -405,3 +412,49 @@ class RetryTest(TestCase):
             g()
 
         assert_that(f, raises(ValueError, 'should be a function'))
+
+
+class TimeoutCheckTest(TestCase):
+    def test_no_event_on_first_try(self):
+        @retry(on_error=IOError, limit=3, wait=1, timeout=60)
+        def f():
+            return 1
+
+        with mock.patch('threading.Event', side_effect=AssertionError):
+            assert_that(f(), equal_to(1))
+
+    def test_wait_ends_at_deadline(self):
+        holder = TimeoutCheck()
+        holder.start(0.05)
+        start = monotonic()
+        holder.wait(5)
+        assert_that(monotonic() - start, less_than(1))
+        assert_that(holder.is_expired(), equal_to(True))
+        assert_that(holder.check_timeout, raises(RetryTimeoutError))
+
+    def test_no_deadline(self):
+        holder = TimeoutCheck()
+        holder.start(None)
+        assert_that(holder.is_expired(), equal_to(False))
+
+
+class TimeoutThreadTest(TestCase):
+    def test_no_thread_left_by_fast_calls(self):
+        @retry(on_error=IOError, timeout=3600)
+        def f():
+            return 1
+
+        before = threading.active_count()
+        for _ in range(10000):
+            f()
+        assert_that(threading.active_count(), equal_to(before))
+
+    def test_no_thread_left_by_timeouts(self):
+        @retry(on_return=True, timeout=0.01)
+        def f():
+            return True
+
+        before = threading.active_count()
+        for _ in range(10):
+            assert_that(f, raises(RetryTimeoutError))
+        assert_that(threading.active_count(), equal_to(before))
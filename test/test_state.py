@@ -0,0 +1,233 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+from unittest import TestCase
+
+from hamcrest import assert_that, equal_to, raises, none, instance_of, \
+    contains_string
+
+from retryz import retry, retry_batch, RetryState, RetryTimeoutError
+from retryz import state as retry_state
+from retryz.clock import VirtualClock
+from retryz.policy import RetryPolicy, wants_state
+
+__author__ = 'Cedric Zhuang'
+
+
+class StateDemo(object):
+    def __init__(self):
+        self.states = []
+        self.calls = 0
+
+    def _on_error(self, e, state):
+        self.states.append((state.attempt, state.last_error))
+        return state.attempt < 3
+
+    @retry(on_error=_on_error)
+    def method_callback(self):
+        self.calls += 1
+        raise ValueError(self.calls)
+
+    @classmethod
+    def class_callback(cls, e, state):
+        return state.attempt < 2
+
+    @staticmethod
+    def static_callback(e, state):
+        return state.attempt < 2
+
+    def bound_callback(self, e, state):
+        return state.args[0] is self and state.attempt < 2
+
+    @retry(on_error=class_callback)
+    def call_class_callback(self):
+        self.calls += 1
+        raise ValueError()
+
+    @retry(on_error=static_callback)
+    def call_static_callback(self):
+        self.calls += 1
+        raise ValueError()
+
+
+class RetryStateTest(TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+
+    def test_state(self):
+        state = RetryState(len, (1,), {}, deadline=10, now=self.clock.now)
+        self.clock.advance(4)
+        assert_that(state.elapsed, equal_to(4))
+        assert_that(state.remaining, equal_to(6))
+        self.clock.advance(10)
+        assert_that(state.remaining, equal_to(0))
+        assert_that(repr(state), contains_string('attempt=0'))
+
+    def test_no_deadline(self):
+        assert_that(RetryState(len, (), {}).remaining, none())
+
+    def test_wants_state(self):
+        assert_that(wants_state(lambda e, state: True), equal_to(True))
+        assert_that(wants_state(lambda e: True), equal_to(False))
+        assert_that(wants_state(StateDemo.__dict__['class_callback']),
+                    equal_to(True))
+        assert_that(RetryPolicy(on_error=lambda e, state: True).use_state,
+                    equal_to(True))
+        assert_that(RetryPolicy(on_error=ValueError).use_state,
+                    equal_to(False))
+
+    def test_method_callback(self):
+        demo = StateDemo()
+        assert_that(demo.method_callback, raises(ValueError))
+        assert_that(demo.calls, equal_to(3))
+        assert_that([attempt for attempt, _ in demo.states],
+                    equal_to([1, 2, 3]))
+        # the error being checked is not recorded yet
+        assert_that(demo.states[0][1], none())
+        assert_that(demo.states[1][1].args, equal_to((1,)))
+
+    def test_class_and_static_callback(self):
+        demo = StateDemo()
+        assert_that(demo.call_class_callback, raises(ValueError))
+        assert_that(demo.call_static_callback, raises(ValueError))
+        assert_that(demo.calls, equal_to(4))
+
+    def test_bound_callback(self):
+        demo = StateDemo()
+        f = retry(lambda x: 1 / 0, on_error=demo.bound_callback)
+        assert_that(lambda: f(demo), raises(ZeroDivisionError))
+
+    def test_all_callbacks(self):
+        seen = []
+
+        def record(name):
+            def callback(*args, **kwargs):
+                seen.append((name, kwargs['state'].attempt))
+                return 1
+            return callback
+
+        def limit(state):
+            seen.append(('limit', state.attempt))
+            return 2
+
+        def timeout(state):
+            seen.append(('timeout', state.attempt))
+            return 60
+
+        def on_error(e, state):
+            seen.append(('on_error', state.attempt))
+            return True
+
+        def wait(tried, state):
+            seen.append(('wait', state.attempt))
+            return 0
+
+        def on_retry(state):
+            seen.append(('on_retry', state.attempt))
+
+        f = retry(lambda: 1 / 0, on_error=on_error, limit=limit,
+                  timeout=timeout, wait=wait, on_retry=on_retry)
+        assert_that(f, raises(ZeroDivisionError))
+        assert_that(seen, equal_to([
+            ('limit', 0), ('timeout', 0), ('on_error', 1), ('wait', 1),
+            ('on_retry', 1), ('on_error', 2)]))
+
+    def test_timing(self):
+        remaining = []
+
+        def on_return(r, state):
+            remaining.append((state.elapsed, state.remaining))
+            return True
+
+        def slow():
+            self.clock.advance(1)
+
+        f = retry(slow, on_return=on_return, wait=2, timeout=10,
+                  clock=self.clock)
+        assert_that(f, raises(RetryTimeoutError))
+        assert_that(remaining[:2], equal_to([(1, 9), (4, 6)]))
+
+    def test_last_result(self):
+        results = []
+
+        def on_return(r, state):
+            results.append(state.last_result)
+            return r < 3
+
+        calls = []
+        f = retry(lambda: calls.append(1) or len(calls), on_return=on_return)
+        assert_that(f(), equal_to(3))
+        # the callback runs before the result is recorded
+        assert_that(results, equal_to([None, 1, 2]))
+
+    def test_current(self):
+        inner = []
+
+        def on_error(e, state):
+            inner.append(retry_state.current())
+            return False
+
+        f = retry(lambda: 1 / 0, on_error=on_error)
+        assert_that(f, raises(ZeroDivisionError))
+        assert_that(inner[0], instance_of(RetryState))
+        assert_that(retry_state.current(), none())
+
+    def test_not_created(self):
+        seen = []
+        f = retry(lambda: seen.append(retry_state.current()),
+                  on_error=ValueError)
+        f()
+        assert_that(seen, equal_to([None]))
+
+    def test_nested(self):
+        states = []
+
+        def inner_error(e, state):
+            states.append(('inner', state.function.__name__))
+            return False
+
+        def outer_error(e, state):
+            states.append(('outer', state.function.__name__))
+            return False
+
+        @retry(on_error=inner_error)
+        def inner():
+            raise ValueError()
+
+        @retry(on_error=outer_error)
+        def outer():
+            try:
+                inner()
+            except ValueError:
+                pass
+            raise ValueError()
+
+        assert_that(outer, raises(ValueError))
+        assert_that(states, equal_to([('inner', 'inner'),
+                                      ('outer', 'outer')]))
+
+    def test_batch(self):
+        attempts = []
+
+        def on_error(e, state):
+            attempts.append((state.attempt, len(state.last_result)))
+            return True
+
+        @retry_batch(on_error=on_error, limit=3)
+        def put(items):
+            return [IOError() if i else i for i in items]
+
+        put([0, 1])
+        assert_that(attempts, equal_to([(1, 2), (2, 1), (3, 1)]))
@@ -0,0 +1,282 @@
+# coding=utf-8
+# Copyright (c) 2015 EMC Corporation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+from unittest import TestCase
+
+from hamcrest import assert_that, equal_to, raises
+
+from retryz import retry, RetryMetrics, RetryTimeoutError, Deadline, \
+    CircuitBreaker, CircuitOpenError, RetryBudget, ResultCache
+from retryz import state as _state
+from retryz import backoff
+from retryz.adaptive import Adaptive
+from retryz.breaker import OPEN
+from retryz.clock import VirtualClock
+
+__author__ = 'Cedric Zhuang'
+
+
+class Pages(object):
+    """ a paginated source failing at the given offsets, once each. """
+
+    def __init__(self, size, fail_at=()):
+        self.size = size
+        self.fail_at = set(fail_at)
+        self.offsets = []
+
+    def read(self, offset=0):
+        self.offsets.append(offset)
+        for i in range(offset, self.size):
+            if i in self.fail_at:
+                self.fail_at.remove(i)
+                raise IOError(i)
+            yield i
+
+    @retry(on_error=IOError, limit=2, resume='offset')
+    def stream(self, offset=0):
+        for item in self.read(offset):
+            yield item
+
+
+class StreamTest(TestCase):
+    def test_resume_by_count(self):
+        pages = Pages(10, fail_at=[3, 7])
+        f = retry(pages.read, on_error=IOError, limit=2, resume='offset')
+        assert_that(list(f()), equal_to(list(range(10))))
+        assert_that(pages.offsets, equal_to([0, 3, 7]))
+
+    def test_method(self):
+        pages = Pages(5, fail_at=[2])
+        assert_that(list(pages.stream()), equal_to(list(range(5))))
+        assert_that(pages.offsets, equal_to([0, 2]))
+
+    def test_resume_callback(self):
+        pages = Pages(6, fail_at=[4])
+        f = retry(pages.read, on_error=IOError, limit=2,
+                  resume=lambda count, last: {'offset': last + 1})
+        assert_that(list(f()), equal_to(list(range(6))))
+        assert_that(pages.offsets, equal_to([0, 4]))
+
+    def test_resume_callback_needs_self(self):
+        class Source(object):
+            def __init__(self):
+                self.calls = []
+
+            def _resume(self, count, last):
+                return {'after': last}
+
+            @retry(on_error=IOError, resume=_resume)
+            def items(self, after=None):
+                self.calls.append(after)
+                if after is None:
+                    yield 'a'
+                    raise IOError()
+                yield 'b'
+
+        source = Source()
+        assert_that(list(source.items()), equal_to(['a', 'b']))
+        assert_that(source.calls, equal_to([None, 'a']))
+
+    def test_limit_counts_failures_without_progress(self):
+        pages = Pages(10, fail_at=[1, 2, 3, 4])
+        f = retry(pages.read, on_error=IOError, limit=2, resume='offset')
+        assert_that(list(f()), equal_to(list(range(10))))
+
+    def test_progress_resets_limit(self):
+        def broken(offset=0):
+            yield offset
+            raise IOError()
+
+        f = retry(broken, on_error=IOError, limit=3, resume='offset')
+        items = []
+        for item in f():
+            items.append(item)
+            if len(items) == 100:
+                break
+        assert_that(items, equal_to(list(range(100))))
+
+    def test_give_up(self):
+        def empty(offset=0):
+            empty.calls += 1
+            raise IOError()
+            yield
+
+        empty.calls = 0
+        f = retry(empty, on_error=IOError, limit=3, resume='offset')
+        assert_that(lambda: list(f()), raises(IOError))
+        assert_that(empty.calls, equal_to(3))
+
+    def test_error_not_retried(self):
+        def bad(offset=0):
+            yield 1
+            raise ValueError()
+
+        f = retry(bad, on_error=IOError, resume='offset')
+        assert_that(lambda: list(f()), raises(ValueError))
+
+    def test_wait_and_timeout(self):
+        clock = VirtualClock()
+
+        def flaky(offset=0):
+            yield offset
+            raise IOError()
+
+        f = retry(flaky, on_error=IOError, wait=10, timeout=35,
+                  resume='offset', clock=clock)
+        items = []
+
+        def consume():
+            for item in f():
+                items.append(item)
+
+        assert_that(consume, raises(RetryTimeoutError))
+        assert_that(items, equal_to([0, 1, 2, 3]))
+
+    def test_outer_deadline(self):
+        clock = VirtualClock()
+
+        def flaky(offset=0):
+            yield offset
+            raise IOError()
+
+        f = retry(flaky, on_error=IOError, wait=1, resume='offset',
+                  clock=clock)
+        with Deadline(2.5, clock=clock):
+            assert_that(lambda: list(f()), raises(RetryTimeoutError))
+
+    def test_close(self):
+        closed = []
+
+        def source(offset=0):
+            try:
+                for i in range(offset, 100):
+                    yield i
+            finally:
+                closed.append(offset)
+
+        stream = retry(source, on_error=IOError, resume='offset')()
+        assert_that(next(stream), equal_to(0))
+        stream.close()
+        assert_that(closed, equal_to([0]))
+
+    def test_listener(self):
+        metrics = RetryMetrics()
+        pages = Pages(5, fail_at=[2])
+        f = retry(pages.read, on_error=IOError, limit=2, resume='offset',
+                  listener=metrics)
+        list(f())
+        snapshot = metrics.get(pages.read).snapshot()
+        assert_that(snapshot['attempts'], equal_to(2))
+        assert_that(snapshot['errors'], equal_to(1))
+        assert_that(snapshot['retries'], equal_to(1))
+
+    def test_iterable(self):
+        def f(offset=0):
+            f.offsets.append(offset)
+            if offset == 0:
+                return iter(Pages(3, fail_at=[1]).read())
+            return [1, 2]
+
+        f.offsets = []
+        g = retry(f, on_error=IOError, resume='offset')
+        assert_that(list(g()), equal_to([0, 1, 2]))
+        assert_that(f.offsets, equal_to([0, 1]))
+
+    def test_invalid_resume(self):
+        def f(offset=0):
+            yield 1
+
+        assert_that(lambda: retry(f, on_error=IOError, resume=1),
+                    raises(ValueError))
+
+    def test_resume_returns_dict(self):
+        pages = Pages(3, fail_at=[1])
+        f = retry(pages.read, on_error=IOError,
+                  resume=lambda count, last: count)
+        assert_that(lambda: list(f()), raises(ValueError))
+
+    def test_call_error_retried(self):
+        def connect(offset=0):
+            connect.calls += 1
+            if connect.calls < 3:
+                raise IOError('connect')
+            return iter(range(offset, 3))
+
+        connect.calls = 0
+        f = retry(connect, on_error=IOError, resume='offset', limit=5)
+        assert_that(list(f()), equal_to([0, 1, 2]))
+        assert_that(connect.calls, equal_to(3))
+
+    def test_circuit_breaker(self):
+        breaker = CircuitBreaker(failure_threshold=1)
+        pages = Pages(3, fail_at=[0])
+        f = retry(pages.read, on_error=IOError, limit=3, resume='offset',
+                  circuit_breaker=breaker)
+        assert_that(lambda: list(f()), raises(CircuitOpenError))
+        assert_that(breaker.state, equal_to(OPEN))
+        assert_that(pages.offsets, equal_to([0]))
+
+    def test_budget(self):
+        budget = RetryBudget(ratio=0, min_per_second=0, max_tokens=1)
+        pages = Pages(5, fail_at=[1, 2, 3])
+        f = retry(pages.read, on_error=IOError, limit=5, resume='offset',
+                  budget=budget)
+        assert_that(lambda: list(f()), raises(IOError))
+        assert_that(pages.offsets, equal_to([0, 1]))
+
+    def test_state(self):
+        attempts = []
+        seen = []
+
+        def check(e, state):
+            attempts.append(state.attempt)
+            return True
+
+        pages = Pages(4, fail_at=[1, 2])
+        f = retry(pages.read, on_error=check, limit=2, resume='offset')
+
+        @retry(on_error=lambda e, state: False)
+        def outer():
+            for item in f():
+                # the state of the stream does not leak to the consumer
+                seen.append(_state.current().function)
+            return seen
+
+        assert_that(outer(), equal_to([outer.__wrapped__] * 4))
+        assert_that(attempts, equal_to([1, 2]))
+
+    def test_invalid_options(self):
+        for options in ({'pool': True}, {'hedge': object()},
+                        {'cache': ResultCache()}):
+            assert_that(lambda: retry(on_error=IOError, resume='offset',
+                                      **options),
+                        raises(ValueError, 'resume could not be used'))
+
+    def test_adaptive_wait_hint(self):
+        class Throttled(IOError):
+            retry_after = 3
+
+        def source(offset=0):
+            for i in range(offset, 3):
+                if i == 1 and offset == 0:
+                    raise Throttled()
+                yield i
+
+        clock = VirtualClock()
+        f = retry(source, on_error=IOError, resume='offset', clock=clock,
+                  wait=Adaptive(backoff.Constant(0.5)))
+        assert_that(list(f()), equal_to([0, 1, 2]))
+        # the wait follows the hint of the error
+        assert_that(clock.now(), equal_to(3))